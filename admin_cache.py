@@ -0,0 +1,105 @@
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ('administrator', 'creator')
+
+
+class AdminCache:
+    """TTL cache of admin status per (chat, user).
+
+    A miss fetches the chat's whole admin list with get_chat_administrators,
+    which answers every later check in that chat until it expires. Chats
+    where that call fails (e.g. private chats) fall back to a per-user
+    get_chat_member lookup. chat_member updates keep cached entries current.
+    Both maps are bounded and evict the least recently used entry.
+    """
+
+    def __init__(self, ttl=300, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._chats = OrderedDict()    # chat_id -> (expires, set of admin user ids)
+        self._members = OrderedDict()  # (chat_id, user_id) -> (expires, is_admin)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _put(cache, key, value, limit):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _lookup(self, chat_id, user_id):
+        now = self.clock()
+        entry = self._chats.get(chat_id)
+        if entry is not None:
+            if entry[0] > now:
+                self._chats.move_to_end(chat_id)
+                return user_id in entry[1]
+            del self._chats[chat_id]
+
+        key = (chat_id, user_id)
+        entry = self._members.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._members.move_to_end(key)
+                return entry[1]
+            del self._members[key]
+        return None
+
+    async def warm(self, bot, chat_id):
+        """Cache a chat's full admin list in one request."""
+        chat_id = str(chat_id)
+        admins = await bot.get_chat_administrators(chat_id)
+        admin_ids = {str(member.user.id) for member in admins}
+        self._put(self._chats, chat_id, (self.clock() + self.ttl, admin_ids), self.max_entries)
+        return admin_ids
+
+    async def is_admin(self, bot, chat_id, user_id):
+        """Whether a user is an admin of a chat, asking Telegram only on a miss."""
+        chat_id, user_id = str(chat_id), str(user_id)
+        cached = self._lookup(chat_id, user_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        try:
+            return user_id in await self.warm(bot, chat_id)
+        except Exception as e:
+            logger.info(f"Could not list admins of {chat_id} ({e}), checking member instead")
+
+        chat_member = await bot.get_chat_member(chat_id, user_id)
+        is_admin = chat_member.status in ADMIN_STATUSES
+        self._put(
+            self._members, (chat_id, user_id), (self.clock() + self.ttl, is_admin), self.max_entries
+        )
+        return is_admin
+
+    def update_member(self, chat_id, user_id, status):
+        """Apply a chat_member update to any cached entries."""
+        chat_id, user_id = str(chat_id), str(user_id)
+        is_admin = status in ADMIN_STATUSES
+        entry = self._chats.get(chat_id)
+        if entry is not None:
+            if is_admin:
+                entry[1].add(user_id)
+            else:
+                entry[1].discard(user_id)
+        key = (chat_id, user_id)
+        if key in self._members:
+            self._members[key] = (self._members[key][0], is_admin)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "chats": len(self._chats),
+            "members": len(self._members),
+        }
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Cost of /export on a large chat: time, peak memory, output size, and what it
+does to the event loop while it runs.
+
+Builds one chat with N users (default 100k) plus three archived months in
+the JSON history store, then exports it:
+  inline   everything built in memory on the event loop, like dumping
+           export_chat() as JSON in the handler (the naive version)
+  csv      write_chat_export() in a worker thread, as /export runs it
+  jsonl    the same as JSON lines
+  csv.gz   the same gzipped (EXPORT_GZIP_ROWS exceeded)
+While each export runs, a task on the loop counts messages every 1 ms;
+the table shows the longest the loop went without running it and how many
+messages were counted meanwhile. Peak memory is measured with tracemalloc
+in a separate pass.
+
+Usage: python benchmarks/bench_export.py [users]   (default: 100000)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from engagement_store import EngagementStore
+from history_store import HistoryStore
+
+CHAT = "-1001234567890"
+MONTHS = ("2026-07", "2026-08", "2026-09")
+
+def build(users):
+    store = EngagementStore()
+    store.import_chat(CHAT, {
+        str(1000 + i): {"username": f"user{1000 + i}", "messages": i % 50, "reactions_given": i % 7,
+                        "reactions_received": i % 11, "total_points": i % 50 + i % 7 + i % 11}
+        for i in range(users)
+    })
+    bot.engagement_data = store
+    bot.history_store = HistoryStore(bot.HISTORY_DIR)
+    archived = store.export_chat(CHAT)
+    for month in MONTHS:
+        bot.history_store.archive_chat(month, CHAT, archived)
+    bot.history_store.save_index()
+
+def inline_export(directory):
+    """The naive export: the whole chat and its history built in memory on the loop."""
+    rows = []
+    for user_id, stats in bot.engagement_data.export_chat(CHAT).items():
+        rows.append(dict(stats, month=bot.data_month, user_id=user_id))
+    for month in MONTHS:
+        for user_id, stats in bot.history_store.load(month, CHAT).items():
+            rows.append(dict(stats, month=month, user_id=user_id))
+    data = '\n'.join(json.dumps(row) for row in rows).encode('utf-8')
+    path = os.path.join(directory, 'inline.jsonl')
+    with open(path, 'wb') as f:
+        f.write(data)
+    return [path], len(rows), 1 + len(MONTHS)
+
+async def run(name, directory):
+    stop = False
+    lag = 0.0
+    counted = 0
+
+    async def keep_counting():
+        nonlocal lag, counted
+        while not stop:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - start)
+            with bot.data_lock:
+                bot.engagement_data.increment(CHAT, "1", "messages", "busy")
+            counted += 1
+
+    counter = asyncio.create_task(keep_counting())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    if name == "inline":
+        paths, rows, _ = inline_export(directory)
+    else:
+        format = name.split('.')[0]
+        bot.EXPORT_GZIP_ROWS = 0 if name.endswith('.gz') else 10 ** 12
+        paths, rows, _ = await asyncio.to_thread(bot.write_chat_export, CHAT, format, directory)
+    elapsed = time.perf_counter() - start
+    stop = True
+    await counter
+    size = sum(os.path.getsize(path) for path in paths)
+    return elapsed, rows, size, len(paths), lag, counted
+
+def peak_memory(name, directory):
+    tracemalloc.start()
+    try:
+        asyncio.run(run(name, directory))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            build(users)
+            print(f"\n📊 /export of a chat with {users} users and {len(MONTHS)} archived months")
+            print(f"   {'mode':<8}{'rows':>9}{'seconds':>9}{'MB out':>8}{'files':>6}"
+                  f"{'peak MB':>9}{'max loop gap ms':>17}{'counted':>9}")
+            for name in ("inline", "csv", "jsonl", "csv.gz"):
+                with tempfile.TemporaryDirectory() as out:
+                    elapsed, rows, size, files, lag, counted = asyncio.run(run(name, out))
+                with tempfile.TemporaryDirectory() as out:
+                    peak = peak_memory(name, out)
+                print(f"   {name:<8}{rows:>9}{elapsed:>9.2f}{size / 1e6:>8.1f}{files:>6}"
+                      f"{peak / 1e6:>9.1f}{lag * 1000:>17.1f}{counted:>9}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark the update handlers in-process with a synthetic workload.
+
+Builds telegram.Update objects from benchmarks/loadgen.py (messages,
+reactions and /stats, /rank, /statsadmin commands over Zipf-distributed
+chats and users) and queues them on an Application that has the bot's
+real handlers registered and a FakeRequest instead of HTTP, with the
+persistence worker running as in production. Reports:
+  - throughput in updates/sec
+  - p50/p99 latency of every handler callback
+  - RSS growth over the run
+  - persistence cost: event log flushes during the run and a full snapshot
+
+Results are compared with benchmarks/baselines/bench_handlers.json; a
+throughput drop or p99 increase beyond --tolerance (and --slack-ms) counts
+as a regression and makes the script exit with status 1. Baselines are
+machine specific: record them with --save on the machine that runs the
+comparison.
+
+Usage: python benchmarks/bench_handlers.py [--updates N] [--chats N] [--users N] [--save]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from admin_cache import AdminCache
+from engagement_store import EngagementStore
+from eventlog import EventLog
+from fake_telegram import FakeBotAPI, FakeRequest
+from leaderboard import LeaderboardIndex
+from loadgen import Workload
+from persistence import PersistenceWorker
+from sender_index import SenderIndex
+from windows import WindowCounters
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'bench_handlers.json')
+
+def rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+def reset_bot_state():
+    """Fresh module state in the current directory, as after a first start."""
+    bot.engagement_data = EngagementStore()
+    bot.leaderboards = LeaderboardIndex()
+    bot.window_counters = WindowCounters()
+    bot.message_senders = SenderIndex(bot.SENDER_INDEX_DIR, bot.SENDER_INDEX_SLOTS,
+                                      bot.SENDER_INDEX_MEMORY_MB * 1024 * 1024)
+    bot.admin_cache = AdminCache(bot.ADMIN_CACHE_TTL, bot.ADMIN_CACHE_SIZE)
+    bot.event_log = EventLog(bot.EVENT_LOG_FILE, bot.COMPACT_INTERVAL, bot.COMPACT_MAX_EVENTS)
+    bot.persistence = PersistenceWorker(
+        bot.collect_pending, bot.write_pending, bot.SAVE_INTERVAL, bot.SAVE_MAX_PENDING
+    )
+
+def time_handlers(app, latencies, done):
+    """Wrap every registered handler callback to record its latency."""
+    for handler in app.handlers[0]:
+        callback = handler.callback
+        samples = latencies.setdefault(callback.__name__, [])
+
+        async def timed(update, context, callback=callback, samples=samples):
+            start = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                samples.append(time.perf_counter() - start)
+                done[0] += 1
+
+        handler.callback = timed
+
+async def run(workload, count):
+    reset_bot_state()
+    api = FakeBotAPI(admins=workload.admins)
+    app = Application.builder().token('123456:BENCHMARK').request(FakeRequest(api)).build()
+    bot.add_handlers(app)
+    latencies, done = {}, [0]
+    time_handlers(app, latencies, done)
+    await app.initialize()
+
+    updates = [Update.de_json(data, app.bot) for _, data in workload.generate(count)]
+    rss_before = rss_mb()
+    bot.persistence.start()
+
+    await app.start()
+
+    start = time.perf_counter()
+    for update in updates:
+        app.update_queue.put_nowait(update)
+    while done[0] < count:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    bot.persistence.stop()
+    flushes = dict(bot.persistence.stats)
+    bot.event_log.force_compaction()
+    bot.persistence.flush(force=True)
+    snapshot = dict(bot.persistence.stats)
+    rss_after = rss_mb()
+    await app.stop()
+    await app.shutdown()
+
+    return {
+        "updates": count,
+        "throughput": count / elapsed,
+        "handlers": {
+            name: {"calls": len(samples), "p50_ms": percentile(samples, 0.5) * 1000,
+                   "p99_ms": percentile(samples, 0.99) * 1000}
+            for name, samples in sorted(latencies.items()) if samples
+        },
+        "rss_growth_mb": rss_after - rss_before,
+        "persistence": {
+            "flushes": flushes["flushes"],
+            "flush_ms": flushes["total_duration"] * 1000,
+            "flush_bytes": flushes["total_bytes"],
+            "snapshot_ms": snapshot["last_duration"] * 1000,
+            "snapshot_bytes": snapshot["last_bytes"],
+        },
+        "replies": api.calls.get("sendMessage", 0),
+    }
+
+def report(result):
+    print(f"throughput: {result['throughput']:.0f} updates/s over {result['updates']} updates "
+          f"({result['replies']} replies sent)")
+    print(f"{'handler':>18} {'calls':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, stats in result["handlers"].items():
+        print(f"{name:>18} {stats['calls']:>7} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+    persistence = result["persistence"]
+    print(f"RSS growth: {result['rss_growth_mb']:.1f} MB")
+    print(f"persistence: {persistence['flushes']} flushes, {persistence['flush_ms']:.0f} ms, "
+          f"{persistence['flush_bytes'] / 1024:.0f} KB; snapshot {persistence['snapshot_ms']:.1f} ms, "
+          f"{persistence['snapshot_bytes'] / 1024:.0f} KB")
+
+def compare(result, baseline, tolerance, slack_ms):
+    """Regressions of result against a baseline, as readable strings.
+
+    Sub-millisecond p99s jitter a lot between runs, so a latency only counts
+    as regressed when it is also slack_ms above the baseline.
+    """
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput']:.0f}/s vs {baseline['throughput']:.0f}/s")
+    for name, stats in result["handlers"].items():
+        base = baseline["handlers"].get(name)
+        if base and stats["p99_ms"] > max(base["p99_ms"] * (1 + tolerance), base["p99_ms"] + slack_ms):
+            regressions.append(f"{name} p99 {stats['p99_ms']:.3f} ms vs {base['p99_ms']:.3f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--updates', type=int, default=50000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--slack-ms', type=float, default=1.0)
+    parser.add_argument('--save', action='store_true', help="record the result as the new baseline")
+    args = parser.parse_args()
+
+    name = f"{args.updates}u-{args.chats}c-{args.users}p"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        # Handlers log every update; send it to a file like systemd does
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        logging.basicConfig(filename='bot.log', level=logging.INFO,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        try:
+            result = asyncio.run(run(Workload(args.chats, args.users, seed=args.seed), args.updates))
+        finally:
+            os.chdir(cwd)
+    report(result)
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+    if args.save:
+        baselines[name] = result
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline '{name}' to {BASELINE_FILE}")
+    elif name in baselines:
+        regressions = compare(result, baselines[name], args.tolerance, args.slack_ms)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against baseline '{name}'")
+
+if __name__ == "__main__":
+    main()
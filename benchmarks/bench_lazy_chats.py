@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Startup time and resident memory against the number of chats ever seen and
+the number of active ones, loading every chat at startup (the single
+snapshot of older versions) against loading chats on first use.
+
+For each total of chats N (100 users each) a data directory is built both
+ways: one engagement_data.snap with every chat, and one file per chat in
+chats/. In both, the event log holds changes to A chats, the ones active
+since the last compaction. A fresh process then runs bot.load_state() and
+reports how long it took and how much its RSS grew. Then A other chats
+become active: a message is counted in each, loading it as the bot does on
+a chat's first update, and the time per chat and the RSS are reported
+again. RSS is read from /proc, relative to the process right after
+importing bot.
+
+Usage: python benchmarks/bench_lazy_chats.py [chats...]   (default: 1000 10000)
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_files import ChatFiles
+from engagement_store import EngagementStore
+from eventlog import EventLog
+from snapshot import write_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERS = 100
+ACTIVE = (10, 100, 1000)
+
+CHILD = r'''
+import os, sys, time
+sys.path.insert(0, sys.argv[1])
+os.chdir(sys.argv[2])
+active = int(sys.argv[3])
+
+def rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+import bot
+base = rss()
+start = time.perf_counter()
+bot.load_state()
+startup = time.perf_counter() - start
+after_startup = rss() - base
+loaded = len(bot.engagement_data)
+start = time.perf_counter()
+for chat in range(active, 2 * active):
+    chat_id = str(-1000000000000 - chat)
+    bot.load_chat(chat_id)
+    with bot.data_lock:
+        bot.engagement_data.increment(chat_id, "1", "messages", "user1")
+        bot.record_change("message", chat_id, "1")
+first_use = (time.perf_counter() - start) / active
+print(startup, after_startup, loaded, first_use, rss() - base, len(bot.engagement_data))
+'''
+
+def chat_id(chat):
+    return str(-1000000000000 - chat)
+
+def build_chat(chat):
+    store = EngagementStore()
+    for user in range(USERS):
+        user_id = str(1000 + (chat * 37 + user * 7919) % 1000000)
+        store.set_counters(chat_id(chat), user_id, [user, 0, 0, user], f"user{user_id}")
+    return store
+
+def build(directory, chats):
+    """Both layouts of the same data, in directory/eager and directory/lazy."""
+    eager, lazy = os.path.join(directory, 'eager'), os.path.join(directory, 'lazy')
+    files = ChatFiles(os.path.join(lazy, 'chats'))
+    everything = EngagementStore()
+    for chat in range(chats):
+        store = build_chat(chat)
+        files.write(chat_id(chat), store)
+        everything.add_chat(chat_id(chat), store.copy())
+    os.makedirs(eager)
+    write_snapshot(os.path.join(eager, 'engagement_data.snap'), everything)
+    return eager, lazy
+
+def write_log(path, active):
+    """Events for the first `active` chats, as logged since the last compaction."""
+    if os.path.exists(path):
+        os.remove(path)
+    EventLog(path).write([
+        {"e": "message", "c": chat_id(chat), "u": "1", "n": "user1", "m": "2026-10", "v": [1, 0, 0, 1]}
+        for chat in range(active)
+    ])
+
+def measure(directory, active):
+    env = dict(os.environ, LOG_LEVEL='WARNING', LOG_FORMAT='text')
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, ROOT, directory, str(active)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    startup, after_startup, loaded, first_use, after_use, resident = output
+    return (float(startup), int(after_startup), int(loaded), float(first_use), int(after_use), int(resident))
+
+def main():
+    totals = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    print(f"\n📊 Startup and memory by chats ever seen (N, {USERS} users each) and active chats (A)")
+    print(f"   {'N':>6}{'A':>6}  {'mode':<6}{'startup ms':>11}{'loaded':>8}{'RSS MB':>8}"
+          f"{'ms per chat':>13}{'in memory':>11}{'RSS MB':>8}")
+    for chats in totals:
+        with tempfile.TemporaryDirectory() as directory:
+            layouts = build(directory, chats)
+            for active in ACTIVE:
+                if 2 * active > chats:
+                    continue
+                for name, path in zip(("eager", "lazy"), layouts):
+                    write_log(os.path.join(path, 'engagement_events.log'), active)
+                    startup, after_startup, loaded, first_use, after_use, resident = measure(path, active)
+                    print(f"   {chats:>6}{active:>6}  {name:<6}{startup * 1000:>11.1f}{loaded:>8}"
+                          f"{after_startup / 1e6:>8.1f}{first_use * 1000:>13.2f}{resident:>11}"
+                          f"{after_use / 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    main()
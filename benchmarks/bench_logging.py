@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+What logging adds to handler latency: the old synchronous setup against the
+queued, sampled pipeline in log_pipeline.py.
+
+Runs track_message and track_reaction directly over a message/reaction
+stream from loadgen.py, with logs going to a file like systemd's
+StandardOutput=append, under:
+  off       INFO disabled, the floor
+  sync      basicConfig's StreamHandler to the file, formatted and written
+            by the handler itself (the setup before the pipeline)
+  pipeline  LogPipeline with JSON output and the default LOG_SAMPLE_RATES
+  unsampled LogPipeline writing every line
+
+A second table times only the log statements of one message and one
+reaction: the old eager f-string calls (one line per message, four per
+reaction) through the synchronous handler, against the current lazy calls
+through the pipeline.
+
+Usage: python benchmarks/bench_logging.py [updates]   (default: 50000)
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+import bot
+from bench_handlers import percentile, reset_bot_state
+from log_pipeline import TEXT_FORMAT, LogPipeline, parse_sample_rates, sample
+from loadgen import Workload
+
+MIX = {"message": 0.83, "reaction": 0.17}
+
+def configure(name, log_file):
+    """Point the root logger at log_file the way `name` does; returns a pipeline to stop, if any."""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if name == "off":
+        logging.basicConfig(stream=log_file, level=logging.WARNING, format=TEXT_FORMAT)
+    elif name == "sync":
+        logging.basicConfig(stream=log_file, level=logging.INFO, format=TEXT_FORMAT)
+    else:
+        rates = parse_sample_rates(bot.LOG_SAMPLE_RATES) if name == "pipeline" else {}
+        return LogPipeline(logging.INFO, sample_rates=rates, stream=log_file).start()
+    return None
+
+async def run_handlers(updates):
+    reset_bot_state()
+    latencies = {"track_message": [], "track_reaction": []}
+    for update in updates:
+        handler = bot.track_message if update.message else bot.track_reaction
+        start = time.perf_counter()
+        await handler(update, None)
+        latencies[handler.__name__].append(time.perf_counter() - start)
+    return latencies
+
+def old_statements(username, chat_id):
+    """The log calls a message and a reaction made before the pipeline."""
+    logger = bot.logger
+    logger.info(f"📝 Message from {username}")
+    logger.info(f"Processing reaction from {username} in chat {chat_id}")
+    logger.info(f"Credited reaction to {username}")
+    logger.info("Reaction processed")
+    logger.info(f"💾 Data saved: {1} changes, {120} bytes in {0.4:.1f} ms")
+
+def new_statements(username, chat_id):
+    logger = bot.logger
+    extra = sample("message")
+    if extra:
+        logger.info("📝 Message from %s in chat %s", username, chat_id, extra=extra)
+    extra = sample("reaction")
+    if extra:
+        logger.info("👍 Reaction from %s in chat %s, credited to %s", username, chat_id, 42, extra=extra)
+    extra = sample("save")
+    if extra:
+        logger.info("💾 Data saved: %d changes, %d bytes in %.1f ms", 1, 120, 0.4, extra=extra)
+
+def time_statements(statements, count):
+    start = time.perf_counter()
+    for i in range(count):
+        statements(f"user{i % 1000}", -1001234567890)
+    return (time.perf_counter() - start) / count
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    workload = Workload(200, 20000, mix=MIX)
+    updates = [Update.de_json(data, None) for _, data in workload.generate(count)]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            print(f"\n📊 {count} updates, handler latency in µs")
+            print(f"   {'setup':<10}{'msg p50':>9}{'msg p99':>9}{'react p50':>11}{'react p99':>11}{'log MB':>8}")
+            for name in ("off", "sync", "pipeline", "unsampled"):
+                with open(f'{name}.log', 'a') as log_file:
+                    pipeline = configure(name, log_file)
+                    latencies = asyncio.run(run_handlers(updates))
+                    if pipeline is not None:
+                        pipeline.stop()
+                bot.message_senders.close()
+                cells = [
+                    percentile(latencies[handler], q) * 1e6
+                    for handler in ("track_message", "track_reaction") for q in (0.5, 0.99)
+                ]
+                size = os.path.getsize(f'{name}.log') / 1024 / 1024
+                print(f"   {name:<10}{cells[0]:>9.1f}{cells[1]:>9.1f}{cells[2]:>11.1f}{cells[3]:>11.1f}{size:>8.1f}")
+
+            print("\n   log statements of one message + one reaction + one save, µs")
+            with open('statements.log', 'a') as log_file:
+                configure("sync", log_file)
+                before = time_statements(old_statements, count)
+                pipeline = configure("pipeline", log_file)
+                after = time_statements(new_statements, count)
+                pipeline.stop()
+            print(f"   before (eager, sync)      {before * 1e6:>8.1f}")
+            print(f"   after (lazy, queued)      {after * 1e6:>8.1f}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
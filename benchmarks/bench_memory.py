@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Memory per user of the engagement counters: the old dict of dicts against EngagementStore.
+
+Builds the same rows both ways, a quarter of the users being members of
+several chats, and measures the memory each layout holds with tracemalloc,
+plus the time to export the store to the JSON format and to build it back.
+
+Usage: python benchmarks/bench_memory.py [rows...]   (default: 100000 1000000)
+"""
+
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engagement_store import EngagementStore
+
+CHATS = 50
+
+def make_rows(rows, seed=1):
+    """(chat_id, user_id, username, values) tuples over skewed chat sizes."""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(CHATS)]
+    population = int(rows * 0.8)
+    seen = set()
+    result = []
+    while len(result) < rows:
+        chat_id = str(-1000000000000 - rng.choices(range(CHATS), weights)[0])
+        user = rng.randrange(population) if rng.random() < 0.25 else len(result)
+        if (chat_id, user) in seen:
+            continue
+        seen.add((chat_id, user))
+        messages = int(rng.paretovariate(1.2))
+        given = int(rng.paretovariate(1.5))
+        received = int(rng.paretovariate(1.5))
+        result.append((chat_id, str(100000000 + user), f"user{user}",
+                       [messages, given, received, messages + given + received]))
+    return result
+
+def build_dicts(rows):
+    """The layout before EngagementStore, as the handlers used to build it."""
+    data = {}
+    for chat_id, user_id, username, (messages, given, received, total) in rows:
+        # Ids and names arrive as fresh strings from each update
+        data.setdefault(chat_id, {})[''.join(user_id)] = {
+            "username": ''.join(username),
+            "messages": messages,
+            "reactions_given": given,
+            "reactions_received": received,
+            "total_points": total
+        }
+    return data
+
+def build_store(rows):
+    store = EngagementStore()
+    for chat_id, user_id, username, values in rows:
+        store.set_counters(chat_id, user_id, values, ''.join(username))
+    return store
+
+def measure(build, rows):
+    """Bytes held by what build(rows) returns, and the object itself."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(rows)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held, result
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def run(count):
+    rows = make_rows(count)
+    users = len({user_id for _, user_id, _, _ in rows})
+    dict_bytes, data = measure(build_dicts, rows)
+    del data
+    store_bytes, store = measure(build_store, rows)
+
+    export_time, exported = timed(store.export)
+    dump_time, payload = timed(lambda: json.dumps(exported, separators=(',', ':')))
+    import_time, _ = timed(EngagementStore.from_dict, json.loads(payload))
+
+    print(f"\n📊 {count} rows ({users} users in {len(store)} chats)")
+    print(f"   dict of dicts:   {dict_bytes / 1024 / 1024:8.1f} MB  {dict_bytes / count:6.0f} B/row")
+    print(f"   EngagementStore: {store_bytes / 1024 / 1024:8.1f} MB  {store_bytes / count:6.0f} B/row "
+          f"({dict_bytes / store_bytes:.1f}x smaller)")
+    print(f"   export {export_time * 1000:.0f} ms + json.dumps {dump_time * 1000:.0f} ms, "
+          f"from_dict {import_time * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]:
+        run(count)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Cost of counting reactions in each REACTION_MODE, on the traffic Telegram
+actually sends for it.
+
+The same R reactions land on M posts, Zipf-distributed so a few posts get
+most of them, each new one from a different user; one in ten instead
+changes the latest earlier reaction to the post and one in ten removes it.
+
+In a group the posts are messages the bot sees and every reaction is a
+per-user message_reaction update. That stream goes through `user` and
+`both` mode, which must credit the same reactions: Telegram sends no
+totals for group messages, so `both` costs only the recording of the
+per-user credits beside each author.
+
+In a channel reactions are anonymous: Telegram groups them and sends
+their totals with a delay, so every window of W reactions becomes one
+message_reaction_count update per post reacted to in the window. The
+posts themselves are channel_post updates, which the bot doesn't ask for,
+and have no user behind them, so `count` mode finds no author for any
+total and credits nothing; its row is the cost of ignoring that traffic.
+
+Each stream goes through an Application with the bot's handlers; the
+report gives the updates processed, the time spent in
+Application.process_update per update and per reaction, the events the
+changes add to the event log and the reactions credited to authors.
+Building the Update objects is not timed.
+
+Usage: python benchmarks/bench_reactions.py [--reactions R] [--messages M] [--window W]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from chat_files import ResidentChats
+from engagement_store import EngagementStore
+from eventlog import EventLog
+from fake_telegram import FakeBotAPI, FakeRequest, message_update, reaction_count_update, reaction_update
+from leaderboard import LeaderboardIndex
+from persistence import PersistenceWorker
+from sender_index import SenderIndex
+from windows import WindowCounters
+
+CHAT_ID = -1000000000001
+AUTHORS = 200
+EMOJI = ("👍", "❤", "🔥", "🎉", "😁")
+
+def reactions(count, messages, seed=1):
+    """(message_id, user_id, new emoji, old emoji) of each reaction, and the message totals after it."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(messages)]
+    totals = [0] * messages
+    reacted = [{} for _ in range(messages)]  # Per message, user -> emoji
+    stream = []
+    for user, message in enumerate(rng.choices(range(messages), weights, k=count)):
+        mine = reacted[message]
+        choice = rng.random()
+        if mine and choice < 0.2:
+            earlier = next(reversed(mine))
+            old = mine.pop(earlier)
+            if choice < 0.1:
+                mine[earlier] = rng.choice([e for e in EMOJI if e != old])
+                stream.append((message + 1, earlier, (mine[earlier],), (old,)))
+            else:
+                stream.append((message + 1, earlier, (), (old,)))
+                totals[message] -= 1
+        else:
+            mine[100000 + user] = rng.choice(EMOJI)
+            stream.append((message + 1, 100000 + user, (mine[100000 + user],), ()))
+            totals[message] += 1
+        stream[-1] += (totals[message],)
+    return stream
+
+def user_updates(stream, first_id):
+    return [
+        reaction_update(first_id + i, CHAT_ID, user, message, new, old)
+        for i, (message, user, new, old, _) in enumerate(stream)
+    ]
+
+def count_updates(stream, first_id, window):
+    """One update per channel post and window, with its total at the end of the window."""
+    updates = []
+    for start in range(0, len(stream), window):
+        totals = {}
+        for message, _, _, _, total in stream[start:start + window]:
+            totals[message] = total
+        for message, total in totals.items():
+            updates.append(reaction_count_update(
+                first_id + len(updates), CHAT_ID, message, {"👍": total}, chat_type="channel"
+            ))
+    return updates
+
+def reset_bot_state(mode):
+    bot.REACTION_MODE = mode
+    bot.engagement_data = EngagementStore()
+    bot.leaderboards = LeaderboardIndex()
+    bot.window_counters = WindowCounters()
+    bot.message_senders = SenderIndex(bot.SENDER_INDEX_DIR, bot.SENDER_INDEX_SLOTS,
+                                      bot.SENDER_INDEX_MEMORY_MB * 1024 * 1024)
+    bot.event_log = EventLog(bot.EVENT_LOG_FILE)
+    bot.persistence = PersistenceWorker(bot.collect_pending, bot.write_pending)
+    bot.resident_chats = ResidentChats()
+    bot.dirty_chats.clear()
+
+async def run(mode, messages, updates):
+    """Seconds to process the updates, events logged and reactions credited.
+
+    The posts are sent first as group messages, except in count mode,
+    where they are channel posts the bot never receives.
+    """
+    reset_bot_state(mode)
+    app = Application.builder().token('123456:BENCHMARK').request(FakeRequest(FakeBotAPI())).build()
+    bot.add_handlers(app)
+    async with app:
+        for message in range(messages if mode != "count" else 0):
+            await app.process_update(Update.de_json(
+                message_update(message + 1, CHAT_ID, 1000 + message % AUTHORS, message + 1, "hello"), app.bot
+            ))
+        bot.event_log.drain()
+        updates = [Update.de_json(update, app.bot) for update in updates]
+        start = time.perf_counter()
+        for update in updates:
+            await app.process_update(update)
+        elapsed = time.perf_counter() - start
+    events = len(bot.event_log.drain())
+    received = sum(stats["reactions_received"] for stats in bot.engagement_data.export_chat(str(CHAT_ID)).values())
+    bot.message_senders.close()
+    return elapsed, events, received
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--reactions", type=int, default=50000)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--window", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    stream = reactions(args.reactions, args.messages)
+    group = user_updates(stream, args.messages + 1)
+    modes = {
+        ("group", "user"): group,
+        ("group", "both"): group,
+        ("channel", "count"): count_updates(stream, args.messages + 1, args.window),
+    }
+    print(f"\n📊 {args.reactions} reactions to {args.messages} posts, channel totals every {args.window} reactions")
+    print(f"   {'chat':<9}{'mode':<6}{'updates':>9}{'total ms':>10}{'µs/update':>11}{'µs/reaction':>13}"
+          f"{'log events':>12}{'received':>10}")
+    cwd = os.getcwd()
+    for (chat, mode), updates in modes.items():
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                elapsed, events, received = asyncio.run(run(mode, args.messages, updates))
+            finally:
+                os.chdir(cwd)
+        print(f"   {chat:<9}{mode:<6}{len(updates):>9}{elapsed * 1000:>10.0f}{elapsed / len(updates) * 1e6:>11.1f}"
+              f"{elapsed / args.reactions * 1e6:>13.1f}{events:>12}{received:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Throughput of the per-chat update scheduler against serial processing.
+
+Runs the same loadgen.py stream (messages, reactions and commands over
+Zipf-distributed chats) through an Application with the bot's real
+handlers twice: once processing updates one at a time, and once with a
+ChatUpdateProcessor of --workers lanes, as build_application() sets up.
+Every Bot API call (the command replies) waits --latency seconds like a
+network round-trip, which is what the scheduler overlaps. Reports
+updates/sec of both and the speedup.
+
+Results are compared with benchmarks/baselines/bench_scheduler.json; a
+drop in either throughput or in the speedup beyond --tolerance counts as
+a regression and makes the script exit with status 1. Record baselines
+with --save on the machine that runs the comparison.
+
+Usage: python benchmarks/bench_scheduler.py [--updates N] [--chats N] [--workers N] [--save]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from admin_cache import AdminCache
+from chat_files import ResidentChats
+from engagement_store import EngagementStore
+from eventlog import EventLog
+from fake_telegram import FakeBotAPI, FakeRequest
+from leaderboard import LeaderboardIndex
+from loadgen import Workload
+from persistence import PersistenceWorker
+from sender_index import SenderIndex
+from update_scheduler import ChatUpdateProcessor
+from windows import WindowCounters
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'bench_scheduler.json')
+
+def reset_bot_state():
+    """Fresh module state in the current directory, as after a first start."""
+    bot.engagement_data = EngagementStore()
+    bot.leaderboards = LeaderboardIndex()
+    bot.window_counters = WindowCounters()
+    bot.message_senders = SenderIndex(bot.SENDER_INDEX_DIR, bot.SENDER_INDEX_SLOTS,
+                                      bot.SENDER_INDEX_MEMORY_MB * 1024 * 1024)
+    bot.admin_cache = AdminCache(bot.ADMIN_CACHE_TTL, bot.ADMIN_CACHE_SIZE)
+    bot.event_log = EventLog(bot.EVENT_LOG_FILE)
+    bot.persistence = PersistenceWorker(bot.collect_pending, bot.write_pending)
+    bot.resident_chats = ResidentChats()
+    bot.dirty_chats.clear()
+    bot.recent_update_ids.clear()
+    bot.set_resume_offset(0)
+
+def run(workload, updates, latency, processor=None):
+    """Seconds to process the updates, from the first put to the last handler."""
+    reset_bot_state()
+    builder = Application.builder().token('123456:BENCHMARK').request(
+        FakeRequest(FakeBotAPI(admins=workload.admins), latency)
+    )
+    if processor is not None:
+        builder.concurrent_updates(processor)
+    app = builder.build()
+    bot.add_handlers(app)
+    bot.add_update_tracking(app)
+
+    async def process():
+        await app.initialize()
+        await app.start()
+        parsed = [Update.de_json(update, app.bot) for update in updates]
+        start = time.perf_counter()
+        for update in parsed:
+            await app.update_queue.put(update)
+        await app.stop()
+        elapsed = time.perf_counter() - start
+        await bot.post_stop(app)
+        await app.shutdown()
+        return elapsed
+
+    elapsed = asyncio.run(process())
+    bot.message_senders.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=bot.MAX_CONCURRENT_UPDATES)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save', action='store_true', help="record the result as the new baseline")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    workload = Workload(args.chats, args.users, seed=args.seed)
+    updates = [update for _, update in workload.generate(args.updates)]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            serial = run(workload, updates, args.latency)
+            parallel = run(workload, updates, args.latency,
+                           ChatUpdateProcessor(args.workers, bot.MAX_PENDING_UPDATES))
+        finally:
+            os.chdir(cwd)
+    result = {
+        "serial": args.updates / serial,
+        "scheduler": args.updates / parallel,
+        "speedup": serial / parallel,
+    }
+    print(f"\n📊 {args.updates} updates over {args.chats} chats, {args.latency * 1000:.0f} ms per Bot API call")
+    print(f"   serial:                {result['serial']:>8.0f} updates/s")
+    print(f"   scheduler, {args.workers:>2} lanes:   {result['scheduler']:>8.0f} updates/s "
+          f"({result['speedup']:.1f}x)")
+
+    name = f"{args.updates}u-{args.chats}c-{args.workers}w-{args.latency * 1000:g}ms"
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+    if args.save:
+        baselines[name] = result
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline '{name}' to {BASELINE_FILE}")
+    elif name in baselines:
+        regressions = [
+            f"{key} {result[key]:.1f} vs {baseline:.1f}"
+            for key, baseline in baselines[name].items() if result[key] < baseline * (1 - args.tolerance)
+        ]
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against baseline '{name}'")
+
+if __name__ == "__main__":
+    main()
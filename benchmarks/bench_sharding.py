@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Updates/sec of bot.py with SHARDS=1 (one process, as before) against 2 and 4
+shard workers behind the routing front, end to end against the fake Bot API.
+
+Each run starts an unmodified bot.py in a temporary directory, pushes a
+message/reaction stream from loadgen.py over many chats, then a /stats in
+every chat, and measures until the last reply arrives. The CPU time of every
+process is read from /proc before it exits, showing how the work is split:
+with enough cores the workers run in parallel and throughput follows the
+busiest worker; on a single core the total stays flat.
+
+Usage: python benchmarks/bench_sharding.py [updates] [shards...]   (default: 20000 1 2 4)
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import FakeBotAPI, FakeTelegramServer, message_update
+from loadgen import Workload
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot.py')
+CHATS = 200
+MIX = {"message": 0.83, "reaction": 0.17}  # No commands, so the only replies are the closing /stats
+TICKS = os.sysconf('SC_CLK_TCK')
+
+def cpu_seconds(pid):
+    """User + system CPU time of a running process."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICKS
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+def run(shards, updates):
+    server = FakeTelegramServer(FakeBotAPI()).start()
+    api = server.api
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ, TELEGRAM_BOT_TOKEN='123456:BENCHMARK', BOT_API_BASE_URL=server.url,
+            SHARDS=str(shards), METRICS_PORT='0', LOG_LEVEL='WARNING',
+        )
+        with open(os.path.join(directory, 'bot.log'), 'w') as log:
+            process = subprocess.Popen(
+                [sys.executable, BOT_SCRIPT], cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+        try:
+            if not api.wait_until(lambda api: api.calls.get('getUpdates', 0) > 0, 60):
+                raise RuntimeError(f"bot did not start, see {log.name}")
+            pids = [process.pid] + (children(process.pid) if shards > 1 else [])
+            before = [cpu_seconds(pid) for pid in pids]
+
+            start = time.perf_counter()
+            for _, update in Workload(CHATS, 20000, mix=MIX, seed=1).generate(updates):
+                api.push_update(update)
+            for chat in range(CHATS):
+                api.push_update(message_update(0, -1000000000000 - chat, 1, 10 ** 9, '/stats'))
+            if not api.wait_until(lambda api: len(api.sent) >= CHATS, 300):
+                raise RuntimeError(f"missing /stats replies, see {log.name}")
+            elapsed = time.perf_counter() - start
+            cpu = [cpu_seconds(pid) - used for pid, used in zip(pids, before)]
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            server.stop()
+    return (updates + CHATS) / elapsed, cpu
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    print(f"{updates} updates over {CHATS} chats + a /stats per chat, {os.cpu_count()} CPUs")
+    print(f"{'shards':>7} {'updates/s':>10} {'front cpu s':>12}  worker cpu s")
+    for shards in counts:
+        rate, cpu = run(shards, updates)
+        if shards == 1:
+            front, workers = 0.0, cpu
+        else:
+            front, workers = cpu[0], cpu[1:]
+        print(f"{shards:>7} {rate:>10.0f} {front:>12.2f}  {' '.join(f'{seconds:.2f}' for seconds in workers)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Full save and cold load of the engagement snapshot: binary format against JSON.
+
+Save is what a compaction costs (the copy taken under the data lock, then
+the write with fsync); load is what startup costs before replaying the log.
+The JSON numbers are the old path: export to dicts, json.dumps, and
+json.load plus EngagementStore.from_dict.
+
+Usage: python benchmarks/bench_snapshot.py [rows...]   (default: 100000 1000000)
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_memory import build_store, make_rows
+from engagement_store import EngagementStore
+from persistence import atomic_write
+from snapshot import read_snapshot, write_snapshot
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+def drop_page_cache(path):
+    """Best effort at making the next read come from disk."""
+    if hasattr(os, 'posix_fadvise'):
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def bench_binary(store, directory):
+    path = os.path.join(directory, 'engagement_data.snap')
+    copy_ms, snapshot = timed(store.copy)
+    write_ms, _ = timed(write_snapshot, path, snapshot)
+    drop_page_cache(path)
+    load_ms, loaded = timed(read_snapshot, path)
+    assert loaded.user_count() == store.user_count()
+    return copy_ms, write_ms, load_ms, os.path.getsize(path)
+
+def bench_json(store, directory):
+    path = os.path.join(directory, 'engagement_data.json')
+    copy_ms, snapshot = timed(store.export)
+    write_ms, _ = timed(
+        lambda: atomic_write(path, json.dumps(snapshot, separators=(',', ':')).encode('utf-8'))
+    )
+
+    def load():
+        with open(path, 'r') as f:
+            return EngagementStore.from_dict(json.load(f))
+
+    drop_page_cache(path)
+    load_ms, loaded = timed(load)
+    assert loaded.user_count() == store.user_count()
+    return copy_ms, write_ms, load_ms, os.path.getsize(path)
+
+def run(count):
+    store = build_store(make_rows(count))
+    print(f"\n📊 {count} rows in {len(store)} chats")
+    print(f"   {'format':<8}{'copy ms':>10}{'write ms':>10}{'load ms':>10}{'size MB':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, bench in (("binary", bench_binary), ("json", bench_json)):
+            copy_ms, write_ms, load_ms, size = bench(store, directory)
+            print(f"   {name:<8}{copy_ms:>10.1f}{write_ms:>10.1f}{load_ms:>10.1f}{size / 1024 / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]:
+        run(count)
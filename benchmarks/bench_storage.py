@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Compare the JSON and SQLite storage paths at different dataset sizes.
+
+For each size it measures a full save and load, a top-10 leaderboard for the
+largest chat, and (SQLite only) a batched upsert of 1000 changed rows, which
+is what a persistence flush costs in steady state.
+
+Usage: python benchmarks/bench_storage.py [sizes...]   (default: 10000 100000 1000000)
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_storage import SQLiteStorage
+
+CHATS = 50
+MONTH = '2026-10'
+
+def make_data(users, seed=1):
+    """Build {chat_id: {user_id: stats}} with a skewed chat size distribution."""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(CHATS)]
+    data = {}
+    for user in range(users):
+        chat_id = str(-1000000000000 - rng.choices(range(CHATS), weights)[0])
+        messages = int(rng.paretovariate(1.2))
+        given = int(rng.paretovariate(1.5))
+        received = int(rng.paretovariate(1.5))
+        data.setdefault(chat_id, {})[str(100000000 + user)] = {
+            "username": f"user{user}",
+            "messages": messages,
+            "reactions_given": given,
+            "reactions_received": received,
+            "total_points": messages + given + received
+        }
+    return data
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def bench_json(data, directory):
+    path = os.path.join(directory, 'engagement_data.json')
+    largest = max(data, key=lambda c: len(data[c]))
+
+    def save():
+        with open(path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load():
+        with open(path) as f:
+            return json.load(f)
+
+    def top():
+        return sorted(data[largest].items(), key=lambda x: x[1]["total_points"], reverse=True)[:10]
+
+    save_time, _ = timed(save)
+    load_time, _ = timed(load)
+    top_time, _ = timed(top)
+    return {
+        "save": save_time,
+        "load": load_time,
+        "top10": top_time,
+        "flush_1000": save_time,  # Any change rewrites everything
+        "size": os.path.getsize(path)
+    }
+
+def bench_sqlite(data, directory):
+    path = os.path.join(directory, 'engagement.db')
+    largest = max(data, key=lambda c: len(data[c]))
+    storage = SQLiteStorage(path)
+
+    import_time, _ = timed(storage.import_data, MONTH, data)
+    load_time, _ = timed(storage.load_month, MONTH)
+    top_time, _ = timed(storage.top, largest, MONTH, 10)
+
+    rng = random.Random(2)
+    rows = []
+    for chat_id in rng.sample(list(data), min(10, len(data))):
+        for user_id in rng.sample(list(data[chat_id]), min(100, len(data[chat_id]))):
+            stats = dict(data[chat_id][user_id])
+            stats["messages"] += 1
+            stats["total_points"] += 1
+            rows.append((chat_id, user_id, stats))
+    flush_time, _ = timed(storage.upsert_rows, MONTH, rows)
+    storage.close()
+
+    size = sum(
+        os.path.getsize(path + suffix)
+        for suffix in ('', '-wal')
+        if os.path.exists(path + suffix)
+    )
+    return {
+        "save": import_time,
+        "load": load_time,
+        "top10": top_time,
+        "flush_1000": flush_time,
+        "size": size
+    }
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'users':>9} {'engine':>7} {'save':>9} {'load':>9} {'top10':>9} {'flush1k':>9} {'size':>10}")
+    for users in sizes:
+        data = make_data(users)
+        for name, bench in (("json", bench_json), ("sqlite", bench_sqlite)):
+            with tempfile.TemporaryDirectory() as directory:
+                r = bench(data, directory)
+            print(
+                f"{users:>9} {name:>7} "
+                f"{r['save'] * 1000:>7.1f}ms {r['load'] * 1000:>7.1f}ms "
+                f"{r['top10'] * 1000:>7.2f}ms {r['flush_1000'] * 1000:>7.1f}ms "
+                f"{r['size'] / 1024:>8.0f}KB"
+            )
+
+if __name__ == "__main__":
+    main()
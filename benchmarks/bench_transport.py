@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Compare polling and webhook mode end to end against the fake Bot API.
+
+Runs an unmodified bot.py as a subprocess in a temporary directory, pointed
+at benchmarks/fake_telegram.py, once per mode, and feeds both runs the same
+update stream:
+  - throughput: N tracked messages spread over 20 chats followed by a /stats
+    command; updates/sec is measured until the /stats reply arrives
+  - latency: /stats commands sent one at a time, timed from the moment the
+    update is handed to the fake server until the bot's reply reaches it
+
+Usage: python benchmarks/bench_transport.py [messages] [probes]   (default: 5000 200)
+Set MAX_CONCURRENT_UPDATES in the environment to change how many chats run at once.
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import FakeBotAPI, FakeTelegramServer, message_update
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot.py')
+CHATS = 20
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def start_bot(mode, server, directory):
+    port = free_port()
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN='123456:BENCHMARK',
+        BOT_API_BASE_URL=server.url,
+        BOT_MODE=mode,
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_LISTEN='127.0.0.1',
+        WEBHOOK_PORT=str(port),
+    )
+    log = open(os.path.join(directory, 'bot.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, BOT_SCRIPT], cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    ready = server.api.wait_until(
+        lambda api: api.webhook is not None if mode == 'webhook' else api.calls.get('getUpdates', 0) > 0,
+        timeout=30
+    )
+    if not ready:
+        process.kill()
+        raise RuntimeError(f"bot did not start in {mode} mode, see {log.name}")
+    return process
+
+def send_and_wait(api, update, chat_id, timeout=30):
+    """Push an update and wait for the bot's reply in chat_id; returns latency in seconds."""
+    after = len(api.sent)
+    start = time.perf_counter()
+    api.push_update(update)
+    reply = api.wait_for_message(chat_id, after, timeout)
+    if reply is None:
+        raise RuntimeError(f"no reply in chat {chat_id}")
+    return reply["time"] - start
+
+def run(mode, messages, probes):
+    server = FakeTelegramServer(FakeBotAPI()).start()
+    api = server.api
+    with tempfile.TemporaryDirectory() as directory:
+        process = start_bot(mode, server, directory)
+        try:
+            send_and_wait(api, message_update(0, -1, 1, 1, '/stats'), -1)  # Warm up
+
+            start = time.perf_counter()
+            for i in range(messages):
+                api.push_update(message_update(0, -1 - i % CHATS, 1000 + i % 500, 10 + i, f"message {i}"))
+            if mode == 'webhook':
+                # Deliveries run in parallel; let them land before the closing command
+                api.wait_until(lambda api: api.delivered >= messages + 1, timeout=120)
+            send_and_wait(api, message_update(0, -1, 1, 10 + messages, '/stats'), -1, timeout=120)
+            rate = (messages + 1) / (time.perf_counter() - start)
+
+            latencies = []
+            for i in range(probes):
+                chat_id = -1 - i % CHATS
+                latencies.append(send_and_wait(api, message_update(0, chat_id, 1, 20 + messages + i, '/stats'), chat_id))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            server.stop()
+    return rate, latencies
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    probes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{messages} messages over {CHATS} chats, {probes} /stats probes, "
+          f"MAX_CONCURRENT_UPDATES={os.getenv('MAX_CONCURRENT_UPDATES', '8')}")
+    print(f"{'mode':>8} {'updates/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode in ('polling', 'webhook'):
+        rate, latencies = run(mode, messages, probes)
+        print(f"{mode:>8} {rate:>10.0f} {percentile(latencies, 0.5) * 1000:>8.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.2f} {max(latencies) * 1000:>8.2f}")
+
+if __name__ == "__main__":
+    main()
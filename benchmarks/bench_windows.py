@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Rolling leaderboards: cost of counting a point, of /stats and /rank over a
+window, of the daily advance and prune, and memory per active user.
+
+Each user of a single chat earns points on random days of the last month,
+so every window has a realistic spread. Queries read one column of running
+sums, so their time grows with the chat's active users and not with the
+number of points counted.
+
+Usage: python benchmarks/bench_windows.py [users...]   (default: 10000 100000)
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from windows import DAYS, WindowCounters, today
+
+CHAT_ID = "-1001"
+POINTS_PER_USER = 20
+
+class Clock:
+    def __init__(self):
+        self.day = today()
+
+    def __call__(self):
+        return self.day
+
+def timed(fn, *args, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+def build(users, clock, seed=1):
+    rng = random.Random(seed)
+    counters = WindowCounters(clock)
+    points = [
+        (str(10 ** 9 + rng.randrange(users)), clock.day - min(int(rng.expovariate(0.15)), DAYS - 1))
+        for _ in range(users * POINTS_PER_USER)
+    ]
+    start = time.perf_counter()
+    for user_id, day in points:
+        counters.add(CHAT_ID, user_id, day)
+    return counters, (time.perf_counter() - start) * 1e9 / len(points)
+
+def run(users):
+    clock = Clock()
+    counters, add_ns = build(users, clock)
+    active = counters.user_count()
+    print(f"\n📊 {active} active users, {users * POINTS_PER_USER} points over {DAYS} days")
+    print(f"   add           {add_ns:>10.0f} ns/point")
+    print(f"   memory        {counters.nbytes() / active:>10.1f} B/user")
+    user_id = counters.top(CHAT_ID, "30d", 1)[0][0]
+    for window in ("day", "week", "7d", "30d"):
+        top_ms, _ = timed(counters.top, CHAT_ID, window, 5, repeat=20)
+        rank_ms, _ = timed(counters.rank, CHAT_ID, user_id, window, repeat=20)
+        print(f"   {window:<4} top 5 {top_ms:>8.2f} ms   rank {rank_ms:>8.2f} ms")
+    clock.day += 1
+    advance_ms, dropped = timed(counters.advance, CHAT_ID)
+    print(f"   next day      {advance_ms:>10.1f} ms  (dropped {dropped} users)")
+    clock.day += 10
+    advance_ms, dropped = timed(counters.advance, CHAT_ID)
+    print(f"   10 days later {advance_ms:>10.1f} ms  (dropped {dropped} users)")
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [10000, 100000]:
+        run(count)
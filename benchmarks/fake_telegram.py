@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the Telegram Bot API, for offline load tests.
+
+FakeBotAPI implements the handful of methods the bot uses (getMe,
+getUpdates, sendMessage, getChatMember, getChatAdministrators, webhook
+management). FakeRequest plugs it into an Application for in-process
+benchmarks, and FakeTelegramServer serves it over HTTP so an unmodified
+bot.py can talk to it with BOT_API_BASE_URL=http://127.0.0.1:<port>. Updates pushed
+with push_update() are handed out by getUpdates in polling mode, or POSTed to
+the registered webhook with its secret token in webhook mode.
+
+Run directly to start a server for manual testing:
+    python benchmarks/fake_telegram.py [port]
+"""
+
+import asyncio
+import http.client
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1000001, "is_bot": True, "first_name": "Indexsy", "username": "indexsy_test_bot"}
+
+def user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+def chat(chat_id, type="supergroup"):
+    return {"id": chat_id, "type": type, "title": f"Chat {chat_id}"}
+
+def message_update(update_id, chat_id, user_id, message_id, text, date=None):
+    """A message update; commands get a bot_command entity like real Telegram sends."""
+    message = {
+        "message_id": message_id,
+        "date": int(date or time.time()),
+        "chat": chat(chat_id),
+        "from": user(user_id),
+        "text": text,
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+def reaction_update(update_id, chat_id, user_id, message_id, new_emoji=("👍",), old_emoji=(), date=None):
+    return {
+        "update_id": update_id,
+        "message_reaction": {
+            "chat": chat(chat_id),
+            "message_id": message_id,
+            "user": user(user_id),
+            "date": int(date or time.time()),
+            "old_reaction": [{"type": "emoji", "emoji": e} for e in old_emoji],
+            "new_reaction": [{"type": "emoji", "emoji": e} for e in new_emoji],
+        },
+    }
+
+def reaction_count_update(update_id, chat_id, message_id, counts, date=None, chat_type="supergroup"):
+    """Aggregate reactions to a message: counts maps each emoji to its total.
+
+    Telegram only sends these for anonymous reactions, i.e. with chat_type="channel".
+    """
+    return {
+        "update_id": update_id,
+        "message_reaction_count": {
+            "chat": chat(chat_id, chat_type),
+            "message_id": message_id,
+            "date": int(date or time.time()),
+            "reactions": [
+                {"type": {"type": "emoji", "emoji": e}, "total_count": total} for e, total in counts.items()
+            ],
+        },
+    }
+
+class FakeBotAPI:
+    """In-memory Bot API state shared by the HTTP server and in-process stubs."""
+
+    def __init__(self, admins=None):
+        self.admins = admins  # chat_id -> set of admin ids; None means everyone is an admin
+        self.calls = {}
+        self.sent = []
+        self.documents = []
+        self.webhook = None
+        self.delivered = 0
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+        self._deliveries = None
+
+    # Feeding updates
+
+    def push_update(self, update):
+        """Queue an update; it gets the next update_id. Returns the update_id."""
+        with self._cond:
+            update = dict(update, update_id=self._next_update_id)
+            self._next_update_id += 1
+            update["_pushed"] = time.perf_counter()
+            self._updates.append(update)
+            self._cond.notify_all()
+            if self.webhook is not None:
+                self._deliveries.put(update)
+        return update["update_id"]
+
+    def pending_updates(self):
+        with self._cond:
+            return len(self._updates)
+
+    def wait_until(self, predicate, timeout=30):
+        """Wait until predicate(self) holds; returns whether it did."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not predicate(self):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def wait_for_message(self, chat_id, after=0, timeout=10):
+        """Wait for the bot to send a message to chat_id; returns the record or None."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for record in self.sent[after:]:
+                    if record["chat_id"] == chat_id:
+                        return record
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    # Bot API methods
+
+    def handle(self, method, params):
+        """Dispatch a Bot API call and return its result (raises ValueError on bad calls)."""
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._cond.notify_all()
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            return True
+        return handler(params)
+
+    def api_getMe(self, params):
+        return BOT_USER
+
+    def api_getUpdates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 0) or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if offset:
+                # Confirms every update before offset, like Telegram does
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return [
+                {k: v for k, v in u.items() if not k.startswith('_')}
+                for u in self._updates[:limit]
+            ]
+
+    def api_sendMessage(self, params):
+        chat_id = int(params["chat_id"])
+        with self._cond:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            self.sent.append({
+                "chat_id": chat_id,
+                "text": params.get("text", ""),
+                "time": time.perf_counter(),
+            })
+            self._cond.notify_all()
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": chat(chat_id),
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def api_sendDocument(self, params):
+        """Records the upload; the file content only arrives through FakeRequest, not over HTTP."""
+        chat_id = int(params["chat_id"])
+        document = params["document"]
+        filename, content = params.get("_files", {}).get(document.removeprefix("attach://"), (document, b""))
+        with self._cond:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            self.documents.append({
+                "chat_id": chat_id,
+                "filename": filename,
+                "content": content,
+                "caption": params.get("caption", ""),
+            })
+            self._cond.notify_all()
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": chat(chat_id),
+            "from": BOT_USER,
+            "document": {"file_id": f"doc{message_id}", "file_unique_id": f"doc{message_id}", "file_name": filename},
+        }
+
+    def _is_admin(self, chat_id, user_id):
+        return self.admins is None or user_id in self.admins.get(chat_id, ())
+
+    def api_getChatMember(self, params):
+        chat_id, user_id = int(params["chat_id"]), int(params["user_id"])
+        if self._is_admin(chat_id, user_id):
+            return {"status": "creator", "user": user(user_id), "is_anonymous": False}
+        return {"status": "member", "user": user(user_id)}
+
+    def api_getChatAdministrators(self, params):
+        chat_id = int(params["chat_id"])
+        if self.admins is None:
+            raise ValueError("Bad Request: admin list not configured, use getChatMember")
+        return [
+            {"status": "administrator", "user": user(user_id), "can_be_edited": False,
+             "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+             "can_manage_video_chats": True, "can_restrict_members": True,
+             "can_promote_members": False, "can_change_info": True, "can_invite_users": True,
+             "can_post_stories": False, "can_edit_stories": False, "can_delete_stories": False}
+            for user_id in self.admins.get(chat_id, ())
+        ]
+
+    def api_setWebhook(self, params):
+        max_connections = int(params.get("max_connections", 40) or 40)
+        with self._cond:
+            self.webhook = {
+                "url": params["url"],
+                "secret_token": params.get("secret_token"),
+                "max_connections": max_connections,
+            }
+            self._deliveries = queue.Queue()
+            for update in self._updates:
+                self._deliveries.put(update)
+            self._updates = []
+            self._cond.notify_all()
+        for _ in range(max_connections):
+            threading.Thread(target=self._deliver, args=(self._deliveries,), daemon=True).start()
+        return True
+
+    def api_deleteWebhook(self, params):
+        with self._cond:
+            if self._deliveries is not None:
+                self._deliveries.put(None)
+            self.webhook = None
+            self._deliveries = None
+        return True
+
+    def api_getWebhookInfo(self, params):
+        webhook = self.webhook or {}
+        return {"url": webhook.get("url", ""), "has_custom_certificate": False,
+                "pending_update_count": self.pending_updates()}
+
+    def _deliver(self, deliveries):
+        """POST queued updates to the webhook, one keep-alive connection per thread."""
+        connection = None
+        while True:
+            update = deliveries.get()
+            if update is None:
+                deliveries.put(None)  # Let the other delivery threads stop too
+                return
+            webhook = self.webhook
+            if webhook is None:
+                return
+            target = urlsplit(webhook["url"])
+            body = json.dumps({k: v for k, v in update.items() if not k.startswith('_')}).encode('utf-8')
+            headers = {"Content-Type": "application/json"}
+            if webhook["secret_token"]:
+                headers["X-Telegram-Bot-Api-Secret-Token"] = webhook["secret_token"]
+            for _ in range(50):
+                try:
+                    if connection is None:
+                        connection = http.client.HTTPConnection(target.hostname, target.port, timeout=10)
+                    connection.request("POST", target.path or "/", body, headers)
+                    connection.getresponse().read()
+                    with self._cond:
+                        self.delivered += 1
+                        self._cond.notify_all()
+                    break
+                except (OSError, http.client.HTTPException):
+                    connection = None
+                    time.sleep(0.1)  # Webhook server not up yet
+
+class FakeRequest(BaseRequest):
+    """PTB request backend that answers from a FakeBotAPI in-process, without HTTP.
+
+        Application.builder().token(...).request(FakeRequest(api)).build()
+
+    `latency` seconds are awaited before each call, like a network round-trip.
+    """
+
+    def __init__(self, api, latency=0):
+        self.api = api
+        self.latency = latency
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        params = request_data.parameters if request_data is not None else {}
+        if request_data is not None and request_data.contains_files:
+            params["_files"] = {
+                name: (filename, content if isinstance(content, bytes) else content.read())
+                for name, (filename, content, _) in request_data.multipart_data.items()
+            }
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            payload = {"ok": True, "result": self.api.handle(url.rsplit('/', 1)[-1], params)}
+            status = 200
+        except (ValueError, KeyError) as e:
+            payload = {"ok": False, "error_code": 400, "description": str(e)}
+            status = 400
+        return status, json.dumps(payload).encode('utf-8')
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.do_GET()
+
+    def do_GET(self):
+        # /bot<token>/<method>
+        path = urlsplit(self.path).path
+        method = path.rsplit('/', 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(body or '{}')
+        else:
+            params = {key: values[-1] for key, values in parse_qs(body).items()}
+        try:
+            payload = {"ok": True, "result": self.server.api.handle(method, params)}
+            status = 200
+        except (ValueError, KeyError) as e:
+            payload = {"ok": False, "error_code": 400, "description": str(e)}
+            status = 400
+        data = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. a long poll cancelled at shutdown
+            self.close_connection = True
+
+class FakeTelegramServer:
+    """Serves a FakeBotAPI over HTTP on 127.0.0.1."""
+
+    def __init__(self, api=None, port=0):
+        self.api = api or FakeBotAPI()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = self.api
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.api.api_deleteWebhook({})
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+if __name__ == "__main__":
+    server = FakeTelegramServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8081).start()
+    print(f"Fake Bot API listening on {server.url} (BOT_API_BASE_URL={server.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Synthetic update streams with realistic chat and user distributions.
+
+Chat sizes and per-user activity both follow a Zipf-like law: a few big,
+busy chats and a long tail of quiet ones, and in every chat a handful of
+regulars write most of the messages. Reactions target one of the chat's
+recent messages, and some of them are removals. Commands are a small share
+of the traffic, like in a real group.
+
+    updates = generate(100000, chats=200, users=20000)
+
+returns Bot API update dicts (see fake_telegram.py) that can be turned into
+telegram.Update objects or pushed to the fake server.
+"""
+
+import random
+from collections import deque
+from itertools import accumulate
+
+from fake_telegram import message_update, reaction_update
+
+# Share of each update kind in the stream
+DEFAULT_MIX = {
+    "message": 0.80,
+    "reaction": 0.165,
+    "/stats": 0.02,
+    "/rank": 0.01,
+    "/statsadmin": 0.005,
+}
+REMOVED_REACTION_SHARE = 0.1
+RECENT_MESSAGES = 200
+EMOJI = ("👍", "❤️", "🔥", "😂", "🎉", "👏")
+
+def zipf(n, s=1.1):
+    """Relative frequency of each rank under a Zipf-like law."""
+    return [1 / (rank + 1) ** s for rank in range(n)]
+
+class Workload:
+    """Generates updates for a fixed population of chats and users."""
+
+    def __init__(self, chats=200, users=20000, mix=None, seed=1):
+        self.rng = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        self._kinds = list(self.mix)
+        self._kind_weights = list(accumulate(self.mix.values()))
+        self.chat_ids = [-1000000000000 - i for i in range(chats)]
+        activity = zipf(chats)
+        self._chat_weights = list(accumulate(activity))
+
+        # Split users over chats by chat activity, at least 2 members per chat
+        self.members = {}
+        next_user = 100000000
+        for chat_id, weight in zip(self.chat_ids, activity):
+            count = max(2, int(users * weight / self._chat_weights[-1]))
+            self.members[chat_id] = list(range(next_user, next_user + count))
+            next_user += count
+        self._member_weights = {
+            chat_id: list(accumulate(zipf(len(members)))) for chat_id, members in self.members.items()
+        }
+
+        self._next_message_id = dict.fromkeys(self.chat_ids, 1)
+        self._recent = {chat_id: deque(maxlen=RECENT_MESSAGES) for chat_id in self.chat_ids}
+        self._update_id = 0
+
+    # Admins of each chat: its most active member
+    @property
+    def admins(self):
+        return {chat_id: {members[0]} for chat_id, members in self.members.items()}
+
+    def _pick_user(self, chat_id):
+        return self.rng.choices(self.members[chat_id], cum_weights=self._member_weights[chat_id])[0]
+
+    def _message(self, chat_id, user_id, text):
+        message_id = self._next_message_id[chat_id]
+        self._next_message_id[chat_id] += 1
+        self._recent[chat_id].append(message_id)
+        return message_update(self._update_id, chat_id, user_id, message_id, text)
+
+    def next(self):
+        """The next (kind, update dict) of the stream."""
+        rng = self.rng
+        self._update_id += 1
+        kind = rng.choices(self._kinds, cum_weights=self._kind_weights)[0]
+        chat_id = rng.choices(self.chat_ids, cum_weights=self._chat_weights)[0]
+        user_id = self._pick_user(chat_id)
+
+        if kind == "reaction" and self._recent[chat_id]:
+            message_id = rng.choice(self._recent[chat_id])
+            emoji = (rng.choice(EMOJI),)
+            if rng.random() < REMOVED_REACTION_SHARE:
+                return kind, reaction_update(self._update_id, chat_id, user_id, message_id, (), emoji)
+            return kind, reaction_update(self._update_id, chat_id, user_id, message_id, emoji)
+        if kind.startswith('/'):
+            if kind == "/statsadmin":
+                user_id = self.members[chat_id][0]
+            return kind, self._message(chat_id, user_id, kind)
+        return "message", self._message(chat_id, user_id, f"message {self._update_id}")
+
+    def generate(self, count):
+        return [self.next() for _ in range(count)]
+
+def generate(count, chats=200, users=20000, seed=1):
+    """A list of (kind, update dict) pairs."""
+    return Workload(chats, users, seed=seed).generate(count)
@@ -1,19 +1,38 @@
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, BaseHandler
+from telegram import Bot, InputFile, Update
+from telegram.ext import Application, CommandHandler, MessageHandler, ChatMemberHandler, TypeHandler, ApplicationHandlerStop, filters, CallbackContext, BaseHandler
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-import tempfile
-import shutil
+import re
 import sys
 import time
 import threading
 import signal
-import subprocess
+import secrets
+import tempfile
+from persistence import PersistenceWorker, atomic_write
+from eventlog import EventLog
+from sqlite_storage import SQLiteStorage
+from sender_index import SenderIndex
+from leaderboard import LeaderboardIndex
+from engagement_store import EngagementStore, COUNTER_FIELDS
+from chat_files import ChatFiles, ResidentChats
+from snapshot import SnapshotError, read_snapshot, write_snapshot, read_windows, write_windows
+from windows import WindowCounters
+from admin_cache import AdminCache
+from update_scheduler import ChatUpdateProcessor
+from exporter import EXPORT_FORMATS, ExportWriter, current_rows
+from profiler import Profiler
+from history_store import HistoryStore
+from liveness import LivenessMonitor, PollingHealthRequest, systemd_watchdog_interval
+from metrics import MetricsRegistry, MetricsServer, ErrorCounter, instrument_handlers
+from log_pipeline import LogPipeline, parse_sample_rates, sample
+from sharding import MAX_UPDATE_BYTES, ShardRouter, poll_updates, shard_of
 
-# Setup logging
+# Setup logging; main() switches to log_pipeline
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
@@ -24,52 +43,277 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Logs are formatted and written by a background thread: JSON lines (or the
+# old text format with LOG_FORMAT=text), keeping one in N of the per-update
+# lines listed in LOG_SAMPLE_RATES (event=N, comma separated)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', 'message=100,reaction=100,save=60')
+log_pipeline = LogPipeline(LOG_LEVEL, LOG_FORMAT == 'json', parse_sample_rates(LOG_SAMPLE_RATES))
+
 # Constants for data files
-DATA_FILE = 'engagement_data.json'
-HISTORY_FILE = 'engagement_history.json'
+CHAT_DIR = 'chats'  # One snapshot per chat, loaded on the chat's first update after a start
+SNAPSHOT_FILE = 'engagement_data.snap'  # Single snapshot of all chats of older versions, split into CHAT_DIR
+DATA_FILE = 'engagement_data.json'  # JSON snapshot of older versions, migrated to CHAT_DIR
+HISTORY_FILE = 'engagement_history.json'  # Legacy single-file history, split into HISTORY_DIR
+HISTORY_DIR = 'history'
+EVENT_LOG_FILE = 'engagement_events.log'
+SQLITE_FILE = os.getenv('SQLITE_FILE', 'engagement.db')
+SENDER_INDEX_DIR = 'message_senders'
+WINDOWS_FILE = 'engagement_windows.snap'  # Daily buckets behind the rolling leaderboards
+UPDATE_OFFSET_FILE = 'update_offset.json'  # Offset as of the last snapshot; later ones are in the event log
+
+# Storage engine: 'json' (snapshot + event log) or 'sqlite'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()
 PID_FILE = "bot.pid"
 
-# Store engagement data per chat
-engagement_data = {}
-# Cache to store message senders: chat_id -> {message_id: user_id}
-message_senders = {}
+# Persistence settings: append new events to the log every SAVE_INTERVAL
+# seconds, or sooner once SAVE_MAX_PENDING changes have accumulated. The log
+# is folded into the files of the chats it changed every COMPACT_INTERVAL seconds
+# or COMPACT_MAX_EVENTS events.
+SAVE_INTERVAL = float(os.getenv('SAVE_INTERVAL', '1'))
+SAVE_MAX_PENDING = int(os.getenv('SAVE_MAX_PENDING', '500'))
+COMPACT_INTERVAL = float(os.getenv('COMPACT_INTERVAL', '300'))
+COMPACT_MAX_EVENTS = int(os.getenv('COMPACT_MAX_EVENTS', '100000'))
+
+# Message author index: messages remembered per chat, and the memory budget
+# for all chats' indexes together
+SENDER_INDEX_SLOTS = int(os.getenv('SENDER_INDEX_SLOTS', '8192'))
+SENDER_INDEX_MEMORY_MB = int(os.getenv('SENDER_INDEX_MEMORY_MB', '64'))
+
+# Which reaction updates are counted. user: one message_reaction update per
+# reacting user credits both the reactor and the message's author. count:
+# the author is credited from message_reaction_count totals instead, one
+# update per message and batch of changes, which Telegram only sends for
+# anonymous reactions, i.e. channel posts; the bot doesn't record their
+# authors, so this credits nothing today (the bot must be an admin, and
+# reactions given aren't counted). both: per-user updates as in user mode,
+# plus the part of a total they didn't cover. Per-user credits are added to
+# the message's recorded total, so no reaction is credited twice.
+REACTION_MODE = os.getenv('REACTION_MODE', 'user').lower()
+
+# Chats are loaded into memory on their first update or command. Chats without
+# updates for CHAT_IDLE_TIMEOUT seconds, then the least recently used ones while
+# the counters in memory take more than CHAT_MEMORY_MB, are saved and dropped
+# again, checked every CHAT_EVICT_INTERVAL seconds.
+CHAT_IDLE_TIMEOUT = float(os.getenv('CHAT_IDLE_TIMEOUT', '3600'))
+CHAT_MEMORY_MB = float(os.getenv('CHAT_MEMORY_MB', '256'))
+CHAT_EVICT_INTERVAL = 60
+
+# Admin status cache: seconds an answer stays valid and max cached entries.
+# TRACK_CHAT_MEMBERS=1 subscribes to chat_member updates (the bot must be an
+# admin to receive them) so promotions and demotions apply immediately.
+ADMIN_CACHE_TTL = float(os.getenv('ADMIN_CACHE_TTL', '300'))
+ADMIN_CACHE_SIZE = int(os.getenv('ADMIN_CACHE_SIZE', '10000'))
+TRACK_CHAT_MEMBERS = os.getenv('TRACK_CHAT_MEMBERS', '0') == '1'
+
+# How updates arrive: 'polling' (getUpdates) or 'webhook' (Telegram POSTs them
+# to WEBHOOK_URL, served by PTB's webhook server on WEBHOOK_LISTEN:WEBHOOK_PORT).
+# Requests without the WEBHOOK_SECRET header are rejected; a random secret is
+# used when none is set.
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Updates of different chats processed at the same time; each chat's stay in order
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '8'))
+# Updates waiting to be processed before the bot stops taking new ones from Telegram
+MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', '1000'))
+# Bot API server, e.g. a local Bot API server or benchmarks/fake_telegram.py
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL', '').rstrip('/')
+
+# SHARDS>1 splits the chats over that many worker processes by a hash of the
+# chat id. A front process polls Telegram and hands each update to the worker
+# owning its chat; each worker keeps its chats' data in SHARD_DIR/shard-<n>.
+# SHARD_INDEX is set by the front in its workers' environment.
+SHARDS = int(os.getenv('SHARDS', '1'))
+SHARD_DIR = os.getenv('SHARD_DIR', 'shards')
+SHARD_INDEX = os.getenv('SHARD_INDEX')
+SHARD_LAYOUT_FILE = 'shards.json'  # In SHARD_DIR: the shard count the data is split for
+
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics (METRICS_PORT=0
+# turns the endpoint off), and how often event loop lag is sampled
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+# Shard workers serve their own metrics on the ports after the front's
+if SHARD_INDEX is not None and METRICS_PORT:
+    METRICS_PORT += 1 + int(SHARD_INDEX)
+
+# /history accepts months as YYYY-MM and compares at most this many at once
+MONTH_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+HISTORY_MAX_MONTHS = 6
+
+# /stats and /rank take an optional period; the default is the current month
+STATS_PERIODS = {"today": "day", "week": "week", "7d": "7d", "30d": "30d", "month": None}
+PERIOD_TITLES = {"day": "today", "week": "this week", "7d": "last 7 days", "30d": "last 30 days"}
+# Rolling window counters are saved at most this often (seconds)
+WINDOW_SAVE_INTERVAL = float(os.getenv('WINDOW_SAVE_INTERVAL', '60'))
+
+# /export sends files of at most EXPORT_PART_MB (bots may upload 50 MB), gzipped
+# when the chat has more than EXPORT_GZIP_ROWS rows over all its months
+EXPORT_PART_MB = float(os.getenv('EXPORT_PART_MB', '45'))
+EXPORT_GZIP_ROWS = int(os.getenv('EXPORT_GZIP_ROWS', '10000'))
+# Chats with an export being written or sent; one at a time per chat
+running_exports = set()
+
+# On-demand profiling: SIGUSR1, or /profile [seconds] from one of the Telegram
+# user ids in PROFILE_ADMINS (comma separated; empty disables the command),
+# captures PROFILE_SECONDS of cProfile and tracemalloc data into PROFILE_DIR
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SECONDS = float(os.getenv('PROFILE_SECONDS', '30'))
+PROFILE_ADMINS = {int(user_id) for user_id in os.getenv('PROFILE_ADMINS', '').split(',') if user_id.strip()}
+PROFILE_MAX_SECONDS = 300
+
+# Current month's counters per chat and user, of the chats in memory
+engagement_data = EngagementStore()
+# Where the other chats are (JSON backend), and which ones are in memory
+chat_files = ChatFiles(CHAT_DIR)
+resident_chats = ResidentChats(CHAT_IDLE_TIMEOUT, CHAT_MEMORY_MB * 1024 * 1024)
+# Chats changed since their file was last written (JSON) or their rows flushed (SQLite)
+dirty_chats = set()
+eviction_task = None
+# Held while a chat's file is read into memory, and while a rollover resets a file in place
+chat_files_lock = threading.Lock()
+# Points per user over the last days, for the today/week/7d/30d leaderboards
+window_counters = WindowCounters()
+windows_dirty = False
+windows_saved_at = time.monotonic()
+# Bounded, memory-mapped index of message authors: (chat_id, message_id) -> user_id
+message_senders = SenderIndex(
+    SENDER_INDEX_DIR, SENDER_INDEX_SLOTS, SENDER_INDEX_MEMORY_MB * 1024 * 1024
+)
+# Per-chat rankings by total points, kept in step with engagement_data
+leaderboards = LeaderboardIndex()
+# Who is an admin where, so admin commands skip the get_chat_member round-trip
+admin_cache = AdminCache(ADMIN_CACHE_TTL, ADMIN_CACHE_SIZE)
+# Guards engagement_data against the persistence thread taking a snapshot mid-update
+data_lock = threading.RLock()
+
+# Archived months, one file per (month, chat); unused with the SQLite backend
+history_store = HistoryStore(HISTORY_DIR)
+# SQLite store when STORAGE_BACKEND=sqlite
+storage = SQLiteStorage(SQLITE_FILE) if STORAGE_BACKEND == 'sqlite' else None
+
+# Month the in-memory counters belong to. While a rollover runs, chats that
+# have already moved to the new month are listed in rolled_chats.
+data_month = datetime.now().strftime('%Y-%m')
+rolled_chats = {}
+rollover_running = False
+# Chats whose reset to a month was found while replaying the event log
+replayed_resets = set()
+# Chats archived per event loop step during a rollover
+ROLLOVER_BATCH = 50
+
+# Highest update_id whose changes are in engagement_data, and the one loaded
+# at startup. Chats run in parallel, so updates finish out of order: the saved
+# offset is the update_id every update up to has finished, plus the ids
+# finished after it. Updates up to resume_update_id, or among those ids, were
+# processed before the restart and are skipped.
+last_update_id = 0
+resume_update_id = 0
+# Whether an update finished since the offset was last queued for disk, and what was queued
+offset_changed = False
+logged_offset = (0, [])
+# Scheduler of the running Application, which knows the updates still queued in its lanes
+update_processor = None
+# Recently processed update ids, to drop redelivered updates
+recent_update_ids = {}
+RECENT_UPDATE_IDS = 10000
+# Updates fetched per getUpdates call while catching up on the backlog
+CATCH_UP_BATCH = 100
+catch_up_stats = {"updates": 0, "skipped": 0, "seconds": 0.0}
 
-# Watchdog variables
-WATCHDOG_INTERVAL = 60  # Check every 60 seconds
-last_activity_time = time.time()
-watchdog_running = False
+# Liveness: the process is restarted only when the event loop has been blocked
+# for LOOP_STALL_TIMEOUT seconds, or (polling mode) no getUpdates call has
+# succeeded for POLL_STALL_TIMEOUT seconds. Health is checked every
+# WATCHDOG_INTERVAL seconds, or as often as systemd's WatchdogSec requires.
+LOOP_STALL_TIMEOUT = float(os.getenv('LOOP_STALL_TIMEOUT', '60'))
+POLL_STALL_TIMEOUT = float(os.getenv('POLL_STALL_TIMEOUT', '600'))
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', '10'))
 
-# Custom handler for message_reaction updates
+# Custom handler for message_reaction (or, with kind, message_reaction_count) updates
 class ReactionHandler(BaseHandler):
-    def __init__(self, callback, block=True):
+    def __init__(self, callback, kind='message_reaction', block=True):
         super().__init__(callback, block=block)
         self.block = block
+        self.kind = kind
 
     def check_update(self, update):
-        return hasattr(update, 'message_reaction') and update.message_reaction is not None
+        return getattr(update, self.kind, None) is not None
 
     async def handle_update(self, update, application, check_result, context):
         return await self.callback(update, context)
 
-def update_activity_timestamp():
-    """Update the last activity timestamp."""
-    global last_activity_time
-    last_activity_time = time.time()
+async def skip_processed_update(update: Update, context: CallbackContext):
+    """Stop updates processed before a restart, or delivered twice, before any handler runs."""
+    if update.update_id <= resume_update_id or update.update_id in recent_update_ids:
+        catch_up_stats["skipped"] += 1
+        raise ApplicationHandlerStop
+
+async def load_update_chat(update: Update, context: CallbackContext):
+    """Bring the update's chat into memory before any handler uses it."""
+    chat = update.effective_chat
+    if chat is None:
+        return
+    chat_id = str(chat.id)
+    try:
+        loaded = chat_id not in engagement_data and await asyncio.to_thread(load_chat, chat_id)
+    except Exception as e:
+        # Counting without its saved state would write over the chat's file
+        logger.error(f"❌ Error loading chat {chat_id}, skipping its update: {e}")
+        raise ApplicationHandlerStop
+    with data_lock:
+        resident_chats.touch(chat_id)
+    if loaded:
+        # Sizing every chat costs too much per update; rows added since are caught by evict_chats_job
+        with data_lock:
+            over_budget = resident_chats.over_budget(engagement_data.nbytes())
+        if over_budget:
+            start_eviction()
+
+async def record_update_id(update: Update, context: CallbackContext):
+    """Remember that an update has been handled so its offset gets saved."""
+    global last_update_id, offset_changed
+    with data_lock:
+        recent_update_ids[update.update_id] = None
+        if len(recent_update_ids) > RECENT_UPDATE_IDS:
+            del recent_update_ids[next(iter(recent_update_ids))]
+        if update.update_id > last_update_id:
+            last_update_id = update.update_id
+        offset_changed = True
+    persistence.mark_dirty()
+
+def finished_update_offset():
+    """(update_id every update up to has finished, ids finished after it) to save.
+
+    Caller holds data_lock.
+    """
+    oldest = update_processor.oldest_unfinished() if update_processor is not None else None
+    if oldest is None or oldest > last_update_id:
+        return last_update_id, []
+    offset = oldest - 1
+    return offset, sorted(update_id for update_id in recent_update_ids if update_id > offset)
+
+def offset_file_payload(offset, done):
+    """Contents of UPDATE_OFFSET_FILE."""
+    return json.dumps({"update_id": offset, "done": done}).encode('utf-8')
 
 async def start(update: Update, context: CallbackContext):
     """Welcome message for the bot."""
-    update_activity_timestamp()
     await update.message.reply_text(
         "👋 Hi! I'm tracking engagement in this chat.\n"
         "• Messages are counted\n"
         "• Reactions are counted\n"
-        "Use /stats to see the leaderboard!"
+        "Use /stats to see the leaderboard and /rank for your position!"
     )
 
 async def track_message(update: Update, context: CallbackContext):
     """Track messages and store sender information."""
     try:
-        update_activity_timestamp()
         if not update.message or not update.message.from_user:
             return
             
@@ -78,106 +322,150 @@ async def track_message(update: Update, context: CallbackContext):
         username = update.message.from_user.username or update.message.from_user.first_name
         message_id = update.message.message_id
         
-        # Initialize data structures
-        if chat_id not in engagement_data:
-            engagement_data[chat_id] = {}
-        if user_id not in engagement_data[chat_id]:
-            engagement_data[chat_id][user_id] = {
-                "username": username,
-                "messages": 0,
-                "reactions_given": 0,
-                "reactions_received": 0,
-                "total_points": 0
-            }
-        
-        # Update counts
-        engagement_data[chat_id][user_id]["messages"] += 1
-        engagement_data[chat_id][user_id]["total_points"] += 1
+        with data_lock:
+            engagement_data.increment(chat_id, user_id, "messages", username)
+            record_change("message", chat_id, user_id)
+            count_recent(chat_id, user_id, update.message.date)
         
         # Store message sender
-        if chat_id not in message_senders:
-            message_senders[chat_id] = {}
-        message_senders[chat_id][message_id] = user_id
+        message_senders.add(chat_id, message_id, user_id)
         
-        # Save data after update
-        save_data()
+        # Saved in the background
+        persistence.mark_dirty()
         
-        logger.info(f"📝 Message from {username}")
+        extra = sample("message")
+        if extra:
+            logger.info("📝 Message from %s in chat %s", username, chat_id, extra=extra)
         
     except Exception as e:
         logger.error(f"❌ Error tracking message: {e}")
 
+def reaction_change(old_reaction, new_reaction):
+    """Reactions added minus reactions removed from a user's old to new reactions."""
+    old, new = set(old_reaction), set(new_reaction)
+    return len(new - old) - len(old - new)
+
 async def track_reaction(update: Update, context: CallbackContext):
-    """Track reactions."""
+    """Track a user's reactions to a message: what they added or removed since their last update."""
     try:
-        update_activity_timestamp()
         reaction = update.message_reaction
-        if not reaction or not reaction.user or reaction.user.is_bot:
+        reactor = reaction.user if reaction else None  # None when reacting anonymously as the chat
+        if not reaction or (reactor is not None and reactor.is_bot):
             logger.info("Skipping reaction: missing data or from bot")
             return
 
         chat_id = str(reaction.chat.id)
-        reactor_id = str(reaction.user.id)
-        reactor_name = reaction.user.username or reaction.user.first_name
+        reactor_name = (reactor.username or reactor.first_name) if reactor else reaction.actor_chat.title
         message_id = reaction.message_id
 
-        # Only count reactions that are added (not removed)
-        if not reaction.new_reaction:
-            logger.info(f"Reaction removed by {reactor_name}")
+        # Swapping one reaction for another changes nothing
+        change = reaction_change(reaction.old_reaction, reaction.new_reaction)
+        if not change:
+            extra = sample("reaction")
+            if extra:
+                logger.info("Reaction changed by %s", reactor_name, extra=extra)
             return
 
-        logger.info(f"Processing reaction from {reactor_name} in chat {chat_id}")
-
-        # Initialize chat data if needed
-        if chat_id not in engagement_data:
-            engagement_data[chat_id] = {}
-
-        # Initialize reactor data if needed
-        if reactor_id not in engagement_data[chat_id]:
-            engagement_data[chat_id][reactor_id] = {
-                "username": reactor_name,
-                "messages": 0,
-                "reactions_given": 0,
-                "reactions_received": 0,
-                "total_points": 0
-            }
-
-        # Update reactor's stats
-        engagement_data[chat_id][reactor_id]["reactions_given"] += 1
-        engagement_data[chat_id][reactor_id]["total_points"] += 1
-
-        # Try to update target's stats if we can find them
-        if chat_id in message_senders and message_id in message_senders[chat_id]:
-            target_id = message_senders[chat_id][message_id]
-            if target_id in engagement_data[chat_id]:
-                engagement_data[chat_id][target_id]["reactions_received"] += 1
-                engagement_data[chat_id][target_id]["total_points"] += 1
-                target_name = engagement_data[chat_id][target_id]["username"]
-                logger.info(f"Credited reaction to {target_name}")
-
-        # Add save after reaction updates
-        save_data()
-        logger.info("Reaction processed and data saved")
+        target_id = None
+        with data_lock:
+            # Update reactor's stats; a removal doesn't create a row
+            if reactor is not None:
+                reactor_id = str(reactor.id)
+                added = engagement_data.add(chat_id, reactor_id, "reactions_given", change,
+                                            reactor_name if change > 0 else None)
+                if added:
+                    record_change("reaction_given", chat_id, reactor_id)
+                    count_recent(chat_id, reactor_id, reaction.date, added)
+
+            # Try to update target's stats if we can find them; a total arriving later credits only the rest
+            target_id = message_senders.add_reactions(chat_id, message_id, change)
+            added = target_id is not None and engagement_data.add(chat_id, target_id, "reactions_received", change)
+            if added:
+                record_change("reaction_received", chat_id, target_id)
+                count_recent(chat_id, target_id, reaction.date, added)
+            else:
+                target_id = None
+
+        # Saved in the background
+        persistence.mark_dirty()
+        extra = sample("reaction")
+        if extra:
+            logger.info(
+                "👍 Reaction %+d from %s in chat %s, credited to %s", change, reactor_name, chat_id, target_id,
+                extra=extra
+            )
 
     except Exception as e:
         logger.error(f"Error tracking reaction: {e}", exc_info=True)
 
+async def track_reaction_count(update: Update, context: CallbackContext):
+    """Credit the change in a message's reaction total to its author at once.
+
+    Telegram sends totals only for messages with anonymous reactions, as in
+    channels. Reactions already credited from per-user updates are part of
+    the recorded total, so they aren't credited again.
+    """
+    try:
+        counts = update.message_reaction_count
+        chat_id = str(counts.chat.id)
+        total = sum(count.total_count for count in counts.reactions)
+
+        with data_lock:
+            credited = message_senders.count_reactions(chat_id, counts.message_id, total)
+            target_id, change = credited if credited is not None else (None, 0)
+            added = change and engagement_data.add(chat_id, target_id, "reactions_received", change)
+            if added:
+                record_change("reaction_received", chat_id, target_id)
+                count_recent(chat_id, target_id, counts.date, added)
+
+        # Saved in the background
+        persistence.mark_dirty()
+        extra = sample("reaction")
+        if extra:
+            logger.info(
+                "👍 %d reactions to message %s in chat %s, %+d credited to %s",
+                total, counts.message_id, chat_id, change, target_id, extra=extra
+            )
+
+    except Exception as e:
+        logger.error(f"Error tracking reaction count: {e}", exc_info=True)
+
+async def track_chat_member(update: Update, context: CallbackContext):
+    """Keep the admin cache in step with promotions and demotions."""
+    try:
+        member = update.chat_member
+        admin_cache.update_member(
+            member.chat.id, member.new_chat_member.user.id, member.new_chat_member.status
+        )
+    except Exception as e:
+        logger.error(f"Error tracking chat member: {e}")
+
 async def show_stats(update: Update, context: CallbackContext):
-    """Show top 5 users by total points."""
+    """Show top 5 users by total points, this month or over a recent period."""
     try:
-        update_activity_timestamp()
         chat_id = str(update.message.chat.id)
         
-        if chat_id not in engagement_data:
+        period = stats_period(context)
+        if period is False:
+            await update.message.reply_text(f"Usage: /stats [{'|'.join(STATS_PERIODS)}]")
+            return
+        if period is not None:
+            with data_lock:
+                recent = window_counters.top(chat_id, period, 5)
+                names = [engagement_data.username(user_id) or user_id for user_id, _ in recent]
+            if not recent:
+                await update.message.reply_text(f"No engagement recorded {PERIOD_TITLES[period]}!")
+                return
+            text = f"📊 Engagement Leaderboard ({PERIOD_TITLES[period]})\n\n"
+            for i, (name, (_, points)) in enumerate(zip(names, recent), 1):
+                text += f"{i}. @{name} - Points: {points}\n"
+            await update.message.reply_text(text)
+            return
+        
+        sorted_users = top_users(chat_id, 5)  # Only top 5
+        if not sorted_users:
             await update.message.reply_text("No engagement recorded yet!")
             return
-            
-        # Sort users by total points
-        sorted_users = sorted(
-            engagement_data[chat_id].items(),
-            key=lambda x: x[1]["total_points"],
-            reverse=True
-        )[:5]  # Only top 5
         
         text = "📊 Engagement Leaderboard\n\n"
         for i, (user_id, data) in enumerate(sorted_users, 1):
@@ -188,29 +476,58 @@ async def show_stats(update: Update, context: CallbackContext):
     except Exception as e:
         logger.error(f"Error showing stats: {e}")
 
+async def show_rank(update: Update, context: CallbackContext):
+    """Show the caller's position on the leaderboard, this month or over a recent period."""
+    try:
+        chat_id = str(update.message.chat.id)
+        user_id = str(update.message.from_user.id)
+        
+        period = stats_period(context)
+        if period is False:
+            await update.message.reply_text(f"Usage: /rank [{'|'.join(STATS_PERIODS)}]")
+            return
+        if period is not None:
+            with data_lock:
+                position = window_counters.rank(chat_id, user_id, period)
+                name = engagement_data.username(user_id) or user_id
+            if position is None:
+                await update.message.reply_text(f"You haven't earned any points {PERIOD_TITLES[period]}!")
+                return
+            rank, size, points = position
+            await update.message.reply_text(
+                f"🏅 @{name} is #{rank} of {size} {PERIOD_TITLES[period]} with {points} points"
+            )
+            return
+        
+        rank = leaderboards.rank(chat_id, user_id)
+        if rank is None:
+            await update.message.reply_text("You haven't earned any points yet!")
+            return
+        
+        data = engagement_data.get(chat_id, user_id)
+        await update.message.reply_text(
+            f"🏅 @{data['username']} is #{rank} of {leaderboards.size(chat_id)} "
+            f"with {data['total_points']} points"
+        )
+        
+    except Exception as e:
+        logger.error(f"Error showing rank: {e}")
+
 async def show_admin_stats(update: Update, context: CallbackContext):
     """Show detailed stats for admins (top 25)."""
     try:
-        update_activity_timestamp()
         chat_id = str(update.message.chat.id)
         user_id = str(update.message.from_user.id)
         
         # Check if user is admin
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-        if chat_member.status not in ['administrator', 'creator']:
+        if not await admin_cache.is_admin(context.bot, chat_id, user_id):
             await update.message.reply_text("This command is only available to admins!")
             return
         
-        if chat_id not in engagement_data:
+        sorted_users = top_users(chat_id, 25)  # Top 25 for admins
+        if not sorted_users:
             await update.message.reply_text("No engagement recorded yet!")
             return
-            
-        # Sort users by total points
-        sorted_users = sorted(
-            engagement_data[chat_id].items(),
-            key=lambda x: x[1]["total_points"],
-            reverse=True
-        )[:25]  # Top 25 for admins
         
         text = "📊 Detailed Engagement Stats (Admin View)\n\n"
         for i, (user_id, data) in enumerate(sorted_users, 1):
@@ -227,191 +544,1004 @@ async def show_admin_stats(update: Update, context: CallbackContext):
         logger.error(f"Error showing admin stats: {e}")
 
 async def show_history(update: Update, context: CallbackContext):
-    """Show historical leaderboard data for admins."""
+    """Show archived leaderboards for admins: last month, or the months given."""
     try:
-        update_activity_timestamp()
         chat_id = str(update.message.chat.id)
         user_id = str(update.message.from_user.id)
         
         # Check if user is admin
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-        if chat_member.status not in ['administrator', 'creator']:
+        if not await admin_cache.is_admin(context.bot, chat_id, user_id):
             await update.message.reply_text("This command is only available to admins!")
             return
         
-        # Load history
-        if not os.path.exists(HISTORY_FILE):
-            await update.message.reply_text("No historical data available yet!")
+        requested = context.args or []
+        if any(not MONTH_PATTERN.match(month) for month in requested):
+            await update.message.reply_text("Usage: /history [YYYY-MM ...]")
             return
-            
-        with open(HISTORY_FILE, 'r') as f:
-            history = json.load(f)
-        
-        # Get last month's data
-        last_month = history.get('last_reset', 'No data')
-        last_month_data = history.get(last_month, {}).get(chat_id, {})
         
-        if not last_month_data:
-            await update.message.reply_text("No data from last month!")
+        available = await asyncio.to_thread(history_months, chat_id)
+        if not available:
+            await update.message.reply_text("No historical data available yet!")
             return
         
-        text = f"📊 Last Month's Top Users ({last_month})\n\n"
-        
-        # Sort and show top 10
-        sorted_users = sorted(
-            last_month_data.items(),
-            key=lambda x: x[1]["total_points"],
-            reverse=True
-        )[:10]
+        # Only the requested months' shards are loaded
+        months = requested[:HISTORY_MAX_MONTHS] or available[:1]
+        missing = [month for month in months if month not in available]
+        if missing:
+            await update.message.reply_text(
+                f"No data for {', '.join(missing)}. Available: {', '.join(available[:12])}"
+            )
+            return
         
-        for i, (uid, data) in enumerate(sorted_users, 1):
-            text += f"{i}. @{data['username']} - {data['total_points']} points\n"
+        if len(months) == 1:
+            month = months[0]
+            sorted_users, _, _ = await asyncio.to_thread(history_month, chat_id, month, 10)
+            if requested:
+                text = f"📊 Top Users ({month})\n\n"
+            else:
+                text = f"📊 Last Month's Top Users ({month})\n\n"
+            for i, (uid, data) in enumerate(sorted_users, 1):
+                text += f"{i}. @{data['username']} - {data['total_points']} points\n"
+        else:
+            text = "📊 Monthly Comparison\n"
+            for month in sorted(months, reverse=True):
+                sorted_users, user_count, points = await asyncio.to_thread(
+                    history_month, chat_id, month, 3
+                )
+                text += f"\n📅 {month}: {user_count} users, {points} points\n"
+                for i, (uid, data) in enumerate(sorted_users, 1):
+                    text += f"{i}. @{data['username']} - {data['total_points']} points\n"
         
         await update.message.reply_text(text)
         
     except Exception as e:
         logger.error(f"Error showing history: {e}")
 
-def save_data():
-    """Save engagement data to file with atomic writes."""
+async def export_stats(update: Update, context: CallbackContext):
+    """Send admins every row of the chat, this month and archived ones, as CSV or JSONL files."""
     try:
-        # Write to a temporary file first
-        with tempfile.NamedTemporaryFile('w', delete=False) as temp_file:
-            json.dump(engagement_data, temp_file, indent=2)
-            temp_file.flush()
-            os.fsync(temp_file.fileno())  # Ensure data is written to disk
-            
-        # Atomically replace the original file
-        shutil.move(temp_file.name, DATA_FILE)
-        logger.info("💾 Data saved successfully")
+        chat_id = str(update.message.chat.id)
+        user_id = str(update.message.from_user.id)
+        
+        # Check if user is admin
+        if not await admin_cache.is_admin(context.bot, chat_id, user_id):
+            await update.message.reply_text("This command is only available to admins!")
+            return
+        
+        args = [arg.lower() for arg in context.args or []]
+        format = args[0] if args else 'csv'
+        if format not in EXPORT_FORMATS or len(args) > 1:
+            await update.message.reply_text(f"Usage: /export [{'|'.join(EXPORT_FORMATS)}]")
+            return
+        if chat_id in running_exports:
+            await update.message.reply_text("An export of this chat is already running")
+            return
+        
+        running_exports.add(chat_id)
+        try:
+            with tempfile.TemporaryDirectory(prefix='export-') as directory:
+                start = time.perf_counter()
+                # Written by a worker thread; tracking carries on meanwhile
+                paths, rows, months = await asyncio.to_thread(write_chat_export, chat_id, format, directory)
+                if not paths:
+                    await update.message.reply_text("No engagement recorded yet!")
+                    return
+                for part, path in enumerate(paths, 1):
+                    caption = f"📤 {rows} rows over {months} month{'s' if months != 1 else ''}"
+                    if len(paths) > 1:
+                        caption += f" (part {part} of {len(paths)})"
+                    with open(path, 'rb') as f:
+                        # Streamed from disk rather than read into memory
+                        document = InputFile(f, os.path.basename(path), attach=True, read_file_handle=False)
+                        await update.message.reply_document(document, caption=caption, read_timeout=120, write_timeout=120)
+                logger.info(
+                    f"📤 Exported {rows} rows of chat {chat_id} in {len(paths)} files, "
+                    f"{time.perf_counter() - start:.2f}s"
+                )
+        finally:
+            running_exports.discard(chat_id)
         
     except Exception as e:
-        logger.error(f"Error saving data: {e}")
-        if 'temp_file' in locals() and os.path.exists(temp_file.name):
-            os.remove(temp_file.name)  # Clean up temp file on error
+        logger.error(f"Error exporting stats: {e}")
 
-def load_data():
-    """Load engagement data from file with detailed error logging."""
+async def profile_bot(update: Update, context: CallbackContext):
+    """Capture a profile of the running bot, for the users listed in PROFILE_ADMINS."""
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                if not isinstance(data, dict):
-                    raise ValueError("Loaded data is not a dictionary")
-                logger.info(f"📂 Loaded data for {len(data)} chats")
-                return data
-                
-        logger.info("No data file found, starting fresh")
-        return {}
+        if update.message.from_user.id not in PROFILE_ADMINS:
+            await update.message.reply_text("This command is only available to the bot's operators!")
+            return
         
-    except Exception as e:
-        logger.error(f"Error loading data from {DATA_FILE}: {e}")
-        if os.path.exists(DATA_FILE):
-            try:
-                with open(DATA_FILE, 'r') as f:
-                    content = f.read()
-                    logger.error(f"File content (first 100 chars): {content[:100]}...")
-            except Exception as read_error:
-                logger.error(f"Could not read file content: {read_error}")
-        return {}
-
-def check_monthly_reset():
-    """Check and handle monthly reset."""
-    try:
-        current_month = datetime.now().strftime('%Y-%m')
-        
-        # Load current data
-        current_data = load_data()
-        if not current_data:
+        try:
+            seconds = float(context.args[0]) if context.args else PROFILE_SECONDS
+        except ValueError:
+            await update.message.reply_text("Usage: /profile [seconds]")
             return
-            
-        # Load historical data
-        history = {}
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-        
-        # Check if we need to reset
-        data_month = history.get('last_reset', '2000-01')
-        if current_month > data_month:
-            # Save current data to history
-            history['last_reset'] = current_month
-            history[data_month] = current_data
-            
-            # Save history
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(history, f, indent=2)
-            
-            # Reset current data
-            for chat_id in current_data:
-                for user_id in current_data[chat_id]:
-                    current_data[chat_id][user_id].update({
-                        "messages": 0,
-                        "reactions_given": 0,
-                        "reactions_received": 0,
-                        "total_points": 0
-                    })
-            
-            # Save reset data
-            save_data()
-            logger.info(f"Monthly reset performed for {current_month}")
-            
+        seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+        capture = profiler.start(seconds)
+        if capture is None:
+            await update.message.reply_text("A profile is already being captured")
+            return
+        
+        await update.message.reply_text(f"🔬 Profiling for {seconds:.0f}s...")
+        # Reply when done without holding up this chat's updates meanwhile
+        context.application.create_task(report_profile(update.message, capture))
+        
     except Exception as e:
-        logger.error(f"Error in monthly reset: {e}")
+        logger.error(f"Error starting profile: {e}")
 
-def watchdog_function():
-    """Monitor bot activity and restart if necessary."""
-    global watchdog_running
-    
-    if watchdog_running:
+async def report_profile(message, capture):
+    try:
+        path = await capture
+        await message.reply_text(f"🔬 Profile written to {os.path.abspath(path)}")
+    except Exception as e:
+        logger.error(f"Error capturing profile: {e}", exc_info=True)
+
+def write_chat_export(chat_id, format, directory):
+    """Write a chat's current and archived rows to part files in directory.
+
+    Runs in a worker thread. Returns the part paths, the row count and the
+    number of months.
+    """
+    archived = history_months(chat_id)
+    with data_lock:
+        # A chat already moved to the new month by a running rollover counts for it
+        month = rolled_chats.get(chat_id, data_month)
+        live_rows = engagement_data.user_count(chat_id)
+    compress = live_rows * (1 + len(archived)) > EXPORT_GZIP_ROWS
+    writer = ExportWriter(
+        directory, f"engagement-{chat_id}", format, compress, int(EXPORT_PART_MB * 1024 * 1024)
+    )
+    try:
+        for user_id, stats in current_rows(engagement_data, chat_id, data_lock):
+            writer.write(month, user_id, stats)
+        for old_month in archived:
+            for user_id, stats in history_rows(chat_id, old_month):
+                writer.write(old_month, user_id, stats)
+    finally:
+        paths = writer.close()
+    months = (1 if live_rows else 0) + len(archived)
+    return paths, writer.rows, months
+
+def history_rows(chat_id, month):
+    """(user_id, stats) pairs of a chat for an archived month."""
+    if storage is not None:
+        return storage.load_chat(month, chat_id).items()
+    return history_store.iter_users(month, chat_id)
+
+def history_months(chat_id):
+    """Archived months with data for a chat, newest first."""
+    if storage is not None:
+        return [month for month in storage.months(chat_id) if month < data_month]
+    return history_store.months(chat_id)
+
+def history_month(chat_id, month, limit):
+    """Top users, user count and total points of a chat for an archived month."""
+    if storage is not None:
+        user_count, points = storage.summary(chat_id, month)
+        return storage.top(chat_id, month, limit), user_count, points
+    users = history_store.load(month, chat_id)
+    points = sum(data["total_points"] for data in users.values())
+    return list(users.items())[:limit], len(users), points
+
+def stats_period(context):
+    """Window named by a command's argument, None for the month, or False if unknown."""
+    args = context.args or []
+    if not args:
+        return None
+    return STATS_PERIODS.get(args[0].lower(), False)
+
+def count_recent(chat_id, user_id, moment, points=1):
+    """Credit points to the rolling windows on the local day of `moment`.
+
+    Negative points, from removed reactions, are taken back from that day
+    only, never below zero. Caller holds data_lock.
+    """
+    global windows_dirty
+    day = moment.astimezone().date().toordinal() if moment else None
+    window_counters.add(chat_id, user_id, day, points)
+    windows_dirty = True
+
+def top_users(chat_id, limit):
+    """Return the top (user_id, stats) pairs of a chat for the current month."""
+    return [
+        (user_id, engagement_data.get(chat_id, user_id))
+        for user_id in leaderboards.top(chat_id, limit)
+    ]
+
+def snapshot_data(chat_ids):
+    """Copy the given chats, each with its users' names, under the data lock so saves see a consistent state."""
+    with data_lock:
+        return {
+            chat_id: engagement_data.chat_store(chat_id) for chat_id in chat_ids if chat_id in engagement_data
+        }
+
+def write_data(snapshot):
+    """Write each chat of a snapshot to its file in CHAT_DIR and return the bytes written."""
+    written = sum(chat_files.write(chat_id, store) for chat_id, store in snapshot.items())
+    for path in (SNAPSHOT_FILE, DATA_FILE):
+        if os.path.exists(path):
+            # Its chats were all loaded and are in CHAT_DIR now; keep the file for a downgrade
+            os.replace(path, f"{path}.migrated")
+            logger.info(f"📦 Migrated {path} to {CHAT_DIR}")
+    return written
+
+def record_change(kind, chat_id, user_id):
+    """Update the leaderboard and queue the new state of a user's row for the event log.
+
+    Caller holds data_lock.
+    """
+    values = engagement_data.counters(chat_id, user_id)
+    leaderboards.set_points(chat_id, user_id, values[-1])
+    dirty_chats.add(chat_id)
+    event_log.append({
+        "e": kind,
+        "c": chat_id,
+        "u": user_id,
+        "n": engagement_data.username(user_id),
+        "m": rolled_chats.get(chat_id, data_month),
+        "v": values
+    })
+
+def apply_event(data, event):
+    """Apply a logged event to a loaded EngagementStore."""
+    if event["e"] == "offset":
+        return  # Read by load_json_data
+    if event["e"] == "reset":
+        # Monthly rollover of a chat; later events carry the new month's counts
+        data.reset_chat(event["c"])
         return
-        
-    watchdog_running = True
-    logger.info("🔍 Watchdog started")
-    
-    while True:
+    data.set_counters(event["c"], event["u"], event["v"], event["n"])
+
+def collect_pending():
+    """Drain queued events, plus a full snapshot when compaction is due."""
+    global offset_changed, logged_offset
+    with data_lock:
+        if offset_changed:
+            # Saved in the same write as the changes it covers
+            offset, done = logged_offset = finished_update_offset()
+            event = {"e": "offset", "o": offset}
+            if done:
+                event["d"] = done
+            event_log.append(event)
+            offset_changed = False
+        events = event_log.drain()
+        # Compaction would drop the reset markers an interrupted rollover resumes from
+        compact = storage is None and not rollover_running and event_log.compaction_due(len(events))
+        # Chats this flush saves for good: all changed ones in SQLite, in their files on compaction
+        saved = set()
+        if storage is not None or compact:
+            saved = set(dirty_chats)
+            dirty_chats.clear()
+        snapshot = snapshot_data(saved) if compact else None
+        return events, snapshot, logged_offset, saved
+
+def write_rows(events):
+    """Upsert the latest state of every changed row into SQLite, one transaction per month.
+
+    A logged update offset is stored in the same transaction as the last month's rows.
+    """
+    months = {}
+    meta = {}
+    for event in events:
+        if event["e"] == "offset":
+            meta["update_offset"] = str(event["o"])
+            meta["update_offset_done"] = json.dumps(event.get("d", []))
+            continue
+        if event["e"] == "reset":
+            continue
+        stats = {"username": event["n"]}
+        stats.update(zip(COUNTER_FIELDS, event["v"]))
+        months.setdefault(event["m"], {})[(event["c"], event["u"])] = stats
+    if not months:
+        return storage.upsert_rows(data_month, (), meta)
+    last_month = list(months)[-1]
+    return sum(
+        storage.upsert_rows(
+            month,
+            ((chat_id, user_id, stats) for (chat_id, user_id), stats in rows.items()),
+            meta if month == last_month else None
+        )
+        for month, rows in months.items()
+    )
+
+def write_pending(pending):
+    """Append events to the log and compact it into the changed chats' files when due."""
+    events, snapshot, offset, saved = pending
+    if storage is not None:
         try:
-            current_time = time.time()
-            elapsed_time = current_time - last_activity_time
-            
-            # If no activity for more than 5 minutes, restart the bot
-            if elapsed_time > 300:  # 5 minutes
-                logger.error(f"⚠️ Bot appears to be inactive for {elapsed_time:.1f} seconds. Restarting...")
-                
-                # Save data before restarting
-                save_data()
-                
-                # Remove PID file
-                if os.path.exists(PID_FILE):
-                    os.remove(PID_FILE)
-                
-                # Restart the bot
-                restart_bot()
-                return  # Exit this watchdog thread
-            
-            # Sleep for the interval
-            time.sleep(WATCHDOG_INTERVAL)
-            
+            return write_rows(events) + save_windows()
+        except Exception:
+            with data_lock:
+                event_log.requeue(events)
+                dirty_chats.update(saved)
+            raise
+    try:
+        written = event_log.write(events)
+    except Exception:
+        with data_lock:
+            event_log.requeue(events)
+            dirty_chats.update(saved)
+        raise
+    if snapshot is not None:
+        try:
+            event_log.start_compaction()
+            written += write_data(snapshot)
+            # The log with the offset events is deleted next, so keep the offset beside the snapshot
+            written += atomic_write(UPDATE_OFFSET_FILE, offset_file_payload(*offset))
+            event_log.finish_compaction()
+        except Exception:
+            with data_lock:
+                dirty_chats.update(saved)
+            raise
+        logger.info(f"🗜️ Compacted event log into the files of {len(snapshot)} chats")
+    return written + save_windows(force=snapshot is not None)
+
+def save_windows(force=False):
+    """Write the rolling window counters if they changed, at most every WINDOW_SAVE_INTERVAL.
+
+    Returns the bytes written. A failed write is logged and retried with the next flush.
+    """
+    global windows_dirty, windows_saved_at
+    with data_lock:
+        if not windows_dirty:
+            return 0
+        if not force and time.monotonic() - windows_saved_at < WINDOW_SAVE_INTERVAL:
+            return 0
+        snapshot = window_counters.copy()
+        windows_dirty = False
+        windows_saved_at = time.monotonic()
+    try:
+        return write_windows(WINDOWS_FILE, snapshot)
+    except Exception as e:
+        logger.error(f"Error saving {WINDOWS_FILE}: {e}")
+        with data_lock:
+            windows_dirty = True
+        return 0
+
+# Event log for cheap appends; handlers only queue events and mark state dirty
+event_log = EventLog(EVENT_LOG_FILE, COMPACT_INTERVAL, COMPACT_MAX_EVENTS)
+persistence = PersistenceWorker(collect_pending, write_pending, SAVE_INTERVAL, SAVE_MAX_PENDING)
+
+# Instrumentation; handlers are timed by instrument_handlers() in main()
+metrics = MetricsRegistry()
+handler_latency = metrics.histogram(
+    "indexsy_handler_latency_seconds", "Time spent in each update handler", ["handler"]
+)
+errors_logged = metrics.counter(
+    "indexsy_errors_total", "Errors caught and logged, by module and function", ["module", "function"]
+)
+loop_lag = metrics.histogram(
+    "indexsy_event_loop_lag_seconds", "How late the event loop woke up a sleeping task"
+)
+
+def under_data_lock(read):
+    """A metric callback that reads engagement_data or window_counters.
+
+    Callbacks run on the metrics server's thread while the event loop adds
+    and drops chats, so they read under data_lock.
+    """
+    def locked():
+        with data_lock:
+            return read()
+    return locked
+
+metrics.callback(
+    "indexsy_save_total", "Completed persistence flushes", lambda: persistence.stats["flushes"], 'counter'
+)
+metrics.callback(
+    "indexsy_save_errors_total", "Failed persistence flushes", lambda: persistence.stats["errors"], 'counter'
+)
+metrics.callback(
+    "indexsy_save_seconds_total", "Time spent writing data", lambda: persistence.stats["total_duration"], 'counter'
+)
+metrics.callback(
+    "indexsy_save_bytes_total", "Bytes written by persistence flushes", lambda: persistence.stats["total_bytes"], 'counter'
+)
+metrics.callback(
+    "indexsy_save_last_seconds", "Duration of the last flush", lambda: persistence.stats["last_duration"]
+)
+metrics.callback(
+    "indexsy_save_last_bytes", "Size of the last flush", lambda: persistence.stats["last_bytes"]
+)
+metrics.callback(
+    "indexsy_save_pending_changes", "Changes waiting for the next flush", lambda: persistence.pending
+)
+metrics.callback(
+    "indexsy_engagement_chats", "Chats in memory", under_data_lock(lambda: len(engagement_data))
+)
+metrics.callback(
+    "indexsy_engagement_users", "User rows in memory", under_data_lock(lambda: engagement_data.user_count())
+)
+metrics.callback(
+    "indexsy_engagement_bytes", "Memory used by the counters of the chats in memory",
+    under_data_lock(lambda: engagement_data.nbytes())
+)
+metrics.callback(
+    "indexsy_chat_loads_total", "Chats loaded into memory from disk", lambda: resident_chats.loads, 'counter'
+)
+metrics.callback(
+    "indexsy_chat_evictions_total", "Chats saved and dropped from memory",
+    lambda: resident_chats.evictions, 'counter'
+)
+metrics.callback(
+    "indexsy_window_users", "User rows in the rolling leaderboards",
+    under_data_lock(lambda: window_counters.user_count())
+)
+metrics.callback(
+    "indexsy_window_bytes", "Memory used by the rolling leaderboards",
+    under_data_lock(lambda: window_counters.nbytes())
+)
+metrics.callback(
+    "indexsy_sender_index_resident_bytes", "Memory-mapped bytes of the message author index",
+    lambda: message_senders.stats()["resident_bytes"]
+)
+metrics.callback(
+    "indexsy_sender_index_resident_chats", "Chats with a mapped message author index",
+    lambda: message_senders.stats()["resident_chats"]
+)
+metrics.callback(
+    "indexsy_sender_index_lookups_total", "Message author lookups by result",
+    lambda: {("hit",): message_senders.hits, ("miss",): message_senders.misses}, 'counter', ["result"]
+)
+metrics.callback(
+    "indexsy_log_records_dropped_total", "Log records not written, by reason",
+    lambda: {("sampled",): log_pipeline.sampler.dropped, ("queue_full",): log_pipeline.handler.dropped},
+    'counter', ["reason"]
+)
+metrics.callback(
+    "indexsy_admin_cache_lookups_total", "Admin status lookups by result",
+    lambda: {("hit",): admin_cache.hits, ("miss",): admin_cache.misses}, 'counter', ["result"]
+)
+
+def component_sizes():
+    """Memory the large in-memory structures account for, for profile reports."""
+    return {
+        "engagement_data": engagement_data.nbytes(),
+        "window_counters": window_counters.nbytes(),
+        "message_senders (memory-mapped)": message_senders.stats()["resident_bytes"],
+    }
+
+profiler = Profiler(PROFILE_DIR, PROFILE_SECONDS, sizes=component_sizes)
+
+# Event loop and polling health; see handle_stall()
+liveness = LivenessMonitor(LOOP_STALL_TIMEOUT, POLL_STALL_TIMEOUT, LOOP_LAG_INTERVAL)
+metrics.callback(
+    "indexsy_heartbeat_age_seconds", "Seconds since the event loop heartbeat last ran", liveness.beat_age
+)
+metrics.callback(
+    "indexsy_polling_success_age_seconds", "Seconds since the last successful getUpdates", liveness.poll_age
+)
+metrics.callback(
+    "indexsy_polling_failures_total", "Failed getUpdates round-trips", lambda: liveness.poll_failures, 'counter'
+)
+metrics.callback(
+    "indexsy_duplicate_updates_total", "Updates skipped because they were already processed",
+    lambda: catch_up_stats["skipped"], 'counter'
+)
+metrics.callback(
+    "indexsy_catch_up_updates", "Updates fetched while catching up at startup", lambda: catch_up_stats["updates"]
+)
+metrics.callback(
+    "indexsy_catch_up_seconds", "Time spent catching up at startup", lambda: catch_up_stats["seconds"]
+)
+heartbeat_task = None
+
+async def catch_up(app):
+    """Process the updates that arrived while the bot was down, then save once.
+
+    Runs before polling starts. Updates are processed one at a time without
+    per-message logging, updates already counted before the restart are
+    skipped, and the persistence worker is not running yet, so all changes
+    go to disk in a single flush at the end.
+    """
+    start = time.perf_counter()
+    log_level = logger.level
+    processed = 0
+    skipped = catch_up_stats["skipped"]
+    try:
+        logger.setLevel(logging.WARNING)
+        await app.bot.delete_webhook()  # getUpdates is refused while a webhook is set
+        offset = resume_update_id + 1 if resume_update_id else None
+        while True:
+            updates = await app.bot.get_updates(
+                offset=offset, limit=CATCH_UP_BATCH, timeout=0,
+                allowed_updates=app.bot_data.get("allowed_updates")
+            )
+            if not updates:
+                break  # This call also confirmed everything before offset
+            for update in updates:
+                await app.process_update(update)
+            processed += len(updates)
+            offset = updates[-1].update_id + 1
+    finally:
+        logger.setLevel(log_level)
+        save_data()
+
+    elapsed = time.perf_counter() - start
+    skipped = catch_up_stats["skipped"] - skipped
+    catch_up_stats.update(updates=processed, seconds=elapsed)
+    if processed:
+        logger.info(
+            f"⏩ Caught up on {processed - skipped} updates ({skipped} already counted) "
+            f"in {elapsed:.2f}s, {processed / elapsed:.0f} updates/s"
+        )
+
+async def post_init(app):
+    """Catch up on missed updates, then start background work."""
+    global heartbeat_task
+    heartbeat_task = asyncio.create_task(liveness.heartbeat(loop_lag.observe))
+    try:
+        if BOT_MODE != 'webhook':
+            await catch_up(app)
+    except Exception as e:
+        logger.error(f"Error catching up on missed updates: {e}", exc_info=True)
+    # Start the background writer
+    persistence.start()
+    # kill -USR1 <pid> captures a profile
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.start)
+
+async def post_stop(app):
+    # Finish the updates already handed to the scheduler while replies can still be sent
+    if isinstance(app.update_processor, ChatUpdateProcessor):
+        await app.update_processor.join()
+    if heartbeat_task is not None:
+        heartbeat_task.cancel()
+
+def save_data():
+    """Flush pending engagement data to disk right away."""
+    persistence.flush()
+
+def load_snapshot():
+    """Load the single snapshot of all chats older versions kept, or their JSON file.
+
+    Returns an empty store when there is neither. Raises SnapshotError when
+    the file exists but can't be read, rather than starting from nothing
+    and compacting over it.
+    """
+    start = time.perf_counter()
+    if os.path.exists(SNAPSHOT_FILE):
+        data = read_snapshot(SNAPSHOT_FILE)
+        source = SNAPSHOT_FILE
+    elif os.path.exists(DATA_FILE):
+        try:
+            with open(DATA_FILE, 'r') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("Loaded data is not a dictionary")
+            data = EngagementStore.from_dict(data)
         except Exception as e:
-            logger.error(f"Error in watchdog: {e}")
-            time.sleep(WATCHDOG_INTERVAL)  # Sleep even on error
+            raise SnapshotError(f"{DATA_FILE} is unreadable: {e}") from e
+        source = DATA_FILE
+    else:
+        return EngagementStore()
+    logger.info(
+        f"📂 Loaded data for {len(data)} chats, {data.user_count()} users from {source} "
+        f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    return data
 
-def restart_bot():
-    """Restart the bot process."""
+def load_windows():
+    """Load the rolling window counters; an unreadable file is moved aside."""
+    if not os.path.exists(WINDOWS_FILE):
+        return WindowCounters()
     try:
-        logger.info("🔄 Restarting bot...")
+        counters = read_windows(WINDOWS_FILE)
+        logger.info(f"📂 Loaded recent points of {counters.user_count()} users in {len(counters)} chats")
+        return counters
+    except (SnapshotError, OSError) as e:
+        # Only the rolling leaderboards depend on it; monthly counts are unaffected
+        corrupt_file = f"{WINDOWS_FILE}.corrupt-{int(time.time())}"
+        os.replace(WINDOWS_FILE, corrupt_file)
+        logger.error(f"Error loading {WINDOWS_FILE}: {e}. Moved it to {corrupt_file}")
+        return WindowCounters()
+
+def load_data():
+    """Load what the current month's engagement data needs at startup from the configured storage.
+
+    That is only the chats changed since the last compaction (JSON) or none
+    (SQLite); the others are loaded by load_chat() when first used.
+    """
+    data = load_sqlite_data() if storage is not None else load_json_data()
+    for chat_id in data.chats():
+        resident_chats.touch(chat_id)
+    return data
+
+def read_chat(chat_id):
+    """A chat's saved counters as a store holding just that chat, or None if it has none."""
+    if storage is not None:
+        users = storage.load_chat(rolled_chats.get(chat_id, data_month), chat_id)
+        return EngagementStore.from_dict({chat_id: users}) if users else None
+    return chat_files.read(chat_id)
+
+def load_chat(chat_id):
+    """Load a chat into engagement_data unless it's there already; returns whether it was read.
+
+    Reads without holding data_lock, so it can run in a worker thread.
+    """
+    with data_lock:
+        if chat_id in engagement_data:
+            return False
+    with chat_files_lock:
+        stored = read_chat(chat_id)
+        with data_lock:
+            if stored is None or chat_id in engagement_data:
+                return False
+            engagement_data.add_chat(chat_id, stored)
+            leaderboards.rebuild_chat(chat_id, engagement_data.points(chat_id))
+            resident_chats.touch(chat_id)
+            resident_chats.loads += 1
+    return True
+
+def set_resume_offset(update_id, done=()):
+    """Continue counting after the last update whose changes were saved.
+
+    `done` are the updates after it that were saved too, and get skipped.
+    """
+    global last_update_id, resume_update_id, offset_changed, logged_offset
+    done = sorted(done)
+    resume_update_id = update_id
+    last_update_id = max([update_id, *done])
+    offset_changed = False
+    logged_offset = (update_id, done)
+    recent_update_ids.update(dict.fromkeys(done))
+    if update_id:
+        logger.info(f"⏯️ Resuming after update {update_id}" + (f" and {len(done)} later ones" if done else ""))
+
+def load_sqlite_data():
+    """Load the current month's rows from the SQLite store."""
+    global data_month
+    try:
+        month = storage.get_meta('last_reset')
+        if month is None:
+            month = datetime.now().strftime('%Y-%m')
+            storage.set_meta('last_reset', month)
+        data_month = month
+        set_resume_offset(
+            int(storage.get_meta('update_offset', 0)), json.loads(storage.get_meta('update_offset_done', '[]'))
+        )
+        logger.info(f"📂 Using {SQLITE_FILE} ({month}); chats are loaded on first use")
+        return EngagementStore()
+    except Exception as e:
+        logger.error(f"Error loading data from {SQLITE_FILE}: {e}")
+        return EngagementStore()
+
+def load_json_data():
+    """Replay the event log over the files of the chats it touches.
+
+    Only those chats are loaded. An older single snapshot is loaded whole
+    instead, and split into CHAT_DIR by the first compaction.
+    """
+    global data_month
+    try:
+        if history_store.last_reset is None:
+            history_store.last_reset = datetime.now().strftime('%Y-%m')
+            history_store.save_index()
+        data_month = history_store.last_reset
+    except Exception as e:
+        logger.error(f"Error reading {HISTORY_DIR} index: {e}")
+    
+    data = load_snapshot()
+    if len(data):
+        dirty_chats.update(data.chats())
+        event_log.force_compaction()
+    offset, done = 0, []
+    try:
+        if os.path.exists(UPDATE_OFFSET_FILE):
+            with open(UPDATE_OFFSET_FILE, 'r') as f:
+                saved = json.load(f)
+            offset, done = saved["update_id"], saved.get("done", [])
+    except Exception as e:
+        logger.error(f"Error reading {UPDATE_OFFSET_FILE}: {e}")
+    replayed = 0
+    replayed_chats = set()
+    try:
+        for event in event_log.replay():
+            chat_id = event.get("c")
+            if chat_id is not None and chat_id not in replayed_chats:
+                # Its saved state first; the log's newer rows are written back by the next compaction
+                if chat_id not in data:
+                    stored = chat_files.read(chat_id)
+                    if stored is not None:
+                        data.add_chat(chat_id, stored)
+                replayed_chats.add(chat_id)
+            apply_event(data, event)
+            if event["e"] == "reset":
+                replayed_resets.add((event["m"], event["c"]))
+            elif event["e"] == "offset" and event["o"] >= offset:
+                offset, done = event["o"], event.get("d", [])
+            replayed += 1
+    except SnapshotError:
+        raise
+    except Exception as e:
+        logger.error(f"Error replaying {EVENT_LOG_FILE}: {e}")
+    dirty_chats.update(replayed_chats)
+    if replayed:
+        logger.info(f"📜 Replayed {replayed} events of {len(replayed_chats)} chats from {EVENT_LOG_FILE}")
+    set_resume_offset(offset, done)
+    return data
+
+def load_all_json_data():
+    """load_json_data() plus every chat only in CHAT_DIR, for tools that need all chats at once."""
+    data = load_json_data()
+    for chat_id in chat_files.chats():
+        if chat_id not in data:
+            data.add_chat(chat_id, chat_files.read(chat_id))
+    return data
+
+async def check_monthly_reset(context: CallbackContext = None):
+    """Roll the live counters over to a new month once the calendar month changes.
+
+    Runs from the job queue. Chats are archived and reset one by one, yielding
+    to the event loop between batches, so message handling continues while a
+    large rollover runs. Safe to run again at any time: it only acts when the
+    month has changed and resumes an interrupted rollover.
+    """
+    global data_month, rollover_running
+    if rollover_running:
+        return
+    new_month = history_store.pending_rollover if storage is None else None
+    new_month = new_month or datetime.now().strftime('%Y-%m')
+    if new_month <= data_month:
+        return
+    
+    old_month = data_month
+    rollover_running = True
+    start = time.perf_counter()
+    try:
+        chats = engagement_data.chats()
+        if storage is None:
+            # Chats not in memory are rolled over in their files without loading them.
+            # In SQLite their new month starts out empty, so they're left where they are.
+            chats += [chat_id for chat_id in chat_files.chats() if chat_id not in engagement_data]
+        logger.info(f"📅 Rolling {len(chats)} chats over from {old_month} to {new_month}")
+        if storage is None:
+            history_store.pending_rollover = new_month
+            await asyncio.to_thread(history_store.save_index)
         
-        # Get the path to the current script
-        script_path = os.path.abspath(__file__)
+        count = 0
+        while chats:
+            for chat_id in chats:
+                count += 1
+                if storage is None:
+                    rolled = await asyncio.to_thread(rollover_chat_file, chat_id, old_month, new_month)
+                    if not rolled:
+                        # In memory, or loaded since the list was made
+                        await rollover_chat_json(chat_id, old_month, new_month)
+                else:
+                    await rollover_chat_sqlite(chat_id, new_month)
+                if count % ROLLOVER_BATCH == 0:
+                    if storage is None:
+                        await asyncio.to_thread(history_store.save_index)
+                    await asyncio.sleep(0)
+            # SQLite chats first used meanwhile were loaded with their old month's rows
+            chats = [] if storage is None else [
+                chat_id for chat_id in engagement_data.chats() if chat_id not in rolled_chats
+            ]
         
-        # Start a new process
-        subprocess.Popen([sys.executable, script_path])
+        # Everything is archived; make the new month official
+        await asyncio.to_thread(save_data)
+        with data_lock:
+            data_month = new_month
+            rolled_chats.clear()
+        if storage is None:
+            history_store.last_reset = new_month
+            history_store.pending_rollover = None
+            await asyncio.to_thread(history_store.save_index)
+            event_log.force_compaction()
+        else:
+            await asyncio.to_thread(storage.set_meta, 'last_reset', new_month)
+        replayed_resets.clear()
+        logger.info(
+            f"Monthly reset performed for {new_month} in {time.perf_counter() - start:.2f}s"
+        )
         
-        # Exit the current process
-        os._exit(0)
+    except Exception as e:
+        logger.error(f"Error in monthly reset: {e}", exc_info=True)
         
+    finally:
+        rollover_running = False
+        persistence.mark_dirty()
+
+async def rollover_chat_json(chat_id, old_month, new_month):
+    """Archive one chat's month to its history shard, then reset its counters."""
+    if (new_month, chat_id) in replayed_resets:
+        # Already rolled over before a restart, maybe before the index listing its shard was saved
+        if history_store.has_shard(old_month, chat_id):
+            history_store.add_to_index(old_month, chat_id)
+        rolled_chats[chat_id] = new_month
+        return
+    
+    with data_lock:
+        archived = engagement_data.export_chat(chat_id)
+    # Written off the event loop; messages arriving meanwhile belong to the new month
+    await asyncio.to_thread(history_store.archive_chat, old_month, chat_id, archived)
+    
+    with data_lock:
+        event_log.append({"e": "reset", "c": chat_id, "m": new_month})
+        dirty_chats.add(chat_id)
+        rolled_chats[chat_id] = new_month
+        for user_id in engagement_data.users(chat_id):
+            old = archived.get(user_id)
+            if old is None:
+                record_change("rollover", chat_id, user_id)
+                continue
+            values = [
+                value - old[field]
+                for field, value in zip(COUNTER_FIELDS, engagement_data.counters(chat_id, user_id))
+            ]
+            engagement_data.set_counters(chat_id, user_id, values)
+            if values[-1]:
+                record_change("rollover", chat_id, user_id)
+        leaderboards.rebuild_chat(chat_id, engagement_data.points(chat_id))
+
+def rollover_chat_file(chat_id, old_month, new_month):
+    """Archive and reset a chat that is only in its file, without loading it.
+
+    Runs in a worker thread. Returns False, leaving the chat alone, if it
+    is in memory. Holds chat_files_lock so the chat can't be loaded from
+    the file while it is replaced. The reset marker is saved to the event
+    log before the file is reset, so after a crash the replay finds it and
+    a resumed rollover doesn't archive the chat again.
+    """
+    with chat_files_lock:
+        with data_lock:
+            if chat_id in engagement_data:
+                return False
+        stored = chat_files.read(chat_id)
+        if stored is not None:
+            history_store.archive_chat(old_month, chat_id, stored.export_chat(chat_id))
+            with data_lock:
+                event_log.append({"e": "reset", "c": chat_id, "m": new_month})
+            if not persistence.flush(force=True):
+                raise RuntimeError(f"Couldn't save the reset of chat {chat_id}")
+            stored.reset_chat(chat_id)
+            chat_files.write(chat_id, stored)
+        with data_lock:
+            rolled_chats[chat_id] = new_month
+    return True
+
+async def rollover_chat_sqlite(chat_id, new_month):
+    """Reset one chat's counters; its old month rows stay in SQLite as history."""
+    # Counts this chat already has in the new month if an earlier run was interrupted
+    fresh = await asyncio.to_thread(storage.load_chat, new_month, chat_id)
+    with data_lock:
+        rolled_chats[chat_id] = new_month
+        engagement_data.reset_chat(chat_id)
+        for user_id, stats in fresh.items():
+            if engagement_data.has(chat_id, user_id):
+                engagement_data.set_counters(
+                    chat_id, user_id, [stats[field] for field in COUNTER_FIELDS]
+                )
+        leaderboards.rebuild_chat(chat_id, engagement_data.points(chat_id))
+
+def seconds_until_next_month():
+    """Seconds from now until local midnight on the first of next month."""
+    now = datetime.now()
+    first_of_next = (now.replace(day=1) + timedelta(days=32)).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    return (first_of_next - now).total_seconds()
+
+async def monthly_rollover_job(context: CallbackContext):
+    """Run the rollover and schedule the next one for the following month boundary."""
+    await check_monthly_reset(context)
+    if data_month < datetime.now().strftime('%Y-%m'):
+        delay = 600  # Rollover failed; try again shortly
+    else:
+        delay = seconds_until_next_month() + 1
+    context.job_queue.run_once(monthly_rollover_job, delay, name="monthly_rollover")
+
+def seconds_until_tomorrow():
+    """Seconds from now until local midnight."""
+    now = datetime.now()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+async def daily_windows_job(context: CallbackContext):
+    """Move every chat's rolling windows to the new day, dropping users without recent points.
+
+    Chats advance lazily on their next point or query anyway; this keeps the
+    work off the first message of the day and bounds memory to recent users.
+    """
+    global windows_dirty
+    try:
+        start = time.perf_counter()
+        dropped = 0
+        for count, chat_id in enumerate(window_counters.chats(), 1):
+            with data_lock:
+                dropped += window_counters.advance(chat_id)
+                windows_dirty = True
+            if count % ROLLOVER_BATCH == 0:
+                await asyncio.sleep(0)
+        persistence.mark_dirty()
+        logger.info(
+            f"🗓️ Advanced rolling windows of {len(window_counters)} chats, dropped {dropped} "
+            f"inactive users in {time.perf_counter() - start:.2f}s"
+        )
+    except Exception as e:
+        logger.error(f"Error advancing rolling windows: {e}", exc_info=True)
+    context.job_queue.run_once(daily_windows_job, seconds_until_tomorrow() + 1, name="daily_windows")
+
+def start_eviction():
+    """Run evict_chats() in the background unless it's running already."""
+    global eviction_task
+    if eviction_task is None or eviction_task.done():
+        eviction_task = asyncio.get_running_loop().create_task(evict_chats())
+
+async def evict_chats():
+    """Drop idle chats from memory, and the least recently used ones while over CHAT_MEMORY_MB.
+
+    Chats with unsaved changes are written to their files first, and a save
+    in progress is waited for. Chats used again meanwhile stay, and nothing
+    is dropped during a monthly rollover.
+    """
+    if rollover_running:
+        return
+    try:
+        start = time.perf_counter()
+        with data_lock:
+            picked = resident_chats.candidates(engagement_data.nbytes(), engagement_data.nbytes)
+            unsaved = any(chat_id in dirty_chats for chat_id, _ in picked)
+        if not picked:
+            return
+        if unsaved and storage is None:
+            event_log.force_compaction()
+        # Even with nothing unsaved: a flush that took a chat out of dirty_chats may still be
+        # writing it, and flush() waits for that before this one is done
+        await asyncio.to_thread(persistence.flush, unsaved)
+
+        evicted = 0
+        with data_lock:
+            for chat_id, used in picked:
+                if rollover_running or chat_id in dirty_chats or resident_chats.last_used(chat_id) != used:
+                    continue
+                engagement_data.drop_chat(chat_id)
+                leaderboards.drop_chat(chat_id)
+                resident_chats.forget(chat_id)
+                evicted += 1
+            resident_chats.evictions += evicted
+            names = len(engagement_data.parts()[1])
+            if names > 2 * engagement_data.user_count():
+                names -= engagement_data.prune_names()
+        logger.info(
+            f"🧹 Evicted {evicted} chats in {time.perf_counter() - start:.2f}s; {len(engagement_data)} chats, "
+            f"{names} names and {engagement_data.nbytes() / 1024 / 1024:.1f} MiB in memory"
+        )
     except Exception as e:
-        logger.error(f"Failed to restart bot: {e}")
+        logger.error(f"Error evicting chats: {e}", exc_info=True)
+
+async def evict_chats_job(context: CallbackContext):
+    """Look for chats to evict every CHAT_EVICT_INTERVAL seconds."""
+    start_eviction()
+
+def migrate_legacy_history():
+    """Split the old single-file history into per-month shards once."""
+    try:
+        if os.path.exists(HISTORY_FILE) and not history_store.exists():
+            history_store.migrate_legacy(HISTORY_FILE)
+    except Exception as e:
+        logger.error(f"Error migrating {HISTORY_FILE}: {e}")
+
+def handle_stall(problems):
+    """Called from the liveness thread once the bot is stuck."""
+    logger.error(f"⚠️ Bot is stalled: {'; '.join(problems)}")
+
+    # Save what we can; the event loop may be holding the data lock
+    saver = threading.Thread(target=save_data, daemon=True)
+    saver.start()
+    saver.join(10)
+    if os.path.exists(PID_FILE):
+        os.remove(PID_FILE)
+
+    if systemd_watchdog_interval() is not None:
+        # Pings have stopped; systemd kills and restarts the service after WatchdogSec
+        logger.error("Waiting for the systemd watchdog to restart the bot")
+    else:
+        # The loop cannot run a clean shutdown; exit so the supervisor restarts us
+        logger.error("Exiting so the service manager restarts the bot")
+        log_pipeline.stop()
+        logging.shutdown()
+        os._exit(1)
 
 def check_single_instance():
     """Ensure only one instance of the bot is running."""
@@ -436,45 +1566,396 @@ def check_single_instance():
         logger.error(f"Error checking single instance: {e}")
         sys.exit(1)
 
+def allowed_update_types():
+    """Update types the handlers need from Telegram."""
+    allowed_updates = ["message"]
+    if REACTION_MODE != 'count':
+        allowed_updates.append("message_reaction")
+    if REACTION_MODE in ('count', 'both'):
+        allowed_updates.append("message_reaction_count")
+    if TRACK_CHAT_MEMBERS:
+        allowed_updates.append("chat_member")
+    return allowed_updates
+
+def add_handlers(app):
+    """Register the bot's handlers and return the update types they need."""
+    app.add_handler(TypeHandler(Update, load_update_chat), group=-1)
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("stats", show_stats))
+    app.add_handler(CommandHandler("rank", show_rank))
+    app.add_handler(CommandHandler("statsadmin", show_admin_stats))
+    app.add_handler(CommandHandler("history", show_history))
+    app.add_handler(CommandHandler("export", export_stats))
+    if PROFILE_ADMINS:
+        app.add_handler(CommandHandler("profile", profile_bot))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track_message))
+    if REACTION_MODE != 'count':
+        app.add_handler(ReactionHandler(track_reaction))
+    if REACTION_MODE in ('count', 'both'):
+        app.add_handler(ReactionHandler(track_reaction_count, 'message_reaction_count'))
+    if TRACK_CHAT_MEMBERS:
+        app.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.CHAT_MEMBER))
+    return allowed_update_types()
+
+def add_update_tracking(app):
+    """Skip already processed updates and record the offset of handled ones."""
+    app.add_handler(TypeHandler(Update, skip_processed_update), group=-2)
+    app.add_handler(TypeHandler(Update, record_update_id), group=1)
+
+def load_state():
+    """Load the counters, rolling windows and leaderboards.
+
+    Exits the process if the snapshot can't be read.
+    """
+    global engagement_data, window_counters
+    if storage is None:
+        migrate_legacy_history()
+    try:
+        engagement_data = load_data()
+    except SnapshotError as e:
+        # Exit before the shutdown flush could write an empty snapshot over it
+        logger.critical(
+            f"❌ {e}. Restore it from a backup, or move it aside to start "
+            f"from {EVENT_LOG_FILE} alone"
+        )
+        if os.path.exists(PID_FILE):
+            os.remove(PID_FILE)
+        log_pipeline.stop()
+        logging.shutdown()
+        os._exit(1)
+    window_counters = load_windows()
+    start = time.perf_counter()
+    leaderboards.rebuild(engagement_data)
+    logger.info(f"🏆 Built leaderboards in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+def build_application(get_updates_request=None):
+    """Create the Application with its handlers, metrics and scheduled jobs."""
+    global update_processor
+    builder = Application.builder().token(BOT_TOKEN).post_init(post_init).post_stop(post_stop)
+    if BOT_API_BASE_URL:
+        builder.base_url(f"{BOT_API_BASE_URL}/bot").base_file_url(f"{BOT_API_BASE_URL}/file/bot")
+    # Chats run in parallel, each in order; a full scheduler holds back polling or the webhook
+    update_processor = ChatUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES)
+    builder.concurrent_updates(update_processor)
+    builder.update_queue(asyncio.Queue(MAX_PENDING_UPDATES))
+    if get_updates_request is not None:
+        builder.get_updates_request(get_updates_request)
+    app = builder.build()
+
+    # Add handlers
+    allowed_updates = add_handlers(app)
+    add_update_tracking(app)
+    app.bot_data["allowed_updates"] = allowed_updates
+    instrument_handlers(app, handler_latency)
+
+    # Expose metrics
+    logging.getLogger().addHandler(ErrorCounter(errors_logged))
+    if METRICS_PORT:
+        metrics.callback(
+            "indexsy_update_queue_depth", "Updates received but not yet processed",
+            app.update_queue.qsize
+        )
+        scheduler = app.update_processor
+        metrics.callback(
+            "indexsy_scheduler_pending_updates", "Updates queued or running in the per-chat scheduler",
+            lambda: scheduler.pending
+        )
+        metrics.callback(
+            "indexsy_scheduler_active_chats", "Chats with queued or running updates",
+            lambda: scheduler.active_chats
+        )
+        metrics.callback(
+            "indexsy_scheduler_full_total", "Times the scheduler was full and held back new updates",
+            lambda: scheduler.waits, 'counter'
+        )
+        MetricsServer(metrics, METRICS_HOST, METRICS_PORT).start()
+
+    # Catch up on a missed or interrupted rollover now, then run at each month boundary
+    app.job_queue.run_once(monthly_rollover_job, 0, name="monthly_rollover")
+    app.job_queue.run_once(daily_windows_job, seconds_until_tomorrow() + 1, name="daily_windows")
+    app.job_queue.run_repeating(evict_chats_job, CHAT_EVICT_INTERVAL, name="evict_chats")
+    return app
+
+def close_state():
+    """Flush pending changes and fold the log into a snapshot before exit."""
+    event_log.force_compaction()
+    persistence.stop()
+    save_windows(force=True)
+    if storage is not None:
+        storage.close()
+    logger.info(f"Sender index stats: {message_senders.stats()}")
+    logger.info(f"Admin cache stats: {admin_cache.stats()}")
+    message_senders.close()
+
 def main():
+    log_pipeline.start()
     try:
         # Ensure single instance
         check_single_instance()
         
         # Load existing data
-        global engagement_data
-        engagement_data = load_data()
+        load_state()
+        if REACTION_MODE == 'count':
+            logger.warning(
+                "⚠️ REACTION_MODE=count credits no reactions: Telegram only sends totals for "
+                "channel posts, whose authors aren't recorded. Use user or both."
+            )
         
         # Set up application
-        app = Application.builder().token(BOT_TOKEN).build()
-        
-        # Add handlers
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(CommandHandler("stats", show_stats))
-        app.add_handler(CommandHandler("statsadmin", show_admin_stats))
-        app.add_handler(CommandHandler("history", show_history))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track_message))
-        app.add_handler(ReactionHandler(track_reaction, block=False))
-        
-        # Start the watchdog in a separate thread
-        watchdog_thread = threading.Thread(target=watchdog_function, daemon=True)
-        watchdog_thread.start()
-        
-        # Update activity timestamp at startup
-        update_activity_timestamp()
-        
-        logger.info("🚀 Bot starting...")
-        app.run_polling(
-            allowed_updates=["message", "message_reaction"],
-            drop_pending_updates=True
-        )
+        polling_request = None
+        if BOT_MODE != 'webhook':
+            liveness.watch_polling()
+            polling_request = PollingHealthRequest(liveness)
+        app = build_application(polling_request)
+        
+        # Watch for a blocked event loop or stuck polling, and keep systemd's watchdog fed
+        liveness.start(handle_stall, systemd_watchdog_interval() or WATCHDOG_INTERVAL)
+
+        if BOT_MODE == 'webhook':
+            if not WEBHOOK_URL:
+                raise ValueError("BOT_MODE=webhook needs WEBHOOK_URL")
+            webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}"
+            logger.info(f"🚀 Bot starting (webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, {webhook_url})...")
+            app.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=webhook_url,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=app.bot_data["allowed_updates"],
+                drop_pending_updates=False
+            )
+        else:
+            logger.info("🚀 Bot starting...")
+            app.run_polling(
+                allowed_updates=app.bot_data["allowed_updates"],
+                drop_pending_updates=False
+            )
         
     except Exception as e:
         logger.error(f"Error in main: {e}", exc_info=True)
         
     finally:
-        # Save data before exit
-        save_data()
+        liveness.stop()
+        close_state()
+        logger.info(f"Log pipeline stats: {log_pipeline.stats()}")
+        log_pipeline.stop()
+
+def split_into_shards(router):
+    """Move single-process data into the shard directories on the first sharded start.
+
+    Counters and the update offset (chat files plus event log), the rolling
+    windows and the archived months are divided by chat, and the original
+    files are moved to SHARD_DIR/unsharded. The message author index is not
+    carried over, so reactions to messages from before the split aren't
+    credited. SQLite data isn't split.
+    """
+    if storage is not None:
+        if os.path.isabs(SQLITE_FILE):
+            raise ValueError("Each shard needs its own database; set SQLITE_FILE to a relative path")
+        if storage.get_meta('last_reset') is not None:
+            raise ValueError(f"Splitting {SQLITE_FILE} into shards isn't supported; start from an empty database")
+        return
+    sources = [
+        CHAT_DIR, SNAPSHOT_FILE, DATA_FILE, EVENT_LOG_FILE, UPDATE_OFFSET_FILE, WINDOWS_FILE, HISTORY_FILE, HISTORY_DIR
+    ]
+    sources = [path for path in sources if os.path.exists(path)]
+    if not sources:
+        return
+    migrate_legacy_history()
+    if history_store.pending_rollover:
+        raise ValueError("A monthly rollover is unfinished; run once without SHARDS to complete it first")
+
+    start = time.perf_counter()
+    data = load_all_json_data()
+    chats, directory = data.parts()
+    windows = load_windows().parts()
+    months = history_store.index["months"]
+    for index in range(router.shards):
+        path = router.shard_directory(index)
+        os.makedirs(path, exist_ok=True)
+        owned = {chat_id for chat_id in chats if shard_of(chat_id, router.shards) == index}
+        # A single snapshot, which the worker splits into its CHAT_DIR on its first compaction
+        write_snapshot(
+            os.path.join(path, SNAPSHOT_FILE),
+            EngagementStore.from_parts({chat_id: chats[chat_id] for chat_id in owned}, directory)
+        )
+        atomic_write(os.path.join(path, UPDATE_OFFSET_FILE), offset_file_payload(*logged_offset))
+        write_windows(os.path.join(path, WINDOWS_FILE), WindowCounters.from_parts({
+            chat_id: chat for chat_id, chat in windows.items() if shard_of(chat_id, router.shards) == index
+        }))
+        shard_history = HistoryStore(os.path.join(path, HISTORY_DIR))
+        shard_history.last_reset = history_store.last_reset
+        for month, month_chats in months.items():
+            for chat_id in month_chats:
+                if shard_of(chat_id, router.shards) == index:
+                    shard_history.archive_chat(month, chat_id, history_store.load(month, chat_id))
+        shard_history.save_index()
+
+    unsharded = os.path.join(SHARD_DIR, 'unsharded')
+    os.makedirs(unsharded, exist_ok=True)
+    for path in sources:
+        os.replace(path, os.path.join(unsharded, path))
+    logger.info(
+        f"🧩 Split {len(chats)} chats into {router.shards} shards in "
+        f"{time.perf_counter() - start:.2f}s; the originals are in {unsharded}"
+    )
+
+def prepare_shards(router):
+    """Make sure SHARD_DIR is split for SHARDS workers, splitting existing data on first start."""
+    layout_path = os.path.join(SHARD_DIR, SHARD_LAYOUT_FILE)
+    if os.path.exists(layout_path):
+        with open(layout_path, 'r') as f:
+            shards = json.load(f)["shards"]
+        if shards != router.shards:
+            raise ValueError(
+                f"{SHARD_DIR} is split into {shards} shards but SHARDS={router.shards}; "
+                f"changing the number of shards isn't supported"
+            )
+        return
+    split_into_shards(router)
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    atomic_write(layout_path, json.dumps({"shards": router.shards}).encode('utf-8'))
+
+def handle_front_stall(problems):
+    """Called from the liveness thread once the front is stuck; workers save and exit on their own."""
+    logger.error(f"⚠️ Front is stalled: {'; '.join(problems)}. Exiting so the service manager restarts the bot")
+    log_pipeline.stop()
+    logging.shutdown()
+    os._exit(1)
+
+async def run_router(router):
+    """Poll Telegram and route updates until SIGTERM or a worker exits. Returns the exit status."""
+    front_metrics = MetricsRegistry()
+    front_metrics.callback(
+        "indexsy_shard_updates_total", "Updates handed to each shard worker",
+        lambda: {(str(index),): count for index, count in enumerate(router.routed)}, 'counter', ["shard"]
+    )
+    front_metrics.callback(
+        "indexsy_polling_success_age_seconds", "Seconds since the last successful getUpdates", liveness.poll_age
+    )
+    front_metrics.callback(
+        "indexsy_heartbeat_age_seconds", "Seconds since the event loop heartbeat last ran", liveness.beat_age
+    )
+
+    liveness.watch_polling()
+    bot = Bot(
+        BOT_TOKEN,
+        base_url=f"{BOT_API_BASE_URL}/bot" if BOT_API_BASE_URL else "https://api.telegram.org/bot",
+        base_file_url=f"{BOT_API_BASE_URL}/file/bot" if BOT_API_BASE_URL else "https://api.telegram.org/file/bot",
+        get_updates_request=PollingHealthRequest(liveness),
+    )
+    async with bot:
+        await router.start()
+        if METRICS_PORT:
+            MetricsServer(front_metrics, METRICS_HOST, METRICS_PORT).start()
+        heartbeat = asyncio.create_task(liveness.heartbeat())
+        liveness.start(handle_front_stall, systemd_watchdog_interval() or WATCHDOG_INTERVAL)
+
+        polling = asyncio.create_task(poll_updates(bot, router, allowed_update_types()))
+        worker_exit = asyncio.create_task(router.wait_any_exit())
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, polling.cancel)
+        # Profiles are captured in the workers, where the handlers run
+        loop.add_signal_handler(signal.SIGUSR1, router.send_signal, signal.SIGUSR1)
+        logger.info(f"🚀 Bot starting ({router.shards} shards)...")
+        await asyncio.wait([polling, worker_exit], return_when=asyncio.FIRST_COMPLETED)
+
+        status = 0
+        if worker_exit.done():
+            index, code = worker_exit.result()
+            logger.critical(f"❌ Shard {index} exited with status {code}; stopping the other shards")
+            polling.cancel()
+            status = 1
+        else:
+            worker_exit.cancel()
+            if not polling.cancelled() and polling.exception() is not None:
+                logger.error(f"Error polling for updates: {polling.exception()}", exc_info=polling.exception())
+                status = 1
+        liveness.stop()
+        heartbeat.cancel()
+        codes = await router.stop()
+        logger.info(f"🧩 Shards stopped with statuses {codes} after {sum(router.routed)} updates")
+    return status
+
+def run_front():
+    """Front process of a sharded bot: start the shard workers and route updates to them."""
+    log_pipeline.start()
+    status = 1
+    try:
+        check_single_instance()
+        if BOT_MODE == 'webhook':
+            raise ValueError("SHARDS only works with BOT_MODE=polling")
+        router = ShardRouter(SHARDS, [sys.executable, os.path.abspath(__file__)], SHARD_DIR)
+        prepare_shards(router)
+        status = asyncio.run(run_router(router))
+    except Exception as e:
+        logger.error(f"Error in front: {e}", exc_info=True)
+    finally:
+        log_pipeline.stop()
+    sys.exit(status)
+
+def tag_shard(record):
+    record.shard = int(SHARD_INDEX)
+    return True
+
+async def run_shard(app, channel):
+    """Process the updates the front writes to stdin, one JSON object per line, until it closes."""
+    global heartbeat_task
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_UPDATE_BYTES)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    await app.initialize()
+    heartbeat_task = asyncio.create_task(liveness.heartbeat(loop_lag.observe))
+    persistence.start()
+    loop.add_signal_handler(signal.SIGUSR1, profiler.start)
+    await app.start()
+    channel.write(json.dumps({"shard": int(SHARD_INDEX), "resume": resume_update_id}) + '\n')
+    channel.flush()
+    logger.info(f"🧩 Shard {SHARD_INDEX} of {SHARDS} ready with {len(engagement_data)} chats")
+    try:
+        while line := await reader.readline():
+            # Waits while the update queue is full, which holds back the front
+            await app.update_queue.put(Update.de_json(json.loads(line), app.bot))
+    finally:
+        await app.stop()
+        await post_stop(app)
+        await app.shutdown()
+
+def serve_shard():
+    """Worker process of a sharded bot, started by run_front() in its shard directory.
+
+    stdout is kept for the ready line to the front, so logs go to stderr.
+    Stops, saving like main(), once the front closes stdin; the front
+    handles SIGTERM for the whole group.
+    """
+    channel = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log_pipeline.handler.addFilter(tag_shard)
+    log_pipeline.start()
+    try:
+        check_single_instance()
+        load_state()
+        app = build_application()
+        liveness.start(handle_stall, WATCHDOG_INTERVAL)
+        asyncio.run(run_shard(app, channel))
+    except Exception as e:
+        logger.error(f"Error in shard {SHARD_INDEX}: {e}", exc_info=True)
+    finally:
+        liveness.stop()
+        close_state()
+        logger.info(f"Log pipeline stats: {log_pipeline.stats()}")
+        log_pipeline.stop()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if SHARD_INDEX is not None:
+        serve_shard()
+    elif SHARDS > 1:
+        run_front()
+    else:
+        main()
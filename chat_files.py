@@ -0,0 +1,90 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from snapshot import read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class ChatFiles:
+    """One snapshot file per chat in `directory`, where chats live while not in memory.
+
+    Each file is a snapshot (see snapshot.write_snapshot) of a store holding
+    a single chat and the names of its users, so a chat can be loaded,
+    saved and dropped without touching any other.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, chat_id):
+        return os.path.join(self.directory, f"{chat_id}.snap")
+
+    def __contains__(self, chat_id):
+        return os.path.exists(self.path(chat_id))
+
+    def chats(self):
+        """Ids of the chats with a file."""
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-len('.snap')] for name in os.listdir(self.directory) if name.endswith('.snap')]
+
+    def read(self, chat_id):
+        """The chat's store, or None if it has no file. Raises SnapshotError for an unreadable one."""
+        try:
+            return read_snapshot(self.path(chat_id))
+        except FileNotFoundError:
+            return None
+
+    def write(self, chat_id, store):
+        """Save a store holding just this chat and return the bytes written."""
+        os.makedirs(self.directory, exist_ok=True)
+        return write_snapshot(self.path(chat_id), store)
+
+
+class ResidentChats:
+    """When each chat in memory was last used, least recently used first.
+
+    Picks the chats to drop from memory: those unused for `idle_seconds`,
+    then the least recently used ones for as long as the resident counters
+    take more than `memory_budget` bytes.
+    """
+
+    def __init__(self, idle_seconds=3600, memory_budget=256 * 1024 * 1024):
+        self.idle_seconds = idle_seconds
+        self.memory_budget = memory_budget
+        self._used = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    def __contains__(self, chat_id):
+        return chat_id in self._used
+
+    def __len__(self):
+        return len(self._used)
+
+    def touch(self, chat_id):
+        self._used[chat_id] = time.monotonic()
+        self._used.move_to_end(chat_id)
+
+    def last_used(self, chat_id):
+        return self._used.get(chat_id)
+
+    def forget(self, chat_id):
+        self._used.pop(chat_id, None)
+
+    def over_budget(self, resident_bytes):
+        return resident_bytes > self.memory_budget
+
+    def candidates(self, resident_bytes, chat_bytes):
+        """(chat_id, last used) of the chats to drop, given the bytes all and each of them take."""
+        now = time.monotonic()
+        picked = []
+        for chat_id, used in self._used.items():
+            if now - used < self.idle_seconds and resident_bytes <= self.memory_budget:
+                break
+            picked.append((chat_id, used))
+            resident_bytes -= chat_bytes(chat_id)
+        return picked
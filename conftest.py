@@ -0,0 +1,85 @@
+"""
+Shared test state: fresh_bot() gives a test the bot's module state as on a
+first start, in an empty temporary directory, and puts back what was there
+before once the test is done.
+
+Test files use it as `with fresh_bot(...)`, so they still run on their own
+with `python test_<name>.py`.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import bot
+from admin_cache import AdminCache
+from chat_files import ChatFiles, ResidentChats
+from engagement_store import EngagementStore
+from eventlog import EventLog
+from history_store import HistoryStore
+from leaderboard import LeaderboardIndex
+from persistence import PersistenceWorker
+from sender_index import SenderIndex
+from sqlite_storage import SQLiteStorage
+from windows import WindowCounters
+
+# Module globals the handlers and persistence read and write; saved and restored around each test
+STATE = (
+    "engagement_data", "leaderboards", "window_counters", "windows_dirty", "message_senders",
+    "admin_cache", "history_store", "event_log", "persistence", "storage", "chat_files",
+    "resident_chats", "dirty_chats", "eviction_task", "data_month", "rolled_chats",
+    "rollover_running", "replayed_resets", "last_update_id", "resume_update_id", "offset_changed",
+    "logged_offset", "update_processor", "recent_update_ids", "catch_up_stats", "REACTION_MODE",
+)
+
+
+@contextmanager
+def fresh_bot(sqlite=False, **settings):
+    """Run a test against empty bot state in an empty temporary directory.
+
+    With sqlite=True counters are stored in a new SQLite file instead of the
+    event log. `settings` replace further module globals listed in STATE
+    once the fresh state is in place, e.g. REACTION_MODE='count'.
+    """
+    unknown = set(settings) - set(STATE)
+    if unknown:
+        raise ValueError(f"fresh_bot() can't restore {', '.join(sorted(unknown))}")
+    saved = {name: getattr(bot, name) for name in STATE}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            bot.engagement_data = EngagementStore()
+            bot.leaderboards = LeaderboardIndex()
+            bot.window_counters = WindowCounters()
+            bot.windows_dirty = False
+            bot.message_senders = SenderIndex(bot.SENDER_INDEX_DIR, 64)
+            bot.admin_cache = AdminCache()
+            bot.history_store = HistoryStore(bot.HISTORY_DIR)
+            bot.event_log = EventLog(bot.EVENT_LOG_FILE)
+            bot.persistence = PersistenceWorker(bot.collect_pending, bot.write_pending)
+            bot.storage = SQLiteStorage(bot.SQLITE_FILE) if sqlite else None
+            bot.chat_files = ChatFiles(bot.CHAT_DIR)
+            bot.resident_chats = ResidentChats()
+            bot.dirty_chats = set()
+            bot.eviction_task = None
+            bot.data_month = datetime.now().strftime('%Y-%m')
+            bot.rolled_chats = {}
+            bot.rollover_running = False
+            bot.replayed_resets = set()
+            bot.recent_update_ids = {}
+            bot.update_processor = None
+            bot.catch_up_stats = {"updates": 0, "skipped": 0, "seconds": 0.0}
+            bot.REACTION_MODE = 'user'
+            bot.set_resume_offset(0)
+            for name, value in settings.items():
+                setattr(bot, name, value)
+            yield
+        finally:
+            bot.message_senders.close()
+            if bot.storage is not None:
+                bot.storage.close()
+            for name, value in saved.items():
+                setattr(bot, name, value)
+            os.chdir(cwd)
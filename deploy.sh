@@ -22,8 +22,9 @@ screen -X -S bot quit || true
 rm -f bot.pid
 
 # Start bot in background with screen
-# Using screen allows us to reconnect to the bot process if needed
-screen -S bot -dm bash -c "python bot.py >> bot.log 2>&1"
+# Using screen allows us to reconnect to the bot process if needed.
+# The bot exits when it detects a stall, so restart it whenever it stops.
+screen -S bot -dm bash -c "while true; do python bot.py >> bot.log 2>&1; sleep 5; done"
 
 # Wait a moment for the bot to start
 sleep 2
@@ -0,0 +1,460 @@
+from array import array
+
+# Counter fields of a user's stats, in the order the event log stores them
+COUNTER_FIELDS = ("messages", "reactions_given", "reactions_received", "total_points")
+TOTAL = COUNTER_FIELDS.index("total_points")
+
+
+class RowIndex:
+    """Open-addressing hash index from 64-bit ids to row numbers.
+
+    The ids themselves live in the caller's `ids` column; the index only
+    holds row + 1 per slot (0 marks an empty slot) in an array of 32-bit
+    ints, so it costs no Python objects per row. Linear probing, grown to
+    keep the table at most two thirds full. `slots` restores a table saved
+    from an index over the same ids.
+    """
+
+    __slots__ = ("ids", "slots", "mask")
+
+    def __init__(self, ids, size=8, slots=None):
+        self.ids = ids
+        if slots is not None:
+            self.slots = slots
+            self.mask = len(slots) - 1
+            return
+        while size * 2 < len(ids) * 3:
+            size *= 2
+        self.slots = array('i', bytes(4 * size))
+        self.mask = size - 1
+        for row, key in enumerate(ids):
+            self.slots[self._probe(key)] = row + 1
+
+    def _probe(self, key):
+        """Slot holding key, or the empty slot where it would go."""
+        slots, ids, mask = self.slots, self.ids, self.mask
+        i = ((key ^ (key >> 29)) * 0x9E3779B1) & mask
+        while True:
+            row = slots[i]
+            if row == 0 or ids[row - 1] == key:
+                return i
+            i = (i + 1) & mask
+
+    def find(self, key):
+        """Row of key, or -1."""
+        # _probe inlined: this runs for every counted point
+        slots, ids, mask = self.slots, self.ids, self.mask
+        i = ((key ^ (key >> 29)) * 0x9E3779B1) & mask
+        while True:
+            row = slots[i]
+            if row == 0 or ids[row - 1] == key:
+                return row - 1
+            i = (i + 1) & mask
+
+    def add(self, key, row):
+        """Index a row the caller has just appended to `ids`."""
+        if len(self.ids) * 3 > len(self.slots) * 2:
+            self.__init__(self.ids, len(self.slots) * 2)
+        else:
+            self.slots[self._probe(key)] = row + 1
+
+    def nbytes(self):
+        return self.slots.itemsize * len(self.slots)
+
+    def copy(self, ids):
+        """This index over a copy of its ids."""
+        return RowIndex(ids, slots=self.slots[:])
+
+
+class UserDirectory:
+    """Usernames of every user, stored once for all chats.
+
+    Names are UTF-8 in one bytearray, found through per-user offset and
+    length columns. A longer new name is appended and the old bytes are left
+    behind; renames are rare enough that this waste is never reclaimed in
+    process, and a restart loads a compact copy.
+    """
+
+    __slots__ = ("ids", "starts", "lengths", "blob", "index")
+
+    def __init__(self):
+        self.ids = array('q')
+        self.starts = array('q')
+        self.lengths = array('i')
+        self.blob = bytearray()
+        self.index = RowIndex(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def set(self, user_id, username):
+        """Store a user's latest name."""
+        encoded = username.encode('utf-8')
+        row = self.index.find(user_id)
+        if row < 0:
+            row = len(self.ids)
+            self.ids.append(user_id)
+            self.starts.append(len(self.blob))
+            self.lengths.append(len(encoded))
+            self.blob += encoded
+            self.index.add(user_id, row)
+            return
+        start, length = self.starts[row], self.lengths[row]
+        if self.blob[start:start + length] == encoded:
+            return
+        if len(encoded) > length:
+            start = self.starts[row] = len(self.blob)
+            self.blob += encoded
+        else:
+            self.blob[start:start + len(encoded)] = encoded
+        self.lengths[row] = len(encoded)
+
+    def update(self, names):
+        """Store the names of many (user_id, username) pairs."""
+        ids, starts, lengths, blob, index = self.ids, self.starts, self.lengths, self.blob, self.index
+        for user_id, username in names:
+            if username is None:
+                continue
+            if index.find(user_id) >= 0:
+                self.set(user_id, username)
+                continue
+            encoded = username.encode('utf-8')
+            ids.append(user_id)
+            starts.append(len(blob))
+            lengths.append(len(encoded))
+            blob += encoded
+            index.add(user_id, len(ids) - 1)
+            index = self.index
+
+    def merge(self, other):
+        """Add the names of the users in another directory this one doesn't know yet."""
+        find = self.index.find
+        rows = [row for row, user_id in enumerate(other.ids) if find(user_id) < 0]
+        if not rows:
+            return
+        first = len(self.ids)
+        if len(rows) == len(other):
+            # All new, as when a chat shares no users with the chats in memory: copy the columns
+            offset = len(self.blob)
+            self.ids.extend(other.ids)
+            self.starts.extend(array('q', [start + offset for start in other.starts]))
+            self.lengths.extend(other.lengths)
+            self.blob += other.blob
+        else:
+            for row in rows:
+                start, length = other.starts[row], other.lengths[row]
+                self.ids.append(other.ids[row])
+                self.starts.append(len(self.blob))
+                self.lengths.append(length)
+                self.blob += other.blob[start:start + length]
+        if len(self.ids) * 3 > len(self.index.slots) * 2:
+            # Index the new rows with one rebuild instead of growing step by step
+            self.index = RowIndex(self.ids, len(self.index.slots))
+        else:
+            for row in range(first, len(self.ids)):
+                self.index.add(self.ids[row], row)
+
+    def get(self, user_id):
+        row = self.index.find(user_id)
+        if row < 0:
+            return None
+        start = self.starts[row]
+        return self.blob[start:start + self.lengths[row]].decode('utf-8')
+
+    def nbytes(self):
+        columns = (self.ids, self.starts, self.lengths)
+        return sum(c.itemsize * len(c) for c in columns) + len(self.blob) + self.index.nbytes()
+
+    def copy(self):
+        copy = UserDirectory()
+        copy.ids, copy.starts, copy.lengths = self.ids[:], self.starts[:], self.lengths[:]
+        copy.blob = bytearray(self.blob)
+        copy.index = self.index.copy(copy.ids)
+        return copy
+
+
+class ChatCounters:
+    """One chat's counters, stored as columns of 64-bit integers.
+
+    Row i holds the user in user_ids[i] and that user's value of
+    COUNTER_FIELDS[f] in columns[f][i]. Rows are only ever appended, so a
+    user keeps the same row until the chat is dropped.
+    """
+
+    __slots__ = ("user_ids", "columns", "index")
+
+    def __init__(self):
+        self.user_ids = array('q')
+        self.columns = tuple(array('q') for _ in COUNTER_FIELDS)
+        self.index = RowIndex(self.user_ids)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def row(self, user_id):
+        """Row of an int user id, appending an empty one if needed."""
+        row = self.index.find(user_id)
+        if row < 0:
+            row = len(self.user_ids)
+            self.user_ids.append(user_id)
+            for column in self.columns:
+                column.append(0)
+            self.index.add(user_id, row)
+        return row
+
+    def nbytes(self):
+        columns = (self.user_ids,) + self.columns
+        return sum(c.itemsize * len(c) for c in columns) + self.index.nbytes()
+
+    def copy(self):
+        copy = ChatCounters()
+        copy.user_ids = self.user_ids[:]
+        copy.columns = tuple(column[:] for column in self.columns)
+        copy.index = self.index.copy(copy.user_ids)
+        return copy
+
+
+class EngagementStore:
+    """Current month's counters of every chat.
+
+    A user has one row per chat in that chat's ChatCounters, while usernames
+    live once in a UserDirectory shared by all chats (the latest name seen
+    anywhere wins). Both are plain arrays with no Python object per row, so a
+    row costs tens of bytes instead of a dict of five keys with string ids
+    and a copied username.
+
+    The API takes and returns string ids and stats dicts in the format of
+    engagement_data.json, so callers and files don't see the layout. Not
+    thread-safe: callers hold data_lock.
+    """
+
+    def __init__(self):
+        self._chats = {}
+        self._names = UserDirectory()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a store from {chat_id: {user_id: stats}}."""
+        store = cls()
+        for chat_id, users in data.items():
+            store.import_chat(chat_id, users)
+        return store
+
+    @classmethod
+    def from_parts(cls, chats, directory):
+        """Build a store from {chat_id: ChatCounters} and a UserDirectory, as parts() returns them."""
+        store = cls()
+        store._chats = chats
+        store._names = directory
+        return store
+
+    def parts(self):
+        """The chats' ChatCounters by chat id and the UserDirectory, for serializers."""
+        return self._chats, self._names
+
+    def copy(self):
+        """A deep copy; one memcpy per column, so cheap enough under data_lock."""
+        chats = {chat_id: chat.copy() for chat_id, chat in self._chats.items()}
+        return EngagementStore.from_parts(chats, self._names.copy())
+
+    def __len__(self):
+        return len(self._chats)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._chats
+
+    def chats(self):
+        """Ids of the chats with counters, as a list safe to iterate while counting."""
+        return list(self._chats)
+
+    def user_count(self, chat_id=None):
+        """Number of (chat, user) rows, or of one chat's users."""
+        if chat_id is not None:
+            chat = self._chats.get(chat_id)
+            return len(chat) if chat is not None else 0
+        return sum(len(chat) for chat in self._chats.values())
+
+    def nbytes(self, chat_id=None):
+        """Bytes held by the counter columns, indexes and usernames, or by one chat's columns and index."""
+        if chat_id is not None:
+            chat = self._chats.get(chat_id)
+            return chat.nbytes() if chat is not None else 0
+        return self._names.nbytes() + sum(chat.nbytes() for chat in self._chats.values())
+
+    def chat_store(self, chat_id):
+        """A store with a copy of one chat and its users' names, to save the chat on its own."""
+        chat = self._chats[chat_id].copy()
+        names = UserDirectory()
+        names.update((user_id, self._names.get(user_id)) for user_id in chat.user_ids)
+        return EngagementStore.from_parts({chat_id: chat}, names)
+
+    def add_chat(self, chat_id, store):
+        """Take over a chat from a store holding it on its own, as chat_store() returns it.
+
+        Names already known here are kept over the ones the store brings,
+        since they were seen more recently.
+        """
+        chats, names = store.parts()
+        chat = chats.get(chat_id)
+        if chat is None:
+            return
+        self._chats[chat_id] = chat
+        self._names.merge(names)
+
+    def drop_chat(self, chat_id):
+        """Forget a chat, e.g. once it is saved and no longer needed in memory.
+
+        Its users' names stay until prune_names().
+        """
+        self._chats.pop(chat_id, None)
+
+    def prune_names(self):
+        """Forget the names of users left in no chat; returns how many were dropped."""
+        names = UserDirectory()
+        for chat in self._chats.values():
+            names.update((user_id, self._names.get(user_id)) for user_id in chat.user_ids)
+        dropped = len(self._names) - len(names)
+        self._names = names
+        return dropped
+
+    def users(self, chat_id):
+        """User ids of a chat, in the order they first appeared."""
+        chat = self._chats.get(chat_id)
+        return [str(user_id) for user_id in chat.user_ids] if chat is not None else []
+
+    def has(self, chat_id, user_id):
+        chat = self._chats.get(chat_id)
+        return chat is not None and chat.index.find(int(user_id)) >= 0
+
+    def username(self, user_id):
+        return self._names.get(int(user_id))
+
+    def increment(self, chat_id, user_id, field, username=None):
+        """Count one point in `field` and in total_points.
+
+        With a username the user's row is created if needed and the name is
+        refreshed; without one only an existing row is counted. Returns
+        whether the point was counted.
+        """
+        uid = int(user_id)
+        chat = self._chats.get(chat_id)
+        if username is None:
+            row = chat.index.find(uid) if chat is not None else -1
+            if row < 0:
+                return False
+        else:
+            if chat is None:
+                chat = self._chats[chat_id] = ChatCounters()
+            row = chat.row(uid)
+            self._names.set(uid, username)
+        columns = chat.columns
+        columns[COUNTER_FIELDS.index(field)][row] += 1
+        columns[TOTAL][row] += 1
+        return True
+
+    def add(self, chat_id, user_id, field, points, username=None):
+        """Add `points` to `field` and total_points; negative points take them back.
+
+        Rows are created as by increment(). Neither counter goes below zero,
+        e.g. for a reaction removed after the month it was counted in.
+        Returns the points actually added.
+        """
+        uid = int(user_id)
+        chat = self._chats.get(chat_id)
+        if username is None:
+            row = chat.index.find(uid) if chat is not None else -1
+            if row < 0:
+                return 0
+        else:
+            if chat is None:
+                chat = self._chats[chat_id] = ChatCounters()
+            row = chat.row(uid)
+            self._names.set(uid, username)
+        columns = chat.columns
+        column = columns[COUNTER_FIELDS.index(field)]
+        points = max(points, -column[row], -columns[TOTAL][row])
+        column[row] += points
+        columns[TOTAL][row] += points
+        return points
+
+    def counters(self, chat_id, user_id):
+        """A user's values of COUNTER_FIELDS as a list, or None without a row."""
+        chat = self._chats.get(chat_id)
+        row = chat.index.find(int(user_id)) if chat is not None else -1
+        if row < 0:
+            return None
+        return [column[row] for column in chat.columns]
+
+    def set_counters(self, chat_id, user_id, values, username=None):
+        """Overwrite a user's values of COUNTER_FIELDS, creating the row if needed."""
+        uid = int(user_id)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatCounters()
+        row = chat.row(uid)
+        for column, value in zip(chat.columns, values):
+            column[row] = value
+        if username is not None:
+            self._names.set(uid, username)
+
+    def get(self, chat_id, user_id):
+        """A copy of a user's stats in the JSON format, or None without a row."""
+        values = self.counters(chat_id, user_id)
+        if values is None:
+            return None
+        stats = {"username": self.username(user_id)}
+        stats.update(zip(COUNTER_FIELDS, values))
+        return stats
+
+    def points(self, chat_id):
+        """(user_id, total_points) pairs of a chat, for building its leaderboard."""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return []
+        return list(zip(map(str, chat.user_ids), chat.columns[TOTAL]))
+
+    def reset_chat(self, chat_id):
+        """Zero every counter of a chat, keeping its users."""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return
+        size = len(chat.user_ids)
+        chat.columns = tuple(array('q', bytes(8 * size)) for _ in COUNTER_FIELDS)
+
+    def import_chat(self, chat_id, users):
+        """Set a chat's rows from {user_id: stats}; other rows are kept."""
+        if chat_id in self._chats:
+            for user_id, stats in users.items():
+                self.set_counters(
+                    chat_id, user_id, [stats[field] for field in COUNTER_FIELDS], stats["username"]
+                )
+            return
+        # Loading: fill the columns in bulk and index them once
+        chat = ChatCounters()
+        chat.user_ids.extend(map(int, users))
+        for field, column in zip(COUNTER_FIELDS, chat.columns):
+            column.extend(stats[field] for stats in users.values())
+        chat.index = RowIndex(chat.user_ids)
+        self._chats[chat_id] = chat
+        self._names.update(zip(chat.user_ids, (stats["username"] for stats in users.values())))
+
+    def export_chat(self, chat_id):
+        """A chat's rows as {user_id: stats}."""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return {}
+        name = self._names.get
+        return {
+            str(user_id): {
+                "username": name(user_id),
+                "messages": messages,
+                "reactions_given": given,
+                "reactions_received": received,
+                "total_points": total,
+            }
+            for user_id, messages, given, received, total in zip(chat.user_ids, *chat.columns)
+        }
+
+    def export(self):
+        """Every row as {chat_id: {user_id: stats}}, the engagement_data.json format."""
+        return {chat_id: self.export_chat(chat_id) for chat_id in self._chats}
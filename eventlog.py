@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _drop_torn_tail(path):
+    """Cut a final line left without its newline by a crash, so appends start on a line of their own."""
+    try:
+        with open(path, 'r+b') as f:
+            size = keep = f.seek(0, os.SEEK_END)
+            if not size:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            # Back to the end of the last whole line, or the start of the file
+            while keep:
+                start = max(0, keep - 65536)
+                f.seek(start)
+                newline = f.read(keep - start).rfind(b'\n')
+                keep = start + newline + 1 if newline >= 0 else start
+                if newline >= 0:
+                    break
+            logger.warning(f"Dropping a torn event of {size - keep} bytes at the end of {path}")
+            f.truncate(keep)
+            f.flush()
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
+
+
+class EventLog:
+    """Append-only log of engagement events, compacted into a snapshot.
+
+    Handlers append small events to an in-memory buffer while holding the
+    data lock; the persistence worker drains the buffer and appends it to
+    the log file in one write. Every event carries the resulting counters of
+    the row it touched, so replaying a log over a snapshot that already
+    contains some of its events is harmless.
+
+    Compaction renames the log aside before the new snapshot is written and
+    deletes it afterwards, so a crash at any point leaves a snapshot plus
+    log segments that replay to the latest flushed state.
+    """
+
+    def __init__(self, path, compact_interval=300, compact_max_events=100000):
+        self.path = path
+        self.compacting_path = path + '.compacting'
+        self.compact_interval = compact_interval
+        self.compact_max_events = compact_max_events
+        self._buffer = []
+        self._tail_checked = False
+        self._force_compaction = False
+        self.events_since_compaction = 0
+        self.last_compaction = time.monotonic()
+
+    def append(self, event):
+        """Queue an event for the next flush. Caller holds the data lock."""
+        self._buffer.append(event)
+
+    def drain(self):
+        """Take all queued events. Caller holds the data lock."""
+        events, self._buffer = self._buffer, []
+        return events
+
+    def requeue(self, events):
+        """Put events back after a failed write. Caller holds the data lock."""
+        self._buffer[:0] = events
+
+    def force_compaction(self):
+        """Compact on the next flush regardless of the thresholds."""
+        self._force_compaction = True
+
+    def compaction_due(self, incoming=0):
+        """Whether the next flush should also write a fresh snapshot."""
+        return (
+            self._force_compaction
+            or self.events_since_compaction + incoming >= self.compact_max_events
+            or time.monotonic() - self.last_compaction >= self.compact_interval
+        )
+
+    def write(self, events):
+        """Append events to the log file and return the number of bytes written."""
+        if not events:
+            return 0
+        payload = ''.join(
+            json.dumps(event, separators=(',', ':')) + '\n' for event in events
+        ).encode('utf-8')
+        if not self._tail_checked:
+            # Once per process: a crash may have left the last line half written
+            _drop_torn_tail(self.path)
+            self._tail_checked = True
+        with open(self.path, 'ab') as log_file:
+            log_file.write(payload)
+            log_file.flush()
+            os.fsync(log_file.fileno())
+        self.events_since_compaction += len(events)
+        return len(payload)
+
+    def start_compaction(self):
+        """Move the current log aside before a new snapshot is written."""
+        if not os.path.exists(self.path):
+            return
+        if os.path.exists(self.compacting_path):
+            # A previous compaction failed half way; keep the events in order
+            _drop_torn_tail(self.compacting_path)
+            with open(self.path, 'rb') as src, open(self.compacting_path, 'ab') as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.compacting_path)
+
+    def finish_compaction(self):
+        """Drop the compacted log once the snapshot is safely on disk."""
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+        self._force_compaction = False
+        self.events_since_compaction = 0
+        self.last_compaction = time.monotonic()
+
+    def replay(self):
+        """Yield logged events oldest first, skipping a torn final line."""
+        for path in (self.compacting_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as log_file:
+                for line_number, line in enumerate(log_file, 1):
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping unreadable event at {path}:{line_number}")
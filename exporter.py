@@ -0,0 +1,94 @@
+import csv
+import gzip
+import io
+import json
+import os
+
+from engagement_store import COUNTER_FIELDS
+
+EXPORT_FIELDS = ("month", "user_id", "username") + COUNTER_FIELDS
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def current_rows(store, chat_id, lock, chunk=1000):
+    """Yield (user_id, stats) of a chat's live counters, best users first.
+
+    The chat's columns are copied under `lock` (one memcpy each) and
+    usernames are looked up `chunk` rows at a time, so a 100k-user chat
+    never holds the lock for long and the store can keep counting.
+    """
+    with lock:
+        chats, names = store.parts()
+        chat = chats.get(chat_id)
+        if chat is None:
+            return
+        chat = chat.copy()
+    totals = chat.columns[-1]
+    order = sorted(range(len(chat)), key=totals.__getitem__, reverse=True)
+    for start in range(0, len(order), chunk):
+        rows = order[start:start + chunk]
+        with lock:
+            usernames = [names.get(chat.user_ids[row]) for row in rows]
+        for row, username in zip(rows, usernames):
+            stats = {"username": username}
+            stats.update((field, column[row]) for field, column in zip(COUNTER_FIELDS, chat.columns))
+            yield str(chat.user_ids[row]), stats
+
+
+class ExportWriter:
+    """Writes export rows as CSV or JSON lines, split into part files of at most ~part_bytes.
+
+    Every part is a complete document (CSV parts repeat the header) and is
+    gzipped when `compress` is set, so each can be opened on its own.
+    Rows are written as they come; only the current row is held in memory.
+    """
+
+    def __init__(self, directory, name, format='csv', compress=False, part_bytes=45 * 1024 * 1024):
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {format!r}")
+        self.directory = directory
+        self.name = name
+        self.format = format
+        self.compress = compress
+        self.part_bytes = part_bytes
+        self.paths = []
+        self.rows = 0
+        self._raw = None
+        self._file = None
+        self._csv = None
+
+    def _open_part(self):
+        suffix = f".{self.format}" + (".gz" if self.compress else "")
+        path = os.path.join(self.directory, f"{self.name}-part{len(self.paths) + 1}{suffix}")
+        self._raw = open(path, 'wb')
+        binary = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=6) if self.compress else self._raw
+        self._file = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+        if self.format == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(EXPORT_FIELDS)
+        self.paths.append(path)
+
+    def _close_part(self):
+        self._file.close()  # Closes the gzip stream and the file under it
+        self._raw.close()
+        self._file = self._raw = self._csv = None
+
+    def write(self, month, user_id, stats):
+        if self._file is None:
+            self._open_part()
+        if self.format == 'csv':
+            self._csv.writerow([month, user_id] + [stats[field] for field in EXPORT_FIELDS[2:]])
+        else:
+            row = {"month": month, "user_id": user_id}
+            row.update((field, stats[field]) for field in EXPORT_FIELDS[2:])
+            self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.rows += 1
+        # Size on disk, behind by what the text and gzip layers still buffer
+        if self._raw.tell() >= self.part_bytes:
+            self._close_part()
+
+    def close(self):
+        """Finish the last part and return the paths of all parts."""
+        if self._file is not None:
+            self._close_part()
+        return self.paths
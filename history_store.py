@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from persistence import atomic_write
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'\s*')
+
+
+class HistoryStore:
+    """Archived monthly stats, sharded into one file per (month, chat).
+
+    Layout under `directory`:
+        index.json            {"last_reset": "2026-10", "months": {"2026-09": [chat_id, ...]}}
+                              (plus "rollover": "2026-11" while a rollover is running)
+        2026-09/<chat_id>.json  {user_id: stats}, sorted by total points
+
+    Only the index is read up front; a leaderboard for a month loads just
+    that chat's shard, and archiving a chat writes just its own file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self._index = None
+        # Archiving runs in worker threads while /history reads the index
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        if self._index is None:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r') as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {"months": {}}
+        return self._index
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    @property
+    def last_reset(self):
+        return self.index.get('last_reset')
+
+    @last_reset.setter
+    def last_reset(self, month):
+        self.index['last_reset'] = month
+
+    @property
+    def pending_rollover(self):
+        """Month a rollover in progress is moving to, if one was interrupted."""
+        return self.index.get('rollover')
+
+    @pending_rollover.setter
+    def pending_rollover(self, month):
+        if month is None:
+            self.index.pop('rollover', None)
+        else:
+            self.index['rollover'] = month
+
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            payload = json.dumps(self.index, separators=(',', ':')).encode('utf-8')
+        atomic_write(self.index_path, payload)
+
+    def months(self, chat_id=None):
+        """Archived months, newest first, optionally only those with data for a chat."""
+        months = self.index["months"]
+        with self._lock:
+            return sorted(
+                (month for month, chats in months.items() if chat_id is None or chat_id in chats),
+                reverse=True
+            )
+
+    def _shard_path(self, month, chat_id):
+        return os.path.join(self.directory, month, f"{chat_id}.json")
+
+    def archive_chat(self, month, chat_id, users):
+        """Write one chat's stats for a month. Call save_index() after a batch."""
+        ranked = dict(sorted(users.items(), key=lambda x: x[1]["total_points"], reverse=True))
+        os.makedirs(os.path.join(self.directory, month), exist_ok=True)
+        written = atomic_write(
+            self._shard_path(month, chat_id),
+            json.dumps(ranked, separators=(',', ':')).encode('utf-8')
+        )
+        self.add_to_index(month, chat_id)
+        return written
+
+    def has_shard(self, month, chat_id):
+        """Whether a chat's month was archived, even if the index wasn't saved since."""
+        return os.path.exists(self._shard_path(month, chat_id))
+
+    def add_to_index(self, month, chat_id):
+        with self._lock:
+            chats = self.index["months"].setdefault(month, [])
+            if chat_id not in chats:
+                chats.append(chat_id)
+
+    def load(self, month, chat_id):
+        """Load one chat's stats for a month, best users first."""
+        path = self._shard_path(month, chat_id)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def iter_users(self, month, chat_id):
+        """Yield one chat's (user_id, stats) for a month, best users first.
+
+        Decodes one user at a time instead of the whole shard in one call,
+        so the event loop gets the GIL back between users while a worker
+        thread reads a 100k-user month.
+        """
+        path = self._shard_path(month, chat_id)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            text = f.read()
+        skip = _whitespace.match
+        pos = skip(text).end()
+        if text[pos:pos + 1] != '{':
+            raise ValueError(f"{path} is not a JSON object")
+        pos = skip(text, pos + 1).end()
+        if text[pos:pos + 1] == '}':
+            return
+        while True:
+            user_id, pos = _decoder.raw_decode(text, pos)
+            pos = skip(text, pos).end()
+            if text[pos:pos + 1] != ':':
+                raise ValueError(f"{path}: expected ':' at {pos}")
+            stats, pos = _decoder.raw_decode(text, skip(text, pos + 1).end())
+            yield user_id, stats
+            pos = skip(text, pos).end()
+            if text[pos:pos + 1] == '}':
+                return
+            if text[pos:pos + 1] != ',':
+                raise ValueError(f"{path}: expected ',' at {pos}")
+            pos = skip(text, pos + 1).end()
+
+    def top(self, month, chat_id, limit):
+        """Top (user_id, stats) pairs of a chat for an archived month."""
+        return list(self.load(month, chat_id).items())[:limit]
+
+    def migrate_legacy(self, history_file):
+        """Split a single engagement_history.json into month/chat shards."""
+        with open(history_file, 'r') as f:
+            history = json.load(f)
+        for month, month_data in history.items():
+            if month == 'last_reset':
+                continue
+            for chat_id, users in month_data.items():
+                self.archive_chat(month, chat_id, users)
+        if 'last_reset' in history:
+            self.last_reset = history['last_reset']
+        self.save_index()
+        os.replace(history_file, history_file + '.migrated')
+        logger.info(f"📚 Split {history_file} into {len(self.months())} months under {self.directory}")
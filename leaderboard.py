@@ -0,0 +1,177 @@
+from array import array
+from bisect import bisect_right, insort
+
+
+class _Fenwick:
+    """Counts of users per point value, for O(log n) rank queries."""
+
+    def __init__(self, size=64):
+        self.tree = array('q', bytes(8 * (size + 1)))
+
+    def _grow(self, value):
+        size = len(self.tree) - 1
+        while size <= value:
+            size *= 2
+        counts = [self.count_at(v) for v in range(len(self.tree) - 1)]
+        self.tree = array('q', bytes(8 * (size + 1)))
+        for value, count in enumerate(counts):
+            if count:
+                self.add(value, count)
+
+    def add(self, value, delta):
+        if value + 1 >= len(self.tree):
+            self._grow(value + 1)
+        i = value + 1
+        tree = self.tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, value):
+        """Number of users with at most `value` points."""
+        i = min(value + 1, len(self.tree) - 1)
+        total = 0
+        tree = self.tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def count_at(self, value):
+        return self.prefix(value) - (self.prefix(value - 1) if value else 0)
+
+
+class Leaderboard:
+    """Ranking of one chat's users by total points, kept up to date incrementally.
+
+    Users are grouped into buckets by score, with the distinct scores kept in
+    a sorted list, so a point change is a couple of dict operations plus a
+    bisect. Reading the top K walks the highest buckets; a user's rank comes
+    from a Fenwick tree over the scores. In the top K, ties are ordered by who
+    reached the score first.
+    """
+
+    def __init__(self, points=None):
+        self._points = {}
+        self._buckets = {}
+        self._scores = []
+        self._counts = _Fenwick()
+        if points:
+            self._build(points)
+
+    def _build(self, points):
+        for user_id, score in points:
+            self._points[user_id] = score
+            bucket = self._buckets.get(score)
+            if bucket is None:
+                bucket = self._buckets[score] = {}
+            bucket[user_id] = None
+        self._scores = sorted(self._buckets)
+        if self._scores:
+            self._counts = _Fenwick(max(64, self._scores[-1] + 1))
+        for score, bucket in self._buckets.items():
+            self._counts.add(score, len(bucket))
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, user_id):
+        return user_id in self._points
+
+    def _remove(self, user_id, score):
+        bucket = self._buckets[score]
+        del bucket[user_id]
+        if not bucket:
+            del self._buckets[score]
+            del self._scores[bisect_right(self._scores, score) - 1]
+        self._counts.add(score, -1)
+
+    def _insert(self, user_id, score):
+        bucket = self._buckets.get(score)
+        if bucket is None:
+            bucket = self._buckets[score] = {}
+            insort(self._scores, score)
+        bucket[user_id] = None
+        self._counts.add(score, 1)
+
+    def set_points(self, user_id, score):
+        """Set a user's total points, adding the user if needed."""
+        old = self._points.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._remove(user_id, old)
+        self._points[user_id] = score
+        self._insert(user_id, score)
+
+    def add_points(self, user_id, delta=1):
+        self.set_points(user_id, self._points.get(user_id, 0) + delta)
+
+    def points(self, user_id):
+        return self._points.get(user_id)
+
+    def top(self, limit):
+        """User ids of the `limit` highest scorers, best first."""
+        result = []
+        buckets = self._buckets
+        for score in reversed(self._scores):
+            for user_id in buckets[score]:
+                result.append(user_id)
+                if len(result) == limit:
+                    return result
+        return result
+
+    def rank(self, user_id):
+        """1-based position of a user, or None if the user has no entry.
+
+        Users with the same score share a position.
+        """
+        score = self._points.get(user_id)
+        if score is None:
+            return None
+        return len(self._points) - self._counts.prefix(score) + 1
+
+
+class LeaderboardIndex:
+    """Leaderboards of every chat, keyed like engagement_data."""
+
+    def __init__(self):
+        self._boards = {}
+
+    def rebuild(self, data):
+        """Rebuild all leaderboards from an EngagementStore."""
+        self._boards = {chat_id: Leaderboard(data.points(chat_id)) for chat_id in data.chats()}
+
+    def rebuild_chat(self, chat_id, points):
+        """Rebuild one chat's leaderboard from (user_id, total_points) pairs."""
+        self._boards[chat_id] = Leaderboard(points)
+
+    def drop_chat(self, chat_id):
+        self._boards.pop(chat_id, None)
+
+    def get(self, chat_id):
+        return self._boards.get(chat_id)
+
+    def add_points(self, chat_id, user_id, delta=1):
+        board = self._boards.get(chat_id)
+        if board is None:
+            board = self._boards[chat_id] = Leaderboard()
+        board.add_points(user_id, delta)
+
+    def set_points(self, chat_id, user_id, score):
+        board = self._boards.get(chat_id)
+        if board is None:
+            board = self._boards[chat_id] = Leaderboard()
+        board.set_points(user_id, score)
+
+    def top(self, chat_id, limit):
+        board = self._boards.get(chat_id)
+        return board.top(limit) if board is not None else []
+
+    def rank(self, chat_id, user_id):
+        board = self._boards.get(chat_id)
+        return board.rank(user_id) if board is not None else None
+
+    def size(self, chat_id):
+        board = self._boards.get(chat_id)
+        return len(board) if board is not None else 0
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+
+def sd_notify(message):
+    """Send a state change to systemd (see sd_notify(3)). Returns False when not run by systemd."""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        address = '\0' + address[1:]  # Abstract namespace socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode('utf-8'))
+        return True
+    except OSError as e:
+        logger.error(f"Could not notify systemd: {e}")
+        return False
+
+
+def systemd_watchdog_interval():
+    """Seconds between watchdog pings systemd expects (half of WatchdogSec), or None."""
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6 / 2
+
+
+class LivenessMonitor:
+    """Decides whether the bot is alive from the event loop and polling, not user activity.
+
+    A heartbeat coroutine on the event loop stamps the time every `interval`
+    seconds; if no stamp is newer than `loop_timeout`, the loop is blocked.
+    In polling mode every successful getUpdates round-trip is stamped too
+    (see PollingHealthRequest), and `poll_timeout` without one means polling
+    is stuck. A quiet chat has neither problem, so an idle bot stays up.
+
+    A checker thread, independent of the loop, pings the systemd watchdog
+    while everything is healthy and calls `on_stall` once when it is not.
+    """
+
+    def __init__(self, loop_timeout=60, poll_timeout=600, interval=0.5,
+                 clock=time.monotonic, notify=sd_notify):
+        self.loop_timeout = loop_timeout
+        self.poll_timeout = poll_timeout
+        self.interval = interval
+        self.clock = clock
+        self.notify = notify
+        self.last_beat = clock()
+        self.last_poll = None  # Set by watch_polling() in polling mode
+        self.beats = 0
+        self.last_lag = 0.0
+        self.poll_failures = 0
+        self._ready = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    async def heartbeat(self, on_lag=None):
+        """Stamp the time every interval; on_lag gets how late each wakeup was."""
+        loop = asyncio.get_running_loop()
+        while True:
+            self.last_beat = self.clock()
+            self.beats += 1
+            if not self._ready:
+                self._ready = True
+                self.notify("READY=1")
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - start - self.interval)
+            if on_lag is not None:
+                on_lag(self.last_lag)
+
+    def watch_polling(self):
+        """Also require getUpdates round-trips to keep succeeding."""
+        self.last_poll = self.clock()
+
+    def record_poll(self, ok=True):
+        if ok:
+            self.last_poll = self.clock()
+        else:
+            self.poll_failures += 1
+
+    def beat_age(self):
+        return self.clock() - self.last_beat
+
+    def poll_age(self):
+        return self.clock() - self.last_poll if self.last_poll is not None else 0.0
+
+    def problems(self):
+        """Reasons the bot is not healthy; empty when it is."""
+        problems = []
+        if self.beat_age() > self.loop_timeout:
+            problems.append(f"event loop blocked for {self.beat_age():.0f}s")
+        if self.last_poll is not None and self.poll_age() > self.poll_timeout:
+            problems.append(f"no successful getUpdates for {self.poll_age():.0f}s")
+        return problems
+
+    def check(self):
+        """Ping the systemd watchdog if healthy. Returns the list of problems."""
+        problems = self.problems()
+        if not problems:
+            self.notify("WATCHDOG=1")
+        return problems
+
+    def run(self, on_stall, check_interval):
+        while not self._stop.wait(check_interval):
+            try:
+                problems = self.check()
+            except Exception as e:
+                logger.error(f"Error in liveness check: {e}")
+                continue
+            if problems:
+                on_stall(problems)
+                return
+
+    def start(self, on_stall, check_interval=10):
+        """Check health every check_interval seconds from a daemon thread."""
+        # Time spent starting up before the loop runs doesn't count
+        self.last_beat = self.clock()
+        if self.last_poll is not None:
+            self.last_poll = self.last_beat
+        self._thread = threading.Thread(
+            target=self.run, args=(on_stall, check_interval), name="liveness", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"🔍 Liveness monitor started (checks every {check_interval:.0f}s)")
+
+    def stop(self):
+        self._stop.set()
+        self.notify("STOPPING=1")
+
+
+class PollingHealthRequest(HTTPXRequest):
+    """getUpdates connection that reports each round-trip to a LivenessMonitor."""
+
+    def __init__(self, monitor, **kwargs):
+        kwargs.setdefault('connection_pool_size', 1)
+        super().__init__(**kwargs)
+        self.monitor = monitor
+
+    async def do_request(self, *args, **kwargs):
+        try:
+            code, payload = await super().do_request(*args, **kwargs)
+        except Exception:
+            self.monitor.record_poll(ok=False)
+            raise
+        self.monitor.record_poll(ok=code == 200)
+        return code, payload
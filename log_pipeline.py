@@ -0,0 +1,157 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+# Standard LogRecord attributes; anything else on a record came from `extra`
+RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def parse_sample_rates(spec):
+    """Parse "message=100,reaction=50" into {"message": 100, "reaction": 50}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        event, _, rate = item.partition('=')
+        rates[event.strip()] = max(1, int(rate))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                  + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class EventSampler:
+    """Keeps one in every N log lines of a high-volume event type.
+
+    Called before logging, so a skipped line costs a dict lookup and never
+    builds a LogRecord. Returns the `extra` to log with: the event type, and
+    for sampled types the rate, so counts can be scaled back up. Returns
+    None for lines to skip. Types without a rate are always kept.
+    """
+
+    def __init__(self, rates):
+        self.rates = dict(rates)
+        self.seen = dict.fromkeys(self.rates, 0)
+        self.dropped = 0
+        self._extra = {event: {"event": event, "sample_rate": rate} for event, rate in self.rates.items()}
+
+    def __call__(self, event):
+        rate = self.rates.get(event)
+        if rate is None:
+            return {"event": event}
+        seen = self.seen[event]
+        self.seen[event] = seen + 1
+        if seen % rate:
+            self.dropped += 1
+            return None
+        return self._extra[event]
+
+
+_sampler = EventSampler({})
+
+
+def sample(event):
+    """`extra` for a line of a high-volume event type, or None to skip it.
+
+        extra = sample("message")
+        if extra:
+            logger.info("Message from %s", username, extra=extra)
+
+    Uses the rates of the started LogPipeline; every line is kept before that.
+    """
+    return _sampler(event)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without formatting them, and drops them when it falls behind."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Messages are built from their args by the writer, not on the event loop
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room: the queue may be full of records still to write
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """Root logging through a bounded queue and a background writer thread.
+
+    Logging calls on the hot path only check sample() and the level and put
+    the record on a queue; formatting (JSON or text) and the write to
+    `stream` happen on the writer thread. When the writer can't keep up,
+    records are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, level=logging.INFO, json_output=True, sample_rates=None,
+                 stream=None, queue_size=10000):
+        self.queue = queue.Queue(queue_size)
+        self.sampler = EventSampler(sample_rates or {})
+        self.handler = _QueueHandler(self.queue)
+        self.writer = logging.StreamHandler(stream if stream is not None else sys.stderr)
+        self.writer.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+        self.listener = _QueueListener(self.queue, self.writer)
+        self.level = level
+        self.running = False
+
+    def start(self):
+        """Replace the root logger's handlers with the queue and start the writer."""
+        global _sampler
+        _sampler = self.sampler
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        self.running = True
+        return self
+
+    def stop(self):
+        """Write out everything queued and detach from the root logger."""
+        global _sampler
+        if _sampler is self.sampler:
+            _sampler = EventSampler({})
+        logging.getLogger().removeHandler(self.handler)
+        if self.running:
+            self.listener.stop()
+            self.running = False
+        self.writer.flush()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(), "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.dropped,
+        }
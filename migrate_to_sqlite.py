@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Import the JSON engagement data into the SQLite store.
+
+Reads every chat's file in chats/ (plus any unflushed event log, or the
+single snapshot of older versions) as the current month and every month archived under history/ (or in the legacy
+engagement_history.json), and writes them to the SQLite file used when
+STORAGE_BACKEND=sqlite.
+
+Usage: python migrate_to_sqlite.py [sqlite_file]
+"""
+
+import sys
+import time
+from datetime import datetime
+
+import bot
+from sqlite_storage import SQLiteStorage
+
+def migrate(sqlite_file):
+    """Copy current and historical JSON data into sqlite_file."""
+    start = time.perf_counter()
+    storage = SQLiteStorage(sqlite_file)
+    
+    # Archived months, split out of the legacy single file first if needed
+    bot.migrate_legacy_history()
+    history_store = bot.history_store
+    rows = 0
+    for month in history_store.months():
+        count = 0
+        for chat_id in history_store.index["months"][month]:
+            users = history_store.load(month, chat_id)
+            storage.import_data(month, {chat_id: users})
+            count += len(users)
+        rows += count
+        print(f"📦 Imported {count} rows for {month}")
+    
+    # Current data started at the last reset
+    current_month = history_store.last_reset or datetime.now().strftime('%Y-%m')
+    current_data = bot.load_all_json_data().export()
+    count = sum(len(users) for users in current_data.values())
+    storage.import_data(current_month, current_data)
+    storage.set_meta('last_reset', current_month)
+    rows += count
+    print(f"📦 Imported {count} rows for {current_month} (current)")
+    
+    storage.close()
+    print(f"✅ Migrated {rows} rows to {sqlite_file} in {time.perf_counter() - start:.2f}s")
+    print("Set STORAGE_BACKEND=sqlite in .env to use it")
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else bot.SQLITE_FILE)
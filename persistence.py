@@ -0,0 +1,123 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from log_pipeline import sample
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path, payload):
+    """Write bytes, or a list of buffers, to path atomically and return the number of bytes written."""
+    chunks = [payload] if isinstance(payload, (bytes, bytearray)) else payload
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.writelines(chunks)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())  # Ensure data is written to disk
+        # Same directory, so the rename is atomic
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)  # Clean up temp file on error
+        raise
+    return sum(memoryview(chunk).nbytes for chunk in chunks)
+
+
+class PersistenceWorker(threading.Thread):
+    """Flush engagement data to disk from a background thread.
+
+    Handlers call mark_dirty() after changing state, which is cheap enough to
+    do on the event loop. The worker wakes up every `interval` seconds, or as
+    soon as `max_pending` changes have piled up, takes a consistent snapshot
+    with `snapshot_fn` and passes it to `write_fn`, which returns the number
+    of bytes written.
+    """
+
+    def __init__(self, snapshot_fn, write_fn, interval=5.0, max_pending=500):
+        super().__init__(name="persistence", daemon=True)
+        self.snapshot_fn = snapshot_fn
+        self.write_fn = write_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._stopping = False
+        self.stats = {
+            "flushes": 0,
+            "errors": 0,
+            "last_duration": 0.0,
+            "last_bytes": 0,
+            "total_bytes": 0,
+            "total_duration": 0.0,
+        }
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def mark_dirty(self, count=1):
+        """Record that state changed; wake the worker once enough changes pile up."""
+        with self._cond:
+            self._pending += count
+            if self._pending >= self.max_pending:
+                self._cond.notify()
+
+    def flush(self, force=False):
+        """Write now if anything changed, or unconditionally with force. Safe from any thread."""
+        with self._flush_lock:
+            with self._cond:
+                pending = self._pending
+                self._pending = 0
+            if not pending and not force:
+                return False
+
+            start = time.perf_counter()
+            try:
+                written = self.write_fn(self.snapshot_fn())
+            except Exception as e:
+                with self._cond:
+                    self._pending += pending  # Try again on the next round
+                self.stats["errors"] += 1
+                logger.error(f"Error saving data: {e}")
+                return False
+
+            duration = time.perf_counter() - start
+            self.stats["flushes"] += 1
+            self.stats["last_duration"] = duration
+            self.stats["last_bytes"] = written
+            self.stats["total_bytes"] += written
+            self.stats["total_duration"] += duration
+            extra = sample("save")
+            if extra:
+                logger.info(
+                    "💾 Data saved: %d changes, %d bytes in %.1f ms", pending, written, duration * 1000,
+                    extra=extra
+                )
+            return True
+
+    def run(self):
+        logger.info("💾 Persistence worker started")
+        while True:
+            with self._cond:
+                if not self._stopping and self._pending < self.max_pending:
+                    self._cond.wait(self.interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def stop(self, timeout=30):
+        """Stop the worker and make sure everything pending is on disk."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self.is_alive():
+            self.join(timeout)
+        # Final flush, also covers the case where the worker was never started
+        self.flush(force=True)
@@ -0,0 +1,107 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """On-demand, time-boxed profile of the running bot.
+
+    Nothing is hooked until a capture starts, so it costs nothing the rest
+    of the time. A capture enables cProfile on the event loop thread (the
+    loop itself, handlers and jobs) for `seconds` and traces allocations
+    with tracemalloc over the same window; if tracemalloc was already
+    tracing from startup (PYTHONTRACEMALLOC=1) the snapshot covers the
+    whole heap instead. The report, with top functions by cumulative and
+    own time, the largest allocation sites and the sizes returned by
+    `sizes()` (memory the components account for themselves, e.g. the
+    memory-mapped sender index tracemalloc can't see), is written off the
+    loop to profile-<timestamp>.txt in `directory`, with the raw pstats
+    data beside it as .prof.
+    """
+
+    def __init__(self, directory, seconds=30, top=30, sizes=None):
+        self.directory = directory
+        self.seconds = seconds
+        self.top = top
+        self.sizes = sizes
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, seconds=None):
+        """Start a capture in the background, from the event loop.
+
+        Returns its task, which resolves to the report's path, or None if a
+        capture is already running. Can be used directly as a handler for
+        loop.add_signal_handler().
+        """
+        if self.running:
+            logger.warning("A profile is already being captured")
+            return None
+        self._task = asyncio.get_running_loop().create_task(self._capture(seconds or self.seconds))
+        return self._task
+
+    async def _capture(self, seconds):
+        logger.info(f"🔬 Profiling for {seconds:.0f}s")
+        started = time.time()
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if not tracing:
+                tracemalloc.stop()
+        sizes = self.sizes() if self.sizes is not None else {}
+        path = await asyncio.to_thread(self._write, profile, snapshot, sizes, started, seconds, tracing)
+        logger.info(f"🔬 Profile written to {path}")
+        return path
+
+    def _write(self, profile, snapshot, sizes, started, seconds, whole_heap):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S', time.localtime(started)))
+        profile.dump_stats(base + '.prof')
+
+        out = io.StringIO()
+        out.write(
+            f"Profile of pid {os.getpid()}, {seconds:.0f}s from "
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}\n\n"
+        )
+        if sizes:
+            out.write("Memory held by components\n")
+            for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+                out.write(f"  {size / 1024 / 1024:>10.1f} MiB  {name}\n")
+            out.write("\n")
+
+        stats = pstats.Stats(profile, stream=out).strip_dirs()
+        out.write("Top functions by cumulative time\n")
+        stats.sort_stats('cumulative').print_stats(self.top)
+        out.write("Top functions by own time\n")
+        stats.sort_stats('tottime').print_stats(self.top)
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        scope = "since startup" if whole_heap else "during the capture"
+        out.write(f"Largest allocation sites, live memory allocated {scope}\n")
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            frame = stat.traceback[0]
+            out.write(f"  {stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}\n")
+
+        with open(base + '.txt', 'w') as f:
+            f.write(out.getvalue())
+        return base + '.txt'
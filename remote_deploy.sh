@@ -43,7 +43,7 @@ ssh ${DROPLET_USER}@${DROPLET_IP} "mkdir -p ${REMOTE_DIR}"
 
 # 3. Option 1: Copy all necessary files to the server
 echo -e "${GREEN}Copying files to server...${NC}"
-scp bot.py requirements.txt .env .env.example deploy.sh test_watchdog.py README.md indexsy-bot.service ${DROPLET_USER}@${DROPLET_IP}:${REMOTE_DIR}/
+scp *.py requirements.txt .env .env.example deploy.sh README.md indexsy-bot.service ${DROPLET_USER}@${DROPLET_IP}:${REMOTE_DIR}/
 
 # 4. Option 2: Or clone/pull from GitHub (uncomment to use this method instead)
 # echo -e "${GREEN}Updating code from GitHub...${NC}"
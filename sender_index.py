@@ -0,0 +1,174 @@
+import logging
+import mmap
+import os
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SLOT_BYTES = 24  # message_id, user_id and the reactions credited for the message, all int64
+OLD_SLOT_BYTES = 16  # message_id + user_id, before reaction totals were kept
+
+
+class _ChatRing:
+    """Memory-mapped ring of the last `slots` messages of one chat.
+
+    Message ids in a chat are sequential, so message_id % slots is a perfect
+    hash for the most recent messages and writing a new message evicts the
+    oldest one sharing its slot.
+    """
+
+    def __init__(self, path, slots):
+        size = slots * SLOT_BYTES
+        authors = None
+        with open(path, 'a+b') as f:
+            old_size = os.fstat(f.fileno()).st_size
+            if old_size != size:
+                if old_size == slots * OLD_SLOT_BYTES:
+                    # Written before reaction totals were kept: keep its authors
+                    f.seek(0)
+                    authors = array('q', f.read())
+                # Otherwise a new chat, or the slot count changed: start empty
+                f.truncate(0)
+                f.truncate(size)
+            self.map = mmap.mmap(f.fileno(), size)
+        self.view = memoryview(self.map).cast('q')
+        self.slots = slots
+        if authors is not None:
+            self.view[0::3] = memoryview(authors[0::2])
+            self.view[1::3] = memoryview(authors[1::2])
+
+    def close(self):
+        self.view.release()
+        self.map.flush()
+        self.map.close()
+
+
+class SenderIndex:
+    """Bounded, restart-safe map of (chat_id, message_id) -> author user_id.
+
+    Beside each author it keeps the message's reaction total last credited
+    to them, so aggregate reaction counts can be turned into changes.
+
+    Each chat gets a fixed-size ring backed by a memory-mapped file in
+    `directory`, so lookups survive restarts without an explicit save.
+    Rings of the least recently used chats are unmapped once the resident
+    size would exceed `memory_budget` bytes; their files stay on disk and
+    are mapped again on the next lookup.
+    """
+
+    def __init__(self, directory, slots=8192, memory_budget=64 * 1024 * 1024):
+        self.directory = directory
+        self.slots = slots
+        self.max_chats = max(1, memory_budget // (slots * SLOT_BYTES))
+        self._rings = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.chat_evictions = 0
+
+    def _ring(self, chat_id, create=True):
+        ring = self._rings.get(chat_id)
+        if ring is not None:
+            self._rings.move_to_end(chat_id)
+            return ring
+
+        path = os.path.join(self.directory, f"{chat_id}.idx")
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        ring = _ChatRing(path, self.slots)
+        self._rings[chat_id] = ring
+        while len(self._rings) > self.max_chats:
+            _, old_ring = self._rings.popitem(last=False)
+            old_ring.close()
+            self.chat_evictions += 1
+        return ring
+
+    def add(self, chat_id, message_id, user_id):
+        """Remember the author of a message."""
+        ring = self._ring(chat_id)
+        base = 3 * (message_id % ring.slots)
+        view = ring.view
+        if view[base] not in (0, message_id):
+            self.evictions += 1
+        view[base] = message_id
+        view[base + 1] = int(user_id)
+        view[base + 2] = 0
+
+    def get(self, chat_id, message_id):
+        """Return the author's user id as a string, or None if unknown."""
+        ring = self._ring(chat_id, create=False)
+        if ring is not None:
+            base = 3 * (message_id % ring.slots)
+            if ring.view[base] == message_id:
+                self.hits += 1
+                return str(ring.view[base + 1])
+        self.misses += 1
+        return None
+
+    def add_reactions(self, chat_id, message_id, change):
+        """Return a message's author, or None if unknown, and add a change to its recorded total.
+
+        Per-user reaction updates are recorded this way, so a total arriving
+        for the message later only credits the reactions they didn't cover.
+        """
+        ring = self._ring(chat_id, create=False)
+        if ring is not None:
+            base = 3 * (message_id % ring.slots)
+            view = ring.view
+            if view[base] == message_id:
+                self.hits += 1
+                view[base + 2] = max(0, view[base + 2] + change)
+                return str(view[base + 1])
+        self.misses += 1
+        return None
+
+    def count_reactions(self, chat_id, message_id, total):
+        """Record a message's reaction total.
+
+        Returns (author user id, change since the last recorded total), or
+        None if the author is unknown.
+        """
+        ring = self._ring(chat_id, create=False)
+        if ring is not None:
+            base = 3 * (message_id % ring.slots)
+            view = ring.view
+            if view[base] == message_id:
+                self.hits += 1
+                change = total - view[base + 2]
+                view[base + 2] = total
+                return str(view[base + 1]), change
+        self.misses += 1
+        return None
+
+    def __contains__(self, chat_id):
+        return chat_id in self._rings
+
+    def __len__(self):
+        return len(self._rings)
+
+    def resident_bytes(self):
+        return len(self._rings) * self.slots * SLOT_BYTES
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "chat_evictions": self.chat_evictions,
+            "resident_chats": len(self._rings),
+            "resident_bytes": self.resident_bytes(),
+        }
+
+    def flush(self):
+        """Write mapped pages back to disk."""
+        for ring in self._rings.values():
+            ring.map.flush()
+
+    def close(self):
+        for ring in self._rings.values():
+            ring.close()
+        self._rings.clear()
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import warnings
+import zlib
+
+from telegram.error import NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Largest update line a worker accepts from the front
+MAX_UPDATE_BYTES = 4 * 1024 * 1024
+
+
+def shard_of(chat_id, shards):
+    """Shard that owns a chat; the same in every process and across restarts, unlike hash()."""
+    return zlib.crc32(str(chat_id).encode('ascii')) % shards
+
+
+def update_chat_id(update):
+    """Chat id of a raw update dict (message, reaction, member change...), or None."""
+    for value in update.values():
+        if isinstance(value, dict):
+            chat = value.get('chat')
+            if chat is not None:
+                return chat.get('id')
+    return None
+
+
+class ShardRouter:
+    """Runs one worker process per shard and hands each update to the owner of its chat.
+
+    Workers are started with `command` in their own directory under
+    `directory` (so every file they keep is per shard) and SHARD_INDEX in
+    their environment. A worker answers with one JSON line on stdout once
+    its data is loaded, carrying the last update id it processed; after
+    that the front writes updates to its stdin as JSON lines, and closing
+    stdin asks it to finish them, save and exit. Commands are per chat, so
+    they reach the worker that holds the chat's data like any other update.
+
+    Writes wait for the pipe to drain, so a worker that falls behind holds
+    back the front, and with it polling.
+    """
+
+    def __init__(self, shards, command, directory, env=None):
+        self.shards = shards
+        self.command = command
+        self.directory = directory
+        self.env = dict(os.environ if env is None else env)
+        self.processes = []
+        self.routed = [0] * shards
+        self.resume = 0
+
+    def shard_directory(self, index):
+        return os.path.join(self.directory, f"shard-{index}")
+
+    def worker_env(self, index):
+        env = dict(self.env, SHARD_INDEX=str(index), SHARDS=str(self.shards))
+        # Only the front talks to systemd
+        env.pop('NOTIFY_SOCKET', None)
+        env.pop('WATCHDOG_USEC', None)
+        return env
+
+    async def start(self):
+        """Start every worker and wait until all of them have loaded their data."""
+        for index in range(self.shards):
+            path = self.shard_directory(index)
+            os.makedirs(path, exist_ok=True)
+            process = await asyncio.create_subprocess_exec(
+                *self.command, cwd=path, env=self.worker_env(index),
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                limit=MAX_UPDATE_BYTES,
+            )
+            self.processes.append(process)
+        resumes = []
+        for index, process in enumerate(self.processes):
+            line = await process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"Shard {index} exited while starting (status {await process.wait()})")
+            resumes.append(json.loads(line)["resume"])
+        self.resume = min(resumes)
+        logger.info(f"🧩 Started {self.shards} shard workers, resuming after update {self.resume}")
+
+    async def route(self, updates):
+        """Send a batch of raw update dicts to their shards, in order within each shard."""
+        batches = {}
+        for update in updates:
+            chat_id = update_chat_id(update)
+            index = shard_of(chat_id, self.shards) if chat_id is not None else 0
+            batches.setdefault(index, []).append(json.dumps(update, ensure_ascii=False))
+        for index, lines in batches.items():
+            stdin = self.processes[index].stdin
+            stdin.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            self.routed[index] += len(lines)
+        for index in batches:
+            await self.processes[index].stdin.drain()
+
+    def send_signal(self, signum):
+        """Pass a signal on to every running worker."""
+        for process in self.processes:
+            if process.returncode is None:
+                process.send_signal(signum)
+
+    async def wait_any_exit(self):
+        """Return (index, status) of the first worker that exits."""
+        waits = {asyncio.ensure_future(process.wait()): index for index, process in enumerate(self.processes)}
+        try:
+            done, _ = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+        first = done.pop()
+        return waits[first], first.result()
+
+    async def stop(self):
+        """Close every worker's input and wait for them to save and exit. Returns their statuses."""
+        for process in self.processes:
+            if process.returncode is None:
+                process.stdin.close()
+        return [await process.wait() for process in self.processes]
+
+
+async def poll_updates(bot, router, allowed_updates, timeout=10, limit=100):
+    """Long-poll getUpdates and route every batch until cancelled.
+
+    Updates stay raw dicts: the front only reads their chat id and never
+    builds telegram.Update objects, which is most of the per-update cost.
+    Network errors are retried with a growing delay, like PTB's polling.
+    """
+    offset = router.resume + 1 if router.resume else None
+    await bot.delete_webhook()  # getUpdates is refused while a webhook is set
+    delay = 1
+    while True:
+        try:
+            with warnings.catch_warnings():
+                # do_api_request warns that get_updates exists; that one parses every update
+                warnings.simplefilter('ignore')
+                updates = await bot.do_api_request(
+                    "getUpdates",
+                    api_kwargs={"offset": offset, "timeout": timeout, "limit": limit,
+                                "allowed_updates": allowed_updates},
+                    read_timeout=timeout + 10,
+                )
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except NetworkError as e:
+            logger.warning(f"getUpdates failed, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+            continue
+        delay = 1
+        if updates:
+            await router.route(updates)
+            offset = updates[-1]["update_id"] + 1
@@ -0,0 +1,236 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from engagement_store import COUNTER_FIELDS, ChatCounters, EngagementStore, RowIndex, UserDirectory
+from persistence import atomic_write
+from windows import DAYS, WindowChat, WindowCounters
+
+MAGIC = b'IXSNAP\r\n'
+WINDOWS_MAGIC = b'IXWNDW\r\n'
+# Bump when the layout or RowIndex's hash changes; older readers refuse newer files
+VERSION = 1
+
+# magic, version, header size, four counts that depend on the file type,
+# payload bytes, CRC-32 of the counts and the payload
+HEADER = struct.Struct('<8sHHIQQQQI')
+HEADER_SIZE = 64
+COUNTS = struct.Struct('<IQQQQ')
+# Per chat: chat id, rows, index slots, offset of its block in the payload
+CHAT_ENTRY = struct.Struct('<qqqq')
+# Per chat in a windows file: the same, plus the day its buckets end on
+WINDOW_ENTRY = struct.Struct('<qqqqq')
+WINDOW_SUMS = ("week", "7d", "30d")
+
+
+class SnapshotError(Exception):
+    """A snapshot file that is truncated, corrupted or of an unknown version."""
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def _little_endian(column):
+    if sys.byteorder == 'little':
+        return column
+    column = column[:]
+    column.byteswap()
+    return column
+
+
+def _sections(columns):
+    """Chunks for columns laid out back to back, each padded to 8 bytes."""
+    chunks = []
+    for column in columns:
+        size = column.itemsize * len(column)
+        chunks += [_little_endian(column), _padding(size)]
+    return chunks
+
+
+def _size(chunks):
+    return sum(memoryview(chunk).nbytes for chunk in chunks)
+
+
+def _write(path, magic, counts, body):
+    payload_size = _size(body)
+    fields = (*counts, payload_size)
+    crc = zlib.crc32(COUNTS.pack(*fields))
+    for chunk in body:
+        crc = zlib.crc32(chunk, crc)
+    header = HEADER.pack(magic, VERSION, HEADER_SIZE, *fields, crc)
+    return atomic_write(path, [header, bytes(HEADER_SIZE - HEADER.size), *body])
+
+
+def write_snapshot(path, store):
+    """Write an EngagementStore to path atomically and return the bytes written.
+
+    Layout, all little-endian and 8-byte aligned so every column can be read
+    straight out of a memory map:
+
+        header         HEADER, zero-padded to HEADER_SIZE
+        chat table     CHAT_ENTRY per chat
+        directory      user ids (q), name offsets (q), name lengths (i),
+                       index slots (i), UTF-8 names
+        chat blocks    per chat: user ids (q), one q column per
+                       COUNTER_FIELDS entry, index slots (i)
+
+    Index slots are stored as they are, so loading needs no rehashing.
+    """
+    chats, directory = store.parts()
+    table = bytearray()
+    blocks = []
+    offset = 0
+    for chat_id, chat in chats.items():
+        block = _sections([chat.user_ids, *chat.columns, chat.index.slots])
+        table += CHAT_ENTRY.pack(int(chat_id), len(chat), len(chat.index.slots), offset)
+        blocks += block
+        offset += _size(block)
+
+    body = [table]
+    body += _sections([directory.ids, directory.starts, directory.lengths, directory.index.slots])
+    body += [directory.blob, _padding(len(directory.blob))]
+    body += blocks
+    counts = (len(chats), len(directory), len(directory.index.slots), len(directory.blob))
+    return _write(path, MAGIC, counts, body)
+
+
+def write_windows(path, windows):
+    """Write WindowCounters to path atomically and return the bytes written.
+
+    Same header as a snapshot, then a WINDOW_ENTRY per chat and a block per
+    chat: user ids (q), DAYS bucket columns (H), the WINDOW_SUMS columns (I)
+    and index slots (i).
+    """
+    chats = windows.parts()
+    table = bytearray()
+    blocks = []
+    offset = 0
+    for chat_id, chat in chats.items():
+        columns = [chat.user_ids, *chat.days, *(chat.sums[window] for window in WINDOW_SUMS)]
+        block = _sections(columns + [chat.index.slots])
+        table += WINDOW_ENTRY.pack(int(chat_id), len(chat), len(chat.index.slots), offset, chat.day)
+        blocks += block
+        offset += _size(block)
+    return _write(path, WINDOWS_MAGIC, (len(chats), DAYS, 0, 0), [table, *blocks])
+
+
+class _Reader:
+    """Reads consecutive aligned columns out of a buffer."""
+
+    def __init__(self, view, position):
+        self.view = view
+        self.position = position
+
+    def column(self, typecode, count):
+        column = array(typecode)
+        size = column.itemsize * count
+        if self.position + size > len(self.view):
+            raise SnapshotError("snapshot sections run past the end of the file")
+        column.frombytes(self.view[self.position:self.position + size])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        self.position += size + (-size % 8)
+        return column
+
+    def raw(self, size):
+        if self.position + size > len(self.view):
+            raise SnapshotError("snapshot sections run past the end of the file")
+        data = bytearray(self.view[self.position:self.position + size])
+        self.position += size + (-size % 8)
+        return data
+
+
+def _read(path, magic, parse):
+    """Map a file, check its header and checksum, and return parse(view, header_size, counts)."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER_SIZE:
+            raise SnapshotError(f"{path} is truncated ({size} bytes)")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                found, version, header_size, *fields, crc = HEADER.unpack_from(view)
+                if found != magic:
+                    raise SnapshotError(f"{path} is not a snapshot file of this kind")
+                if version > VERSION:
+                    raise SnapshotError(f"{path} has format version {version}, newer than {VERSION}")
+                payload_size = fields[-1]
+                if header_size + payload_size != size:
+                    raise SnapshotError(
+                        f"{path} is truncated or has trailing data "
+                        f"({size} bytes, expected {header_size + payload_size})"
+                    )
+                actual = zlib.crc32(view[header_size:], zlib.crc32(COUNTS.pack(*fields)))
+                if actual != crc:
+                    raise SnapshotError(
+                        f"{path} failed its checksum (CRC-32 {actual:08x}, expected {crc:08x})"
+                    )
+                return parse(view, header_size, fields[:-1])
+            finally:
+                view.release()
+
+
+def read_snapshot(path):
+    """Load an EngagementStore from a file written by write_snapshot.
+
+    The file is memory-mapped, its checksum verified, and each column
+    copied out with a single memcpy. Raises SnapshotError when the file is
+    not a valid snapshot.
+    """
+    return _read(path, MAGIC, _parse_snapshot)
+
+
+def _parse_snapshot(view, header_size, counts):
+    chat_count, user_count, slots, blob_size = counts
+    entries = [
+        CHAT_ENTRY.unpack_from(view, header_size + i * CHAT_ENTRY.size) for i in range(chat_count)
+    ]
+    reader = _Reader(view, header_size + chat_count * CHAT_ENTRY.size)
+
+    directory = UserDirectory()
+    directory.ids = reader.column('q', user_count)
+    directory.starts = reader.column('q', user_count)
+    directory.lengths = reader.column('i', user_count)
+    directory.index = RowIndex(directory.ids, slots=reader.column('i', slots))
+    directory.blob = reader.raw(blob_size)
+
+    blocks_start = reader.position
+    chats = {}
+    for chat_id, rows, chat_slots, offset in entries:
+        reader.position = blocks_start + offset
+        chat = ChatCounters()
+        chat.user_ids = reader.column('q', rows)
+        chat.columns = tuple(reader.column('q', rows) for _ in COUNTER_FIELDS)
+        chat.index = RowIndex(chat.user_ids, slots=reader.column('i', chat_slots))
+        chats[str(chat_id)] = chat
+    return EngagementStore.from_parts(chats, directory)
+
+
+def read_windows(path):
+    """Load WindowCounters from a file written by write_windows."""
+    return _read(path, WINDOWS_MAGIC, _parse_windows)
+
+
+def _parse_windows(view, header_size, counts):
+    chat_count, days = counts[:2]
+    if days != DAYS:
+        raise SnapshotError(f"windows file keeps {days} days, expected {DAYS}")
+    entries = [
+        WINDOW_ENTRY.unpack_from(view, header_size + i * WINDOW_ENTRY.size) for i in range(chat_count)
+    ]
+    blocks_start = header_size + chat_count * WINDOW_ENTRY.size
+    reader = _Reader(view, blocks_start)
+    chats = {}
+    for chat_id, rows, slots, offset, day in entries:
+        reader.position = blocks_start + offset
+        chat = WindowChat(day)
+        chat.user_ids = reader.column('q', rows)
+        chat.days = [reader.column('H', rows) for _ in range(DAYS)]
+        chat.sums = {window: reader.column('I', rows) for window in WINDOW_SUMS}
+        chat.index = RowIndex(chat.user_ids, slots=reader.column('i', slots))
+        chats[str(chat_id)] = chat
+    return WindowCounters.from_parts(chats)
@@ -0,0 +1,176 @@
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("messages", "reactions_given", "reactions_received", "total_points")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS engagement (
+    month TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    username TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    reactions_given INTEGER NOT NULL DEFAULT 0,
+    reactions_received INTEGER NOT NULL DEFAULT 0,
+    total_points INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, chat_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_engagement_leaderboard
+    ON engagement (chat_id, month, total_points DESC);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO engagement (month, chat_id, user_id, username,
+                        messages, reactions_given, reactions_received, total_points)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (month, chat_id, user_id) DO UPDATE SET
+    username = excluded.username,
+    messages = excluded.messages,
+    reactions_given = excluded.reactions_given,
+    reactions_received = excluded.reactions_received,
+    total_points = excluded.total_points
+"""
+
+SET_META = "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+
+
+def _stats(row):
+    username, *counters = row
+    stats = {"username": username}
+    stats.update(zip(COUNTER_FIELDS, counters))
+    return stats
+
+
+class SQLiteStorage:
+    """Per-(month, chat, user) engagement counters in a WAL-mode SQLite file.
+
+    Rows of the current month are written in batched transactions by the
+    persistence worker; earlier months simply stay in the table, so
+    leaderboards for any month are an indexed top-K query on
+    (chat_id, month, total_points DESC).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # One connection for the persistence worker and one for queries;
+        # WAL lets readers run while a batch is being committed.
+        self._write_conn = self._connect()
+        self._read_conn = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        with self._write_lock:
+            self._write_conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        self._write_conn.close()
+        self._read_conn.close()
+
+    def get_meta(self, key, default=None):
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._write_lock:
+            self._write_conn.execute(SET_META, (key, value))
+
+    def upsert_rows(self, month, rows, meta=None):
+        """Write (chat_id, user_id, stats) rows for a month in one transaction.
+
+        `meta` key/values are written in the same transaction. Returns the
+        approximate number of bytes of row data written.
+        """
+        params = [
+            (month, chat_id, user_id, stats["username"], *(stats[f] for f in COUNTER_FIELDS))
+            for chat_id, user_id, stats in rows
+        ]
+        if not params and not meta:
+            return 0
+        with self._write_lock:
+            conn = self._write_conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(UPSERT, params)
+                for key, value in (meta or {}).items():
+                    conn.execute(SET_META, (key, value))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return sum(len(p[1]) + len(p[2]) + len(p[3] or '') for p in params) + 32 * len(params)
+
+    def import_data(self, month, data):
+        """Import a whole {chat_id: {user_id: stats}} mapping for a month."""
+        return self.upsert_rows(month, (
+            (chat_id, user_id, stats)
+            for chat_id, users in data.items()
+            for user_id, stats in users.items()
+        ))
+
+    def load_month(self, month):
+        """Load every row of a month as {chat_id: {user_id: stats}}."""
+        data = {}
+        with self._read_lock:
+            cursor = self._read_conn.execute(
+                "SELECT chat_id, user_id, username, messages, reactions_given, "
+                "reactions_received, total_points FROM engagement WHERE month = ?",
+                (month,)
+            )
+            for chat_id, user_id, *row in cursor:
+                data.setdefault(chat_id, {})[user_id] = _stats(row)
+        return data
+
+    def load_chat(self, month, chat_id):
+        """Load one chat's rows of a month as {user_id: stats}."""
+        with self._read_lock:
+            cursor = self._read_conn.execute(
+                "SELECT user_id, username, messages, reactions_given, reactions_received, "
+                "total_points FROM engagement WHERE chat_id = ? AND month = ?",
+                (chat_id, month)
+            )
+            return {user_id: _stats(row) for user_id, *row in cursor}
+
+    def top(self, chat_id, month, limit):
+        """Return the top (user_id, stats) pairs of a chat for a month."""
+        with self._read_lock:
+            cursor = self._read_conn.execute(
+                "SELECT user_id, username, messages, reactions_given, reactions_received, "
+                "total_points FROM engagement WHERE chat_id = ? AND month = ? "
+                "ORDER BY total_points DESC LIMIT ?",
+                (chat_id, month, limit)
+            )
+            return [(user_id, _stats(row)) for user_id, *row in cursor]
+
+    def summary(self, chat_id, month):
+        """Number of users and total points of a chat for a month."""
+        with self._read_lock:
+            user_count, points = self._read_conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total_points), 0) FROM engagement "
+                "WHERE chat_id = ? AND month = ?",
+                (chat_id, month)
+            ).fetchone()
+        return user_count, points
+
+    def months(self, chat_id):
+        """Months with recorded data for a chat, newest first."""
+        with self._read_lock:
+            cursor = self._read_conn.execute(
+                "SELECT DISTINCT month FROM engagement WHERE chat_id = ? ORDER BY month DESC",
+                (chat_id,)
+            )
+            return [month for (month,) in cursor]
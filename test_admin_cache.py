@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for the admin status cache, using a stubbed bot object.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from admin_cache import AdminCache
+
+class StubBot:
+    """Answers admin lookups from a dict and counts the API calls."""
+
+    def __init__(self, admins, private_chats=()):
+        self.admins = admins  # chat_id -> set of admin user ids
+        self.private_chats = set(private_chats)
+        self.calls = []
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls.append(("get_chat_administrators", chat_id))
+        if chat_id in self.private_chats:
+            raise RuntimeError("There are no administrators in the private chat")
+        return [
+            SimpleNamespace(user=SimpleNamespace(id=int(user_id)), status="administrator")
+            for user_id in self.admins.get(chat_id, ())
+        ]
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append(("get_chat_member", chat_id, user_id))
+        is_admin = user_id in self.admins.get(chat_id, ())
+        return SimpleNamespace(status="creator" if is_admin else "member")
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_bulk_warm_answers_whole_chat():
+    bot = StubBot({"-100": {"1", "2"}})
+    cache = AdminCache(ttl=60)
+    
+    async def run():
+        return [await cache.is_admin(bot, "-100", user_id) for user_id in ("1", "2", "3", "1")]
+    
+    assert asyncio.run(run()) == [True, True, False, True]
+    assert bot.calls == [("get_chat_administrators", "-100")]
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+def test_entries_expire_after_ttl():
+    bot = StubBot({"-100": {"1"}})
+    clock = FakeClock()
+    cache = AdminCache(ttl=60, clock=clock)
+    
+    asyncio.run(cache.is_admin(bot, "-100", "1"))
+    clock.now = 59
+    asyncio.run(cache.is_admin(bot, "-100", "1"))
+    assert len(bot.calls) == 1
+    
+    clock.now = 61
+    asyncio.run(cache.is_admin(bot, "-100", "1"))
+    assert len(bot.calls) == 2
+
+def test_private_chat_falls_back_to_member_lookup():
+    bot = StubBot({"42": {"42"}}, private_chats={"42"})
+    cache = AdminCache(ttl=60)
+    
+    assert asyncio.run(cache.is_admin(bot, 42, 42)) is True
+    assert asyncio.run(cache.is_admin(bot, 42, 42)) is True
+    assert [call[0] for call in bot.calls] == ["get_chat_administrators", "get_chat_member"]
+
+def test_chat_member_updates_invalidate_entries():
+    bot = StubBot({"-100": {"1"}})
+    cache = AdminCache(ttl=60)
+    asyncio.run(cache.is_admin(bot, "-100", "1"))
+    
+    cache.update_member(-100, 1, "member")
+    cache.update_member(-100, 5, "administrator")
+    assert asyncio.run(cache.is_admin(bot, "-100", "1")) is False
+    assert asyncio.run(cache.is_admin(bot, "-100", "5")) is True
+    assert len(bot.calls) == 1
+
+def test_size_bound_evicts_least_recently_used():
+    bot = StubBot({str(-i): {"1"} for i in range(1, 5)})
+    cache = AdminCache(ttl=60, max_entries=2)
+    
+    for chat_id in ("-1", "-2", "-3"):
+        asyncio.run(cache.is_admin(bot, chat_id, "1"))
+    assert cache.stats()["chats"] == 2
+    
+    asyncio.run(cache.is_admin(bot, "-1", "1"))
+    assert bot.calls[-1] == ("get_chat_administrators", "-1")
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact engagement counter store.
+"""
+
+import json
+import random
+
+from engagement_store import EngagementStore, RowIndex, UserDirectory
+
+def test_json_format_round_trips():
+    data = {
+        "-100": {
+            "7": {"username": "alice", "messages": 3, "reactions_given": 1,
+                  "reactions_received": 2, "total_points": 6},
+            "8": {"username": "Bob 🚀", "messages": 0, "reactions_given": 4,
+                  "reactions_received": 0, "total_points": 4},
+        },
+        "-200": {
+            "7": {"username": "alice", "messages": 1, "reactions_given": 0,
+                  "reactions_received": 0, "total_points": 1},
+        },
+    }
+    store = EngagementStore.from_dict(json.loads(json.dumps(data)))
+    assert store.export() == data
+    assert store.user_count() == 3
+    assert store.get("-100", "8") == data["-100"]["8"]
+    assert store.points("-100") == [("7", 6), ("8", 4)]
+
+def test_increment_creates_rows_only_with_a_username():
+    store = EngagementStore()
+    assert not store.increment("-1", "10", "reactions_received")
+    assert "-1" not in store
+
+    assert store.increment("-1", "10", "messages", "carol")
+    assert store.increment("-1", "10", "reactions_given", "carol")
+    assert store.increment("-1", "10", "reactions_received")
+    assert store.counters("-1", "10") == [1, 1, 1, 3]
+    assert store.counters("-1", "11") is None
+    assert store.has("-1", "10") and not store.has("-2", "10")
+
+def test_add_takes_points_back_down_to_zero():
+    store = EngagementStore()
+    assert store.add("-1", "10", "reactions_received", 5) == 0
+    assert store.add("-1", "10", "messages", 2, "carol") == 2
+    assert store.add("-1", "10", "reactions_received", 3) == 3
+    assert store.add("-1", "10", "reactions_received", -4) == -3
+    assert store.counters("-1", "10") == [2, 0, 0, 2]
+
+def test_usernames_are_shared_between_chats():
+    store = EngagementStore()
+    store.increment("-1", "10", "messages", "old_name")
+    store.increment("-2", "10", "messages", "a_much_longer_new_name")
+    assert store.get("-1", "10")["username"] == "a_much_longer_new_name"
+    store.increment("-1", "10", "messages", "short")
+    assert store.export()["-2"]["10"]["username"] == "short"
+
+def test_reset_and_set_counters():
+    store = EngagementStore()
+    store.set_counters("-1", "10", [5, 1, 0, 6], "dave")
+    store.set_counters("-1", "11", [2, 0, 0, 2], "erin")
+    store.reset_chat("-1")
+    assert store.users("-1") == ["10", "11"]
+    assert store.points("-1") == [("10", 0), ("11", 0)]
+    store.increment("-1", "11", "messages")
+    assert store.counters("-1", "11") == [1, 0, 0, 1]
+
+def test_chats_move_between_stores_with_their_names():
+    store = EngagementStore()
+    store.set_counters("-1", "10", [3, 0, 0, 3], "frank")
+    store.set_counters("-2", "10", [1, 0, 0, 1], "frank")
+    store.set_counters("-2", "11", [2, 0, 0, 2], "grace")
+    saved = store.chat_store("-2")
+    assert saved.chats() == ["-2"] and saved.export()["-2"] == store.export()["-2"]
+
+    store.drop_chat("-2")
+    assert "-2" not in store and store.nbytes("-2") == 0
+    assert store.prune_names() == 1  # grace is left in no chat
+    assert store.username("11") is None
+
+    store.increment("-1", "10", "messages", "frank_renamed")
+    store.add_chat("-2", saved)
+    assert store.counters("-2", "11") == [2, 0, 0, 2]
+    assert store.username("11") == "grace"
+    assert store.username("10") == "frank_renamed"  # The name seen last wins
+    saved.increment("-2", "11", "messages")
+    assert store.counters("-2", "11") == [3, 0, 0, 3]  # Taken over, not copied
+
+def test_row_index_finds_every_id_through_growth():
+    rng = random.Random(3)
+    keys = rng.sample(range(1, 10 ** 12), 5000) + [2 ** 40 * i for i in range(1, 500)]
+    directory = UserDirectory()
+    for key in keys:
+        directory.set(key, f"user{key}")
+    assert len(directory) == len(keys)
+    assert all(directory.get(key) == f"user{key}" for key in keys)
+    assert directory.get(10 ** 12 + 1) is None
+
+    index = RowIndex(directory.ids)
+    assert [index.find(key) for key in keys] == list(range(len(keys)))
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
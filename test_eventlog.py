@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tests for recovering the event log after a crash or a failed write.
+"""
+
+import os
+import tempfile
+
+import bot
+from conftest import fresh_bot
+from eventlog import EventLog
+
+def event(number):
+    return {"e": "message", "c": "-1", "u": "10", "n": "user10", "m": "2026-01", "v": [number, 0, 0, number]}
+
+def count_messages(chat_id, user_id, messages):
+    """Count messages for a user the way track_message does."""
+    with bot.data_lock:
+        for _ in range(messages):
+            bot.engagement_data.increment(chat_id, user_id, "messages", f"user{user_id}")
+        bot.record_change("message", chat_id, user_id)
+    bot.persistence.mark_dirty()
+
+def restart():
+    """Reload the counters from disk as a new process would."""
+    bot.event_log = EventLog(bot.EVENT_LOG_FILE)
+    bot.engagement_data = bot.load_data()
+
+def test_failed_compaction_keeps_events_in_order():
+    with tempfile.TemporaryDirectory() as directory:
+        log = EventLog(os.path.join(directory, "events.log"))
+        log.write([event(1), event(2)])
+        log.start_compaction()  # The snapshot write fails, so finish_compaction never runs
+        log.write([event(3)])
+        assert [e["v"][0] for e in log.replay()] == [1, 2, 3]
+
+        # The next compaction appends onto the leftover segment instead of replacing it
+        log.start_compaction()
+        assert not os.path.exists(log.path)
+        assert [e["v"][0] for e in EventLog(log.path).replay()] == [1, 2, 3]
+        log.finish_compaction()
+        assert list(log.replay()) == []
+        assert not log.compaction_due()
+
+def test_torn_last_line_is_skipped():
+    with tempfile.TemporaryDirectory() as directory:
+        log = EventLog(os.path.join(directory, "events.log"))
+        log.write([event(1), event(2)])
+        with open(log.path, 'ab') as f:
+            f.write(b'{"e":"message","c":"-1","u":')  # Crashed mid-write
+        log = EventLog(log.path)
+        assert [e["v"][0] for e in log.replay()] == [1, 2]
+
+        # The torn bytes are cut before the next append, which would otherwise be lost with them
+        log.write([event(3)])
+        assert [e["v"][0] for e in EventLog(log.path).replay()] == [1, 2, 3]
+
+        # Torn on the very first line
+        with open(log.path, 'wb') as f:
+            f.write(b'{"e":"mess')
+        EventLog(log.path).write([event(4)])
+        assert [e["v"][0] for e in EventLog(log.path).replay()] == [4]
+
+def test_bot_reloads_over_a_torn_line_and_a_leftover_segment():
+    with fresh_bot():
+        count_messages("-1", "10", 2)
+        bot.save_data()
+        bot.event_log.start_compaction()  # Crashed before the snapshot was written
+        count_messages("-1", "10", 3)
+        bot.save_data()
+        with open(bot.EVENT_LOG_FILE, 'ab') as f:
+            f.write(b'{"e":"mess')
+
+        restart()
+        assert bot.engagement_data.get("-1", "10")["messages"] == 5
+        count_messages("-1", "10", 1)
+        bot.save_data()
+        restart()
+        assert bot.engagement_data.get("-1", "10")["messages"] == 6
+
+        # Compacting now folds both segments into the chat's file
+        bot.event_log.force_compaction()
+        assert bot.persistence.flush(force=True)
+        assert not os.path.exists(bot.event_log.compacting_path)
+        restart()
+        bot.load_chat("-1")
+        assert bot.engagement_data.get("-1", "10")["messages"] == 6
+
+def test_failed_write_puts_events_back_in_order():
+    with fresh_bot():
+        count_messages("-1", "10", 1)
+        write = bot.event_log.write
+
+        def full_disk(events):
+            raise OSError("No space left on device")
+
+        bot.event_log.write = full_disk
+        assert not bot.persistence.flush()
+        assert bot.persistence.stats["errors"] == 1
+        count_messages("-1", "10", 1)  # Arrives after the failed write
+        with bot.data_lock:
+            assert [e["v"][0] for e in bot.event_log._buffer if e["e"] == "message"] == [1, 2]
+
+        bot.event_log.write = write
+        assert bot.persistence.flush()
+        restart()
+        assert bot.engagement_data.get("-1", "10")["messages"] == 2
+        assert [e["v"][0] for e in bot.event_log.replay() if e["e"] == "message"] == [1, 2]
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
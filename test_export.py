@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for the /export admin command.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from conftest import fresh_bot
+from fake_telegram import FakeBotAPI, FakeRequest, message_update
+
+def run_commands(api, *commands):
+    """Process (user_id, text) commands in chat -1 through an Application on the fake Bot API."""
+    app = Application.builder().token('123456:TEST').request(FakeRequest(api)).build()
+    bot.add_handlers(app)
+
+    async def run():
+        async with app:
+            for message_id, (user_id, text) in enumerate(commands, 1):
+                update = message_update(message_id, -1, user_id, message_id, text)
+                await app.process_update(Update.de_json(update, app.bot))
+
+    asyncio.run(run())
+
+def add_users(count, points=lambda i: i):
+    for i in range(count):
+        for _ in range(points(i)):
+            bot.engagement_data.increment("-1", str(100 + i), "messages", f"user{100 + i}")
+
+def test_export_csv_has_current_and_archived_months():
+    api = FakeBotAPI(admins={-1: {10}})
+    with fresh_bot():
+        add_users(3, lambda i: i + 1)
+        bot.history_store.archive_chat('2000-01', "-1", {
+            "7": {"username": "old", "messages": 4, "reactions_given": 1,
+                  "reactions_received": 0, "total_points": 5},
+        })
+        run_commands(api, (11, '/export'), (10, '/export'), (10, '/export xml'))
+    assert api.sent[0]["text"] == "This command is only available to admins!"
+    assert api.sent[1]["text"] == "Usage: /export [csv|jsonl]"
+    (document,) = api.documents
+    assert document["filename"] == "engagement--1-part1.csv"
+    assert document["caption"] == "📤 4 rows over 2 months"
+    rows = list(csv.DictReader(io.StringIO(document["content"].decode('utf-8'))))
+    assert [(row["month"], row["username"], row["total_points"]) for row in rows] == [
+        (bot.data_month, "user102", "3"), (bot.data_month, "user101", "2"),
+        (bot.data_month, "user100", "1"), ("2000-01", "old", "5"),
+    ]
+
+def test_large_export_is_gzipped_and_split_into_parts():
+    api = FakeBotAPI()
+    old_rows, old_part = bot.EXPORT_GZIP_ROWS, bot.EXPORT_PART_MB
+    bot.EXPORT_GZIP_ROWS, bot.EXPORT_PART_MB = 100, 0.01
+    try:
+        with fresh_bot():
+            add_users(5000, lambda i: i % 7 + 1)
+            run_commands(api, (10, '/export jsonl'))
+    finally:
+        bot.EXPORT_GZIP_ROWS, bot.EXPORT_PART_MB = old_rows, old_part
+    assert len(api.documents) > 1
+    rows = []
+    for part, document in enumerate(api.documents, 1):
+        assert document["filename"] == f"engagement--1-part{part}.jsonl.gz"
+        assert document["caption"].endswith(f"(part {part} of {len(api.documents)})")
+        rows += [json.loads(line) for line in gzip.decompress(document["content"]).splitlines()]
+    assert len(rows) == 5000 and len({row["user_id"] for row in rows}) == 5000
+    points = [row["total_points"] for row in rows]
+    assert points == sorted(points, reverse=True)
+    assert not bot.running_exports
+
+def test_archived_months_are_read_one_user_at_a_time():
+    with fresh_bot():
+        bot.history_store.archive_chat('2000-01', "-1", {
+            "7": {"username": "a", "total_points": 1}, "8": {"username": "b", "total_points": 2},
+        })
+        os.makedirs(os.path.join(bot.HISTORY_DIR, '2000-02'))
+        with open(os.path.join(bot.HISTORY_DIR, '2000-02', '-1.json'), 'w') as f:
+            f.write(' {\n "9" : {"username": "c, d", "total_points": 3} }\n')
+        assert [user_id for user_id, _ in bot.history_store.iter_users('2000-01', "-1")] == ["8", "7"]
+        assert list(bot.history_store.iter_users('2000-02', "-1")) == [
+            ("9", {"username": "c, d", "total_points": 3})
+        ]
+        assert list(bot.history_store.iter_users('2000-03', "-1")) == []
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Tests for loading chats on first use and evicting inactive ones.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+import migrate_to_sqlite
+from chat_files import ResidentChats
+from conftest import fresh_bot
+from eventlog import EventLog
+from fake_telegram import FakeBotAPI, FakeRequest, message_update
+from sqlite_storage import SQLiteStorage
+
+def send(*messages):
+    """Process (chat_id, user_id, text) messages through an Application on the fake Bot API."""
+    api = FakeBotAPI()
+    app = Application.builder().token('123456:TEST').request(FakeRequest(api)).build()
+    bot.add_handlers(app)
+    bot.add_update_tracking(app)
+
+    async def run():
+        async with app:
+            for chat_id, user_id, text in messages:
+                update_id = bot.last_update_id + 1
+                update = message_update(update_id, chat_id, user_id, update_id, text)
+                await app.process_update(Update.de_json(update, app.bot))
+            if bot.eviction_task is not None:
+                await bot.eviction_task
+
+    asyncio.run(run())
+    return api
+
+def compact():
+    bot.event_log.force_compaction()
+    bot.persistence.flush(force=True)
+
+def restart():
+    """Reload state from disk as a new process would."""
+    bot.event_log = EventLog(bot.EVENT_LOG_FILE)
+    bot.recent_update_ids.clear()
+    bot.dirty_chats.clear()
+    bot.engagement_data = bot.load_data()
+    bot.leaderboards.rebuild(bot.engagement_data)
+
+def test_chats_are_loaded_on_first_use():
+    with fresh_bot():
+        send(*[(-1, 10 + i % 2, "hi") for i in range(5)], (-2, 20, "hi"), (-3, 30, "hi"))
+        compact()
+        send((-2, 20, "hi"))
+        bot.save_data()
+
+        # Only the chat changed since the last compaction is loaded at startup
+        restart()
+        assert bot.engagement_data.chats() == ["-2"]
+        assert bot.engagement_data.get("-2", "20")["messages"] == 2
+
+        api = send((-1, 12, "/stats"))
+        assert "1. @user10 - Total points: 3" in api.sent[0]["text"]
+        assert sorted(bot.engagement_data.chats()) == ["-1", "-2"]
+        assert bot.resident_chats.loads == 1
+
+def test_inactive_chats_are_saved_then_evicted():
+    with fresh_bot(resident_chats=ResidentChats(idle_seconds=0.2)):
+        send((-1, 10, "hi"), (-2, 20, "hi"), (-3, 30, "hi"))
+        time.sleep(0.3)
+        send((-3, 30, "hi"))
+        # Unsaved changes are written to the chats' files before they are dropped
+        asyncio.run(bot.evict_chats())
+        assert bot.engagement_data.chats() == ["-3"]
+        assert sorted(bot.chat_files.chats()) == ["-1", "-2", "-3"]
+        assert bot.leaderboards.get("-1") is None
+        assert bot.resident_chats.evictions == 2
+        assert bot.engagement_data.username("10") is None  # Names of users left in no chat go too
+
+        send((-1, 10, "again"))
+        assert bot.engagement_data.get("-1", "10")["messages"] == 2
+        assert bot.leaderboards.rank("-1", "10") == 1
+
+def test_chat_used_while_saving_stays():
+    with fresh_bot(resident_chats=ResidentChats(idle_seconds=0.1)):
+        send((-1, 10, "hi"), (-2, 20, "hi"))
+        time.sleep(0.2)
+        write_pending = bot.persistence.write_fn
+
+        def write_and_count(pending):
+            written = write_pending(pending)
+            with bot.data_lock:  # A message arrives in -1 meanwhile
+                bot.resident_chats.touch("-1")
+                bot.engagement_data.increment("-1", "10", "messages", "user10")
+                bot.record_change("message", "-1", "10")
+            return written
+
+        bot.persistence.write_fn = write_and_count
+        asyncio.run(bot.evict_chats())
+        assert bot.engagement_data.chats() == ["-1"]
+        assert bot.engagement_data.get("-1", "10")["messages"] == 2
+
+def test_eviction_waits_for_a_save_in_progress():
+    with fresh_bot(resident_chats=ResidentChats(idle_seconds=0.1)):
+        send((-1, 10, "hi"))
+        time.sleep(0.2)
+        write_pending = bot.persistence.write_fn
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_write(pending):
+            writing.set()
+            release.wait()
+            return write_pending(pending)
+
+        # A compaction has taken -1 out of dirty_chats but not written its file yet
+        bot.persistence.write_fn = slow_write
+        bot.event_log.force_compaction()
+        saving = threading.Thread(target=bot.persistence.flush, args=(True,))
+        saving.start()
+        writing.wait()
+        assert not bot.dirty_chats
+        threading.Timer(0.2, release.set).start()
+        asyncio.run(bot.evict_chats())
+        assert "-1" in bot.chat_files  # Dropped only once its file was written
+        assert bot.engagement_data.chats() == []
+        saving.join()
+
+        bot.load_chat("-1")
+        assert bot.engagement_data.get("-1", "10")["messages"] == 1
+
+def test_least_recently_used_chats_go_over_the_memory_cap():
+    with fresh_bot():
+        send(*[(-chat, user, "hi") for chat in (1, 2, 3) for user in range(50)])
+        budget = bot.engagement_data.nbytes() - 1
+        bot.resident_chats.memory_budget = budget
+        # Updates to chats in memory don't size them all; the periodic check does
+        send((-2, 1, "hi"))
+        assert len(bot.engagement_data) == 3
+        asyncio.run(bot.evict_chats())
+        assert sorted(bot.engagement_data.chats()) == ["-2", "-3"]
+        assert bot.engagement_data.nbytes() <= budget
+
+        # Loading a chat from its file checks the cap right away
+        send((-1, 1, "again"))
+        assert sorted(bot.engagement_data.chats()) == ["-1", "-2"]
+        assert bot.engagement_data.get("-1", "1")["messages"] == 2
+        assert bot.engagement_data.user_count("-1") == 50
+
+def test_migration_to_sqlite_takes_compacted_chats():
+    with fresh_bot():
+        send((-1, 10, "hi"), (-1, 10, "hi"), (-2, 20, "hi"))
+        compact()
+        send((-2, 20, "hi"))
+        bot.save_data()
+        restart()
+
+        migrate_to_sqlite.migrate('migrated.db')
+        storage = SQLiteStorage('migrated.db')
+        try:
+            month = storage.get_meta('last_reset')
+            # -1 is only in its chat file, -2 also has newer events in the log
+            assert storage.load_chat(month, "-1")["10"]["messages"] == 2
+            assert storage.load_chat(month, "-2")["20"]["messages"] == 2
+        finally:
+            storage.close()
+
+def test_unreadable_chat_file_skips_its_updates():
+    with fresh_bot():
+        os.makedirs(bot.CHAT_DIR)
+        with open(bot.chat_files.path("-5"), 'wb') as f:
+            f.write(b'garbage')
+        api = send((-5, 10, "hi"), (-5, 10, "/rank"))
+        compact()
+        assert "-5" not in bot.engagement_data
+        assert api.sent == []
+        with open(bot.chat_files.path("-5"), 'rb') as f:
+            assert f.read() == b'garbage'  # Left for recovery, not written over
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental leaderboards, against sorting every user's points.
+"""
+
+import random
+
+from engagement_store import EngagementStore
+from leaderboard import Leaderboard, LeaderboardIndex, _Fenwick
+
+def expected_rank(points, user_id):
+    """Users with the same score share a position."""
+    return 1 + sum(1 for score in points.values() if score > points[user_id])
+
+def test_fenwick_counts_through_growth():
+    counts = _Fenwick(4)
+    values = [0, 3, 3, 5, 64, 1000, 3]
+    for value in values:
+        counts.add(value, 1)
+    counts.add(5, -1)
+    assert counts.count_at(3) == 3
+    assert counts.count_at(5) == 0
+    assert counts.count_at(1000) == 1
+    assert counts.prefix(4) == 4
+    assert counts.prefix(10 ** 6) == 6
+
+def test_matches_sorting_under_random_changes():
+    rng = random.Random(7)
+    board = Leaderboard()
+    points, reached = {}, {}
+    for step in range(5000):
+        user_id = str(rng.randrange(200))
+        if rng.random() < 0.3 and user_id in points:
+            # Removed reactions take points back, so scores also go down
+            score = max(0, points[user_id] - rng.randrange(1, 5))
+        else:
+            score = points.get(user_id, 0) + rng.choice((1, 1, 1, 3, 100))
+        board.set_points(user_id, score)
+        if points.get(user_id) != score:
+            reached[user_id] = step
+        points[user_id] = score
+
+        if step % 50 == 0:
+            # Best first; ties ordered by who reached the score first
+            expected = sorted(points, key=lambda u: (-points[u], reached[u]))
+            assert board.top(10) == expected[:10]
+            assert board.top(1000) == expected
+            for other in points:
+                assert board.rank(other) == expected_rank(points, other)
+    assert len(board) == len(points)
+    assert board.rank("unknown") is None
+
+def test_built_board_matches_incremental_one():
+    rng = random.Random(3)
+    pairs = [(str(user), rng.randrange(50)) for user in range(300)]
+    built, incremental = Leaderboard(pairs), Leaderboard()
+    for user_id, score in pairs:
+        incremental.set_points(user_id, score)
+    points = dict(pairs)
+    for user_id in points:
+        assert built.rank(user_id) == incremental.rank(user_id) == expected_rank(points, user_id)
+    assert sorted(built.top(20), key=points.get) == sorted(incremental.top(20), key=points.get)
+
+def test_index_follows_the_store():
+    store = EngagementStore()
+    for user in range(5):
+        for _ in range(user + 1):
+            store.increment("-1", str(user), "messages", f"user{user}")
+    store.increment("-2", "9", "messages", "user9")
+    index = LeaderboardIndex()
+    index.rebuild(store)
+    assert index.top("-1", 3) == ["4", "3", "2"]
+    assert index.rank("-1", "0") == 5
+    assert index.size("-2") == 1
+
+    index.add_points("-1", "0", 10)
+    assert index.top("-1", 1) == ["0"]
+    index.drop_chat("-1")
+    assert index.top("-1", 3) == [] and index.rank("-1", "0") is None
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
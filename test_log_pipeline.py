@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the queued, sampled JSON logging pipeline.
+"""
+
+import io
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+from log_pipeline import LogPipeline, parse_sample_rates, sample
+
+@contextmanager
+def pipeline(**options):
+    """A started LogPipeline writing to a StringIO; the root logger is restored afterwards."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    stream = io.StringIO()
+    logs = LogPipeline(stream=stream, **options).start()
+    try:
+        yield logs, stream
+    finally:
+        logs.stop()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_records_are_written_as_json_by_the_writer_thread():
+    formatted_on = []
+
+    class Name:
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return "zoë"
+
+    log = logging.getLogger("test_log_pipeline")
+    with pipeline() as (logs, stream):
+        log.info("📝 Message from %s in chat %s", Name(), -100, extra=sample("message"))
+        log.debug("below the level")
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            log.error("Error tracking message", exc_info=True)
+    first, second = lines(stream)
+    assert first["msg"] == "📝 Message from zoë in chat -100"
+    assert first["level"] == "INFO" and first["logger"] == "test_log_pipeline"
+    assert first["event"] == "message" and "ts" in first
+    assert "ZeroDivisionError" in second["exc"]
+    assert formatted_on and threading.current_thread() not in formatted_on
+
+def test_high_volume_events_are_sampled():
+    log = logging.getLogger("test_log_pipeline")
+    with pipeline(sample_rates={"message": 10}) as (logs, stream):
+        for i in range(100):
+            extra = sample("message")
+            if extra:
+                log.info("message %d", i, extra=extra)
+        log.info("saved", extra=sample("save"))
+        log.info("started")
+    records = lines(stream)
+    messages = [record for record in records if record["msg"].startswith("message")]
+    assert [record["msg"] for record in messages] == [f"message {i}" for i in range(0, 100, 10)]
+    assert all(record["sample_rate"] == 10 and record["event"] == "message" for record in messages)
+    assert records[10]["event"] == "save" and "sample_rate" not in records[10]
+    assert records[11]["msg"] == "started"
+    assert logs.stats()["sampled_out"] == 90
+
+def test_full_queue_drops_instead_of_blocking():
+    log = logging.getLogger("test_log_pipeline")
+    with pipeline(queue_size=5, json_output=False) as (logs, stream):
+        logs.listener.stop()  # Nothing drains the queue
+        logs.running = False
+        for i in range(20):
+            log.info("line %d", i)
+        assert logs.stats()["dropped"] == 15
+        assert logs.stats()["queued"] == 5
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("message=100, reaction=50,,save=0") == {"message": 100, "reaction": 50, "save": 1}
+    assert parse_sample_rates("") == {}
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics registry, handler instrumentation and /metrics endpoint.
+"""
+
+import asyncio
+import logging
+import threading
+import urllib.request
+from types import SimpleNamespace
+
+import bot
+from conftest import fresh_bot
+from metrics import ErrorCounter, MetricsRegistry, MetricsServer, instrument_handlers
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", ["handler"], buckets=(0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 3):
+        histogram.observe(value, "track_message")
+
+    text = registry.render()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{handler="track_message",le="0.01"} 2' in text
+    assert 'latency_seconds_bucket{handler="track_message",le="0.1"} 3' in text
+    assert 'latency_seconds_bucket{handler="track_message",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{handler="track_message"} 4' in text
+
+def test_counters_callbacks_and_label_escaping():
+    registry = MetricsRegistry()
+    counter = registry.counter("errors_total", "Errors", ["function"])
+    counter.inc('say "hi"')
+    counter.inc('say "hi"', amount=2)
+    registry.callback("queue_depth", "Queue depth", lambda: 7)
+    registry.callback("broken", "Fails to collect", lambda: 1 / 0)
+
+    text = registry.render()
+    assert 'errors_total{function="say \\"hi\\""} 3' in text
+    assert 'queue_depth 7' in text
+    assert 'broken' not in text
+
+def test_error_counter_counts_logged_errors():
+    registry = MetricsRegistry()
+    counter = registry.counter("errors_total", "Errors", ["module", "function"])
+    log = logging.getLogger("test_metrics_errors")
+    handler = ErrorCounter(counter)
+    log.addHandler(handler)
+    try:
+        def track_message():
+            try:
+                raise ValueError("boom")
+            except Exception as e:
+                log.error(f"Error tracking message: {e}")
+        track_message()
+        log.warning("not an error")
+    finally:
+        log.removeHandler(handler)
+
+    assert counter.value("test_metrics", "track_message") == 1
+    assert sum(counter._values.values()) == 1
+
+def test_instrumented_handlers_are_timed_even_when_they_raise():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", ["handler"])
+
+    async def show_stats(update, context):
+        return "ok"
+
+    async def track_reaction(update, context):
+        raise RuntimeError("boom")
+
+    app = SimpleNamespace(handlers={0: [SimpleNamespace(callback=show_stats),
+                                        SimpleNamespace(callback=track_reaction)]})
+    instrument_handlers(app, histogram)
+
+    assert asyncio.run(app.handlers[0][0].callback(None, None)) == "ok"
+    try:
+        asyncio.run(app.handlers[0][1].callback(None, None))
+    except RuntimeError:
+        pass
+    assert histogram.count("show_stats") == 1
+    assert histogram.count("track_reaction") == 1
+
+def test_metrics_endpoint_serves_text_format():
+    registry = MetricsRegistry()
+    registry.callback("engagement_users", "Users", lambda: 42)
+    server = MetricsServer(registry, port=0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "engagement_users 42" in response.read().decode()
+    finally:
+        server.stop()
+
+def test_bot_metrics_render_while_chats_change():
+    class Errors(logging.Handler):
+        def __init__(self):
+            super().__init__(level=logging.ERROR)
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    errors = Errors()
+    logging.getLogger("metrics").addHandler(errors)
+    with fresh_bot():
+        done = threading.Event()
+
+        def scrape():
+            while not done.is_set():
+                bot.metrics.render()
+
+        scraper = threading.Thread(target=scrape)
+        scraper.start()
+        try:
+            # Chats come and go on the event loop as they are loaded and evicted
+            for round in range(4000):
+                with bot.data_lock:
+                    bot.engagement_data.increment(str(-1 - round), "10", "messages", "user10")
+                    bot.window_counters.add(str(-1 - round), "10")
+                    if round >= 500:
+                        bot.engagement_data.drop_chat(str(-1 - round + 500))
+        finally:
+            done.set()
+            scraper.join()
+            logging.getLogger("metrics").removeHandler(errors)
+    assert errors.messages == []
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
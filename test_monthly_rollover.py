@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Tests for the scheduled monthly rollover, including a timing run at 100k users.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import bot
+from conftest import fresh_bot
+from history_store import HistoryStore
+
+OLD_MONTH = '2000-01'
+NEW_MONTH = datetime.now().strftime('%Y-%m')
+
+@contextmanager
+def last_month_bot():
+    """Fresh bot state still in OLD_MONTH, so the next check rolls it over."""
+    with fresh_bot(data_month=OLD_MONTH):
+        bot.history_store.last_reset = OLD_MONTH
+        yield
+
+def add_points(chat_id, user_id, messages):
+    """Count messages for a user the way track_message does."""
+    with bot.data_lock:
+        for _ in range(messages):
+            bot.engagement_data.increment(chat_id, user_id, "messages", f"user{user_id}")
+        bot.record_change("message", chat_id, user_id)
+    bot.persistence.mark_dirty()
+
+def test_rollover_archives_and_resets_live_data():
+    with last_month_bot():
+        add_points("-1", "10", 5)
+        add_points("-1", "11", 7)
+        add_points("-2", "10", 2)
+
+        asyncio.run(bot.check_monthly_reset())
+
+        assert bot.data_month == NEW_MONTH
+        assert bot.history_store.last_reset == NEW_MONTH
+        assert bot.history_store.months("-1") == [OLD_MONTH]
+        archived = bot.history_store.top(OLD_MONTH, "-1", 10)
+        assert [(user_id, stats["total_points"]) for user_id, stats in archived] == [("11", 7), ("10", 5)]
+        assert all(
+            stats["total_points"] == 0
+            for users in bot.engagement_data.export().values() for stats in users.values()
+        )
+        assert bot.leaderboards.rank("-1", "10") == 1
+
+        # A second run in the same month does nothing
+        bot.history_store.archive_chat = None
+        asyncio.run(bot.check_monthly_reset())
+
+def test_messages_during_rollover_count_for_new_month():
+    with last_month_bot():
+        add_points("-1", "10", 5)
+        archive_chat = bot.history_store.archive_chat
+
+        def archive_while_busy(month, chat_id, users):
+            written = archive_chat(month, chat_id, users)
+            add_points(chat_id, "10", 1)  # Arrives while the shard is being written
+            return written
+
+        bot.history_store.archive_chat = archive_while_busy
+        asyncio.run(bot.check_monthly_reset())
+
+        assert bot.history_store.load(OLD_MONTH, "-1")["10"]["total_points"] == 5
+        assert bot.engagement_data.get("-1", "10")["total_points"] == 1
+
+        # Reloading after a restart gives the same counts
+        bot.save_data()
+        bot.engagement_data = bot.load_json_data()
+        bot.load_chat("-1")
+        assert bot.engagement_data.get("-1", "10")["total_points"] == 1
+
+def test_interrupted_rollover_resumes_without_rearchiving():
+    with last_month_bot():
+        add_points("-1", "10", 5)
+        add_points("-2", "20", 3)
+        bot.history_store.pending_rollover = NEW_MONTH
+        asyncio.run(bot.rollover_chat_json("-1", OLD_MONTH, NEW_MONTH))
+        add_points("-1", "10", 2)  # New month activity before the crash
+        bot.save_data()
+
+        # Restart: reload from disk and let the scheduled job finish the rollover
+        bot.rolled_chats.clear()
+        bot.engagement_data = bot.load_json_data()
+        bot.leaderboards.rebuild(bot.engagement_data)
+        asyncio.run(bot.check_monthly_reset())
+
+        assert bot.history_store.load(OLD_MONTH, "-1")["10"]["total_points"] == 5
+        assert bot.history_store.load(OLD_MONTH, "-2")["20"]["total_points"] == 3
+        assert bot.engagement_data.get("-1", "10")["total_points"] == 2
+        assert bot.engagement_data.get("-2", "20")["total_points"] == 0
+        assert bot.history_store.pending_rollover is None
+
+def compact_and_restart():
+    """Write every chat to its file and start again with none of them in memory."""
+    bot.event_log.force_compaction()
+    bot.save_data()
+    bot.engagement_data = bot.load_json_data()
+    bot.leaderboards.rebuild(bot.engagement_data)
+
+def test_chats_not_in_memory_are_rolled_over_in_their_files():
+    with last_month_bot():
+        add_points("-1", "10", 5)
+        add_points("-1", "11", 7)
+        add_points("-2", "20", 3)
+        compact_and_restart()
+        add_points("-3", "30", 1)  # In memory, changed since the compaction
+        assert bot.engagement_data.chats() == ["-3"]
+
+        asyncio.run(bot.check_monthly_reset())
+
+        assert bot.data_month == NEW_MONTH
+        for chat_id in ("-1", "-2", "-3"):
+            assert bot.history_store.months(chat_id) == [OLD_MONTH]
+        assert bot.history_store.load(OLD_MONTH, "-1")["11"]["total_points"] == 7
+        assert bot.history_store.load(OLD_MONTH, "-2")["20"]["total_points"] == 3
+        assert bot.history_store.load(OLD_MONTH, "-3")["30"]["total_points"] == 1
+        # Rolled over without being loaded
+        assert bot.engagement_data.chats() == ["-3"]
+        assert bot.resident_chats.loads == 0
+
+        assert bot.load_chat("-1")
+        assert bot.engagement_data.get("-1", "11")["total_points"] == 0
+        assert bot.engagement_data.get("-1", "11")["username"] == "user11"
+
+def test_chat_used_after_its_file_rollover_survives_a_crash():
+    with last_month_bot():
+        add_points("-1", "10", 5)
+        compact_and_restart()
+        bot.history_store.pending_rollover = NEW_MONTH
+        bot.history_store.save_index()
+        assert bot.rollover_chat_file("-1", OLD_MONTH, NEW_MONTH)
+        assert bot.load_chat("-1")
+        add_points("-1", "10", 2)  # New month activity before the crash
+        bot.save_data()
+
+        # Restart before the index listing the shard was saved; the log brings -1 back into memory
+        bot.rolled_chats.clear()
+        bot.history_store = HistoryStore(bot.HISTORY_DIR)
+        bot.engagement_data = bot.load_json_data()
+        bot.leaderboards.rebuild(bot.engagement_data)
+        assert "-1" in bot.engagement_data
+        asyncio.run(bot.check_monthly_reset())
+
+        assert bot.history_store.months("-1") == [OLD_MONTH]
+        assert bot.history_store.load(OLD_MONTH, "-1")["10"]["total_points"] == 5
+        assert bot.engagement_data.get("-1", "10")["total_points"] == 2
+
+def test_rollover_timing_100k_users():
+    with last_month_bot():
+        chats, users_per_chat = 100, 1000
+        for chat in range(chats):
+            for user in range(users_per_chat):
+                points = (user * 7) % 50 + 1
+                bot.engagement_data.set_counters(
+                    str(-1000 - chat), str(user), [points, 0, 0, points], f"user{user}"
+                )
+        bot.leaderboards.rebuild(bot.engagement_data)
+
+        async def run():
+            # Measure the longest time the event loop was unavailable
+            gaps = []
+            done = asyncio.Event()
+
+            async def ticker():
+                last = time.perf_counter()
+                while not done.is_set():
+                    await asyncio.sleep(0)
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            task = asyncio.create_task(ticker())
+            start = time.perf_counter()
+            await bot.check_monthly_reset()
+            elapsed = time.perf_counter() - start
+            done.set()
+            await task
+            return elapsed, max(gaps)
+
+        elapsed, max_gap = asyncio.run(run())
+        print(f"⏱️ Rollover of {chats * users_per_chat} users: {elapsed:.2f}s, "
+              f"longest event loop stall {max_gap * 1000:.1f} ms")
+
+        assert bot.data_month == NEW_MONTH
+        assert len(bot.history_store.months()) == 1
+        assert elapsed < 60
+        assert max_gap < 1.0
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
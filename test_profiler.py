@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-demand profiler and the /profile command.
+"""
+
+import asyncio
+import os
+import pstats
+import signal
+import sys
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+import bot
+from profiler import Profiler
+
+def busy_handler(kept):
+    """Stands in for a handler: burns CPU and allocates on the event loop."""
+    kept.append([bytearray(1024) for _ in range(2000)])
+    return sum(i * i for i in range(20000))
+
+def test_capture_profiles_the_loop_and_its_allocations():
+    kept = []
+
+    async def run(directory):
+        profiler = Profiler(directory, top=40, sizes=lambda: {"message_senders": 5 * 1024 * 1024})
+        capture = profiler.start(0.3)
+        assert profiler.start(1) is None  # One capture at a time
+        while profiler.running:
+            busy_handler(kept)
+            await asyncio.sleep(0.01)
+        return await capture
+
+    assert sys.getprofile() is None and not tracemalloc.is_tracing()
+    with tempfile.TemporaryDirectory() as directory:
+        path = asyncio.run(run(directory))
+        assert os.path.dirname(path) == directory
+        assert os.path.basename(path).startswith("profile-") and path.endswith(".txt")
+        with open(path) as f:
+            report = f.read()
+        assert "5.0 MiB  message_senders" in report
+        assert "busy_handler" in report
+        assert "test_profiler.py:" in report.split("Largest allocation sites")[1]
+        stats = pstats.Stats(path[:-len(".txt")] + ".prof")
+        assert any(name == "busy_handler" for _, _, name in stats.stats)
+    # Nothing stays hooked once the capture is over
+    assert sys.getprofile() is None and not tracemalloc.is_tracing()
+
+def test_profile_command_and_signal():
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    def command(user_id, *args):
+        message = SimpleNamespace(from_user=SimpleNamespace(id=user_id), reply_text=reply_text)
+        application = SimpleNamespace(create_task=asyncio.ensure_future)
+        return SimpleNamespace(message=message), SimpleNamespace(args=list(args), application=application)
+
+    async def run():
+        await bot.profile_bot(*command(10))
+        await bot.profile_bot(*command(42, "soon"))
+        await bot.profile_bot(*command(42, "0.1"))
+        await bot.profile_bot(*command(42))
+        await bot.profiler._task
+        await asyncio.sleep(0.05)
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, bot.profiler.start)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        await asyncio.sleep(0.05)
+        assert bot.profiler.running
+        return await bot.profiler._task
+
+    old = bot.PROFILE_ADMINS, bot.profiler
+    with tempfile.TemporaryDirectory() as directory:
+        bot.PROFILE_ADMINS = {42}
+        bot.profiler = Profiler(directory, seconds=0.1)
+        try:
+            path = asyncio.run(run())
+        finally:
+            bot.PROFILE_ADMINS, bot.profiler = old
+        assert replies[0] == "This command is only available to the bot's operators!"
+        assert replies[1] == "Usage: /profile [seconds]"
+        assert replies[2] == "🔬 Profiling for 1s..."  # At least a second
+        assert replies[3] == "A profile is already being captured"
+        assert replies[4].startswith("🔬 Profile written to ") and replies[4].endswith(".txt")
+        assert os.path.exists(path)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for counting reactions from per-user updates and from reaction counts.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from conftest import fresh_bot
+from fake_telegram import FakeBotAPI, FakeRequest, chat, message_update, reaction_count_update, reaction_update
+from sender_index import SenderIndex
+
+def process(*updates):
+    """Run raw updates through an Application with the bot's handlers on the fake Bot API."""
+    app = Application.builder().token('123456:TEST').request(FakeRequest(FakeBotAPI())).build()
+    bot.add_handlers(app)
+
+    async def run():
+        async with app:
+            for update in updates:
+                await app.process_update(Update.de_json(update, app.bot))
+
+    asyncio.run(run())
+
+def counters(user_id):
+    return bot.engagement_data.get("-1", user_id)
+
+def test_reactions_count_what_was_added_or_removed():
+    with fresh_bot():
+        process(
+            message_update(1, -1, 10, 100, "hello"),
+            reaction_update(2, -1, 20, 100, ("👍",)),
+            reaction_update(3, -1, 20, 100, ("❤",), ("👍",)),  # Changed, not added again
+        )
+        assert counters("20")["reactions_given"] == 1
+        assert counters("10")["reactions_received"] == 1
+        assert counters("10")["total_points"] == 2
+
+        process(reaction_update(4, -1, 20, 100, ("❤", "🔥"), ("❤",)))
+        assert counters("20")["reactions_given"] == 2
+        assert counters("10")["reactions_received"] == 2
+        assert bot.window_counters.top("-1", "30d", 5) == [("10", 3), ("20", 2)]
+
+        process(reaction_update(5, -1, 20, 100, (), ("❤", "🔥")))
+        assert counters("20")["reactions_given"] == 0
+        assert counters("10") == {
+            "username": "user10", "messages": 1, "reactions_given": 0, "reactions_received": 0,
+            "total_points": 1,
+        }
+        assert bot.leaderboards.rank("-1", "10") == 1
+        assert bot.window_counters.top("-1", "30d", 5) == [("10", 1)]  # Taken back there too
+
+def test_removals_never_go_below_zero():
+    with fresh_bot():
+        # The reaction was added before the bot (or this month) counted it
+        process(
+            message_update(1, -1, 10, 100, "hello"),
+            reaction_update(2, -1, 20, 100, (), ("👍",)),
+        )
+        assert counters("10")["reactions_received"] == 0
+        assert counters("10")["total_points"] == 1
+        assert counters("20") is None  # A removal doesn't create a row
+
+def test_anonymous_reaction_credits_the_author():
+    with fresh_bot():
+        anonymous = reaction_update(2, -1, 20, 100, ("👍",))
+        del anonymous["message_reaction"]["user"]
+        anonymous["message_reaction"]["actor_chat"] = chat(-1)
+        process(message_update(1, -1, 10, 100, "hello"), anonymous)
+        assert counters("10")["reactions_received"] == 1
+        assert bot.engagement_data.user_count("-1") == 1
+
+def test_reaction_counts_credit_the_author_in_one_batch():
+    with fresh_bot(REACTION_MODE='count'):
+        process(message_update(1, -1, 10, 100, "hello"))
+        process(reaction_count_update(2, -1, 100, {"👍": 3, "❤": 2}))
+        assert counters("10")["reactions_received"] == 5
+        assert counters("10")["total_points"] == 6
+        assert bot.window_counters.top("-1", "30d", 5) == [("10", 6)]
+        events = bot.event_log.drain()
+        assert [event["e"] for event in events] == ["message", "reaction_received"]
+
+        # Totals, not changes: the same total again counts nothing
+        process(
+            reaction_count_update(3, -1, 100, {"👍": 3, "❤": 2}),
+            reaction_count_update(4, -1, 100, {"👍": 4}),
+            reaction_count_update(5, -1, 999, {"👍": 7}),  # Author unknown
+        )
+        assert counters("10")["reactions_received"] == 4
+        assert bot.window_counters.top("-1", "day", 5) == [("10", 5)]
+        assert [event["e"] for event in bot.event_log.drain()] == ["reaction_received"]
+        assert bot.engagement_data.user_count("-1") == 1
+
+def test_channel_totals_credit_nobody():
+    with fresh_bot(REACTION_MODE='count'):
+        # The post itself is a channel_post update the bot never asks for
+        process(reaction_count_update(1, -1, 100, {"👍": 3}, chat_type="channel"))
+        assert bot.engagement_data.user_count("-1") == 0
+        assert bot.event_log.drain() == []
+
+def test_both_modes_credit_totals_beyond_per_user_updates():
+    with fresh_bot(REACTION_MODE='both'):
+        process(
+            message_update(1, -1, 10, 100, "hello"),
+            reaction_update(2, -1, 20, 100, ("👍",)),
+        )
+        assert counters("10")["reactions_received"] == 1
+
+        process(reaction_count_update(3, -1, 100, {"👍": 2}))  # Someone else reacted anonymously
+        assert counters("20")["reactions_given"] == 1
+        assert counters("10")["reactions_received"] == 2
+
+        # Without a total, per-user updates keep crediting the author
+        process(
+            message_update(4, -1, 10, 101, "again"),
+            reaction_update(5, -1, 20, 101, ("🔥",)),
+        )
+        assert counters("10")["reactions_received"] == 3
+
+def test_switching_to_counts_credits_nothing_twice():
+    with fresh_bot():
+        process(
+            message_update(1, -1, 10, 100, "hello"),
+            reaction_update(2, -1, 20, 100, ("👍",)),
+            reaction_update(3, -1, 21, 100, ("👍",)),
+        )
+        bot.REACTION_MODE = 'count'
+        process(reaction_count_update(4, -1, 100, {"👍": 3}))
+        assert counters("10")["reactions_received"] == 3
+
+def test_allowed_updates_follow_the_mode():
+    expected = {
+        'user': ["message", "message_reaction"],
+        'count': ["message", "message_reaction_count"],
+        'both': ["message", "message_reaction", "message_reaction_count"],
+    }
+    for mode, allowed in expected.items():
+        with fresh_bot(REACTION_MODE=mode):
+            assert bot.allowed_update_types()[:len(allowed)] == allowed
+
+def test_sender_index_keeps_authors_of_old_files():
+    with tempfile.TemporaryDirectory() as directory:
+        # The ring of a chat as written before reaction totals were kept
+        ring = array('q', bytes(16 * 64))
+        ring[2 * 5], ring[2 * 5 + 1] = 5, 10
+        with open(os.path.join(directory, "-1.idx"), 'wb') as f:
+            f.write(ring.tobytes())
+        senders = SenderIndex(directory, 64)
+        try:
+            assert senders.get("-1", 5) == "10"
+            assert senders.count_reactions("-1", 5, 3) == ("10", 3)
+            assert senders.count_reactions("-1", 5, 1) == ("10", -2)
+            assert senders.count_reactions("-1", 6, 1) is None
+            assert senders.add_reactions("-1", 5, -4) == "10"
+            assert senders.count_reactions("-1", 5, 2) == ("10", 2)
+        finally:
+            senders.close()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped index of message authors.
+"""
+
+import os
+import tempfile
+
+from sender_index import SLOT_BYTES, SenderIndex
+
+def test_new_message_replaces_the_oldest_in_its_slot():
+    with tempfile.TemporaryDirectory() as directory:
+        senders = SenderIndex(directory, slots=8)
+        try:
+            senders.add("-1", 1, 10)
+            senders.add("-1", 2, 11)
+            senders.add("-1", 1, 10)  # The same message again evicts nothing
+            assert senders.evictions == 0
+            senders.add("-1", 9, 12)  # 9 % 8 == 1
+            assert senders.evictions == 1
+            assert senders.get("-1", 1) is None
+            assert senders.get("-1", 9) == "12"
+            assert senders.get("-1", 2) == "11"
+            assert senders.count_reactions("-1", 1, 5) is None  # Not credited to 9's author
+        finally:
+            senders.close()
+
+def test_lookups_count_hits_and_misses():
+    with tempfile.TemporaryDirectory() as directory:
+        senders = SenderIndex(directory, slots=8)
+        try:
+            senders.add("-1", 3, 10)
+            assert senders.get("-1", 3) == "10"
+            assert senders.get("-1", 4) is None
+            assert senders.get("-2", 3) is None
+            assert senders.add_reactions("-1", 3, 1) == "10"
+            stats = senders.stats()
+            assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 2, 0.5)
+            assert not os.path.exists(os.path.join(directory, "-2.idx"))  # A miss creates no ring
+        finally:
+            senders.close()
+
+def test_least_recently_used_chats_are_unmapped_within_the_budget():
+    with tempfile.TemporaryDirectory() as directory:
+        senders = SenderIndex(directory, slots=8, memory_budget=2 * 8 * SLOT_BYTES)
+        try:
+            senders.add("-1", 1, 10)
+            senders.add("-2", 1, 20)
+            assert senders.get("-1", 1) == "10"  # -1 is now the most recently used
+            senders.add("-3", 1, 30)
+            assert "-2" not in senders and "-1" in senders and "-3" in senders
+            assert senders.chat_evictions == 1
+            assert senders.stats()["resident_bytes"] == 2 * 8 * SLOT_BYTES
+
+            # Its file stays, so it's mapped again on the next lookup
+            assert senders.get("-2", 1) == "20"
+            assert len(senders) == 2 and senders.chat_evictions == 2
+        finally:
+            senders.close()
+
+def test_authors_and_totals_survive_a_restart():
+    with tempfile.TemporaryDirectory() as directory:
+        senders = SenderIndex(directory, slots=8)
+        senders.add("-1", 5, 10)
+        senders.add("-2", 6, 20)
+        assert senders.count_reactions("-1", 5, 3) == ("10", 3)
+        senders.close()
+
+        senders = SenderIndex(directory, slots=8)
+        try:
+            assert senders.get("-1", 5) == "10"
+            assert senders.get("-2", 6) == "20"
+            assert senders.count_reactions("-1", 5, 4) == ("10", 1)  # Only what's new since the restart
+        finally:
+            senders.close()
+
+        # A different slot count can't map the old ring, so it starts empty
+        senders = SenderIndex(directory, slots=16)
+        try:
+            assert senders.get("-1", 5) is None
+        finally:
+            senders.close()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for multi-process sharding: chat placement, and bot.py run with
+SHARDS=2 against the fake Bot API, starting from single-process data.
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from chat_files import ChatFiles
+from engagement_store import EngagementStore
+from fake_telegram import FakeBotAPI, FakeTelegramServer, message_update, reaction_update
+from history_store import HistoryStore
+from sharding import shard_of, update_chat_id
+from snapshot import write_snapshot
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+
+def test_shard_of_is_stable_and_spreads_chats():
+    chats = [-1001234567890 - i for i in range(4000)]
+    shards = [shard_of(chat_id, 4) for chat_id in chats]
+    assert shards == [shard_of(str(chat_id), 4) for chat_id in chats]  # Store keys are strings
+    assert shard_of(-1001234567890, 4) == 1  # Same in every process and release
+    assert all(800 < shards.count(index) < 1200 for index in range(4))
+
+def test_update_chat_id():
+    assert update_chat_id(message_update(1, -100, 5, 1, "hi")) == -100
+    assert update_chat_id(reaction_update(2, -200, 5, 1)) == -200
+    assert update_chat_id({"update_id": 3, "poll": {"id": "1"}}) is None
+
+def run_bot(directory, server, shards):
+    env = dict(
+        os.environ, TELEGRAM_BOT_TOKEN='123456:TEST', BOT_API_BASE_URL=server.url,
+        SHARDS=str(shards), METRICS_PORT='0', LOG_FORMAT='text',
+    )
+    with open(os.path.join(directory, 'bot.log'), 'a') as log:
+        return subprocess.Popen(
+            [sys.executable, BOT_SCRIPT], cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+def stop(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        return process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        raise
+
+def test_sharded_bot_splits_existing_data_and_routes_by_chat():
+    chats = [-1 - i for i in range(8)]
+    old = {str(chat_id): {"7": {"username": "old", "messages": 2, "reactions_given": 0,
+                                "reactions_received": 0, "total_points": 2}} for chat_id in chats}
+    server = FakeTelegramServer(FakeBotAPI()).start()
+    api = server.api
+    with tempfile.TemporaryDirectory() as directory:
+        # Data of a single-process bot
+        write_snapshot(os.path.join(directory, 'engagement_data.snap'), EngagementStore.from_dict(old))
+        with open(os.path.join(directory, 'update_offset.json'), 'w') as f:
+            json.dump({"update_id": 0}, f)
+        history = HistoryStore(os.path.join(directory, 'history'))
+        history.archive_chat('2026-01', str(chats[0]), old[str(chats[0])])
+        history.save_index()
+
+        process = run_bot(directory, server, 2)
+        try:
+            assert api.wait_until(lambda api: api.calls.get('getUpdates', 0) > 0, 30)
+            for i in range(80):
+                chat_id = chats[i % len(chats)]
+                api.push_update(message_update(0, chat_id, 100 + i % 3, 10 + i, f"message {i}"))
+            for chat_id in chats:
+                after = len(api.sent)
+                api.push_update(message_update(0, chat_id, 1, 1000, '/stats'))
+                reply = api.wait_for_message(chat_id, after)
+                assert reply is not None and "@old" in reply["text"] and "@user100" in reply["text"]
+        finally:
+            assert stop(process) == 0
+
+        shard_dir = os.path.join(directory, 'shards')
+        for index in range(2):
+            path = os.path.join(shard_dir, f'shard-{index}')
+            # Each worker moved its part of the snapshot into per-chat files
+            assert os.path.exists(os.path.join(path, 'engagement_data.snap.migrated'))
+            files = ChatFiles(os.path.join(path, 'chats'))
+            owned = [str(chat_id) for chat_id in chats if shard_of(chat_id, 2) == index]
+            assert sorted(files.chats()) == sorted(owned)
+            for chat_id in owned:
+                store = files.read(chat_id)
+                assert store.get(chat_id, "7")["messages"] == 2
+                assert sum(store.get(chat_id, user)["messages"] for user in ("100", "101", "102")) == 10
+            archived = HistoryStore(os.path.join(path, 'history')).months(str(chats[0]))
+            assert archived == (['2026-01'] if shard_of(chats[0], 2) == index else [])
+        assert os.path.exists(os.path.join(shard_dir, 'unsharded', 'engagement_data.snap'))
+        assert not os.path.exists(os.path.join(directory, 'engagement_data.snap'))
+
+        # The data is split for two workers; another count is refused
+        assert run_bot(directory, server, 3).wait(30) == 1
+        with open(os.path.join(directory, 'bot.log')) as f:
+            assert "changing the number of shards isn't supported" in f.read()
+    server.stop()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the binary snapshot format and the migration from engagement_data.json
+to per-chat files.
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import bot
+from conftest import fresh_bot
+from engagement_store import EngagementStore
+from snapshot import HEADER_SIZE, SnapshotError, read_snapshot, write_snapshot
+
+def sample_store():
+    store = EngagementStore()
+    for user in range(2000):
+        store.set_counters(str(-100 - user % 3), str(10 ** 9 + user * 7919),
+                           [user, user % 5, user % 7, user + user % 5 + user % 7], f"user{user}")
+    store.increment("-100", "42", "messages", "Zoë 🚀")
+    store.increment("-101", str(10 ** 9), "messages", "renamed_to_something_longer")
+    return store
+
+@contextmanager
+def temp_dir():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+def test_round_trip_keeps_rows_and_indexes():
+    with temp_dir():
+        store = sample_store()
+        written = write_snapshot('data.snap', store)
+        assert written == os.path.getsize('data.snap')
+
+        loaded = read_snapshot('data.snap')
+        assert loaded.export() == store.export()
+        assert loaded.get("-100", "42")["username"] == "Zoë 🚀"
+        # Loaded indexes keep working for existing and new rows
+        assert loaded.increment("-100", "42", "reactions_given")
+        assert loaded.counters("-100", "42") == [1, 1, 0, 2]
+        loaded.increment("-100", "43", "messages", "newcomer")
+        assert loaded.get("-100", "43")["total_points"] == 1
+
+def test_empty_store_round_trips():
+    with temp_dir():
+        write_snapshot('data.snap', EngagementStore())
+        assert read_snapshot('data.snap').export() == {}
+
+def test_corruption_is_detected():
+    with temp_dir():
+        write_snapshot('data.snap', sample_store())
+        with open('data.snap', 'rb') as f:
+            payload = bytearray(f.read())
+
+        def broken(data, match):
+            with open('broken.snap', 'wb') as f:
+                f.write(data)
+            try:
+                read_snapshot('broken.snap')
+            except SnapshotError as e:
+                assert match in str(e), str(e)
+            else:
+                raise AssertionError("corruption not detected")
+
+        flipped = bytearray(payload)
+        flipped[len(flipped) // 2] ^= 0x01
+        broken(flipped, "checksum")
+        broken(payload[:len(payload) - 100], "truncated")
+        broken(payload[:10], "truncated")
+        broken(b'{"-1": {}}' + bytes(HEADER_SIZE), "not a snapshot")
+        newer = bytearray(payload)
+        newer[8] = 99
+        broken(newer, "version 99")
+
+def test_json_snapshot_is_migrated():
+    with fresh_bot():
+        data = sample_store().export()
+        with open(bot.DATA_FILE, 'w') as f:
+            json.dump(data, f)
+
+        bot.engagement_data = bot.load_json_data()
+        assert bot.engagement_data.export() == data
+        bot.event_log.force_compaction()
+        bot.persistence.flush(force=True)
+
+        assert sorted(bot.chat_files.chats()) == sorted(data)
+        assert not os.path.exists(bot.DATA_FILE)
+        assert os.path.exists(f"{bot.DATA_FILE}.migrated")
+        bot.engagement_data = bot.load_json_data()
+        assert len(bot.engagement_data) == 0  # Loaded on first use
+        for chat_id in data:
+            bot.load_chat(chat_id)
+        assert bot.engagement_data.export() == data
+
+def test_unreadable_snapshot_stops_loading():
+    with fresh_bot():
+        for path, content in ((bot.DATA_FILE, b'{"-1": {"10": '), (bot.SNAPSHOT_FILE, b'garbage')):
+            with open(path, 'wb') as f:
+                f.write(content)
+            try:
+                bot.load_json_data()
+            except SnapshotError:
+                pass
+            else:
+                raise AssertionError(f"{path} was not reported")
+            assert os.path.exists(path)  # Left in place for recovery
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
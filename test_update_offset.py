@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for resuming from the saved update offset and catching up on the backlog.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+import bot
+from conftest import fresh_bot
+from eventlog import EventLog
+from fake_telegram import FakeBotAPI, FakeRequest, message_update
+from update_scheduler import ChatUpdateProcessor
+
+CHAT_ID = -100
+
+def make_app(api):
+    app = (
+        Application.builder().token('123456:TEST')
+        .request(FakeRequest(api)).get_updates_request(FakeRequest(api)).build()
+    )
+    bot.add_handlers(app)
+    bot.add_update_tracking(app)
+    return app
+
+def restart():
+    """Reload state from disk as a new process would."""
+    bot.event_log = EventLog(bot.EVENT_LOG_FILE)
+    bot.recent_update_ids.clear()
+    bot.engagement_data = bot.load_data()
+    bot.load_chat(str(CHAT_ID))
+
+def messages(data):
+    return sum(stats["messages"] for users in data.export().values() for stats in users.values())
+
+def test_offset_is_saved_with_data_and_after_compaction():
+    with fresh_bot():
+        api = FakeBotAPI()
+        app = make_app(api)
+
+        async def run():
+            await app.initialize()
+            for i in range(1, 6):
+                await app.process_update(Update.de_json(message_update(i, CHAT_ID, 7, i, "hi"), app.bot))
+            await app.shutdown()
+
+        asyncio.run(run())
+        bot.save_data()
+        restart()
+        assert bot.resume_update_id == 5
+        assert messages(bot.engagement_data) == 5
+
+        # The offset moves beside the snapshot when the log is compacted away
+        bot.event_log.force_compaction()
+        bot.persistence.flush(force=True)
+        assert not os.path.exists(bot.EVENT_LOG_FILE)
+        restart()
+        assert bot.resume_update_id == 5
+
+def test_catch_up_skips_counted_updates_and_saves_once():
+    with fresh_bot():
+        api = FakeBotAPI()
+        for i in range(1, 301):
+            api.push_update(message_update(0, CHAT_ID, 1000 + i % 7, i, f"message {i}"))
+        bot.set_resume_offset(100)  # The first 100 were counted before the restart
+        app = make_app(api)
+
+        async def run():
+            await app.initialize()
+            await bot.catch_up(app)
+            # Telegram redelivers an update that was already handled
+            await app.process_update(Update.de_json(message_update(150, CHAT_ID, 1, 999, "again"), app.bot))
+            await app.shutdown()
+
+        asyncio.run(run())
+        assert messages(bot.engagement_data) == 200
+        assert bot.catch_up_stats["updates"] == 200
+        assert bot.catch_up_stats["skipped"] == 1
+        assert bot.persistence.stats["flushes"] == 1
+        assert api.pending_updates() == 0  # Confirmed to Telegram
+
+        restart()
+        assert bot.resume_update_id == 300
+        assert messages(bot.engagement_data) == 200
+
+def test_offset_is_stored_in_sqlite_meta():
+    with fresh_bot(sqlite=True):
+        api = FakeBotAPI()
+        for i in range(1, 11):
+            api.push_update(message_update(0, CHAT_ID, 5, i, "hi"))
+        api.push_update(message_update(0, CHAT_ID, 5, 11, "/rank"))
+        app = make_app(api)
+
+        async def run():
+            await app.initialize()
+            await bot.catch_up(app)
+            await app.shutdown()
+
+        asyncio.run(run())
+        assert bot.storage.get_meta('update_offset') == '11'
+        restart()
+        assert bot.resume_update_id == 11
+        assert messages(bot.engagement_data) == 10
+
+def test_offset_waits_for_updates_queued_in_other_chats():
+    with fresh_bot():
+        api = FakeBotAPI()
+        bot.update_processor = ChatUpdateProcessor(4)
+        app = (
+            Application.builder().token('123456:TEST').request(FakeRequest(api))
+            .concurrent_updates(bot.update_processor).build()
+        )
+        bot.add_handlers(app)
+        bot.add_update_tracking(app)
+        updates = [
+            message_update(1, CHAT_ID, 7, 1, "slow"),
+            message_update(2, CHAT_ID - 1, 8, 1, "hi"),
+            message_update(3, CHAT_ID - 1, 8, 2, "hi"),
+        ]
+
+        async def run():
+            release = asyncio.Event()
+
+            async def hold_first(update, context):
+                if update.update_id == 1:
+                    await release.wait()
+
+            app.add_handler(TypeHandler(Update, hold_first), group=-3)
+            async with app:
+                await app.start()
+                for update in updates:
+                    await app.update_queue.put(Update.de_json(update, app.bot))
+                while bot.update_processor.processed < 2:
+                    await asyncio.sleep(0.01)
+                # Crash while update 1 still waits in its chat's lane
+                await asyncio.to_thread(bot.save_data)
+                shutil.copy(bot.EVENT_LOG_FILE, "crashed.log")
+                release.set()
+                await app.stop()
+
+        asyncio.run(run())
+        os.replace("crashed.log", bot.EVENT_LOG_FILE)
+        restart()
+        assert bot.resume_update_id == 0
+        assert messages(bot.engagement_data) == 2
+
+        # Telegram delivers all three again: only the unfinished one is counted
+        bot.update_processor = None
+        bot.catch_up_stats["skipped"] = 0
+        app = make_app(api)
+
+        async def redeliver():
+            async with app:
+                for update in updates:
+                    await app.process_update(Update.de_json(update, app.bot))
+
+        asyncio.run(redeliver())
+        assert bot.catch_up_stats["skipped"] == 2
+        assert messages(bot.engagement_data) == 3
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
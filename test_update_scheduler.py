@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-chat update scheduler, including a stress run of the real
+handlers over many chats, counted the same as serially. Its throughput is
+measured by benchmarks/bench_scheduler.py.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from conftest import fresh_bot
+from fake_telegram import FakeBotAPI, FakeRequest, message_update, reaction_update
+from update_scheduler import ChatUpdateProcessor
+
+def fake_update(chat_id, number):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), number=number)
+
+def test_chats_run_in_parallel_and_each_in_order():
+    rng = random.Random(7)
+    seen = {}
+    running = {}
+    peak = {"all": 0, "chat": 0, "pending": 0}
+
+    async def handle(update, processor):
+        chat_id = update.effective_chat.id
+        running[chat_id] = running.get(chat_id, 0) + 1
+        peak["all"] = max(peak["all"], sum(running.values()))
+        peak["chat"] = max(peak["chat"], running[chat_id])
+        peak["pending"] = max(peak["pending"], processor.pending)
+        await asyncio.sleep(rng.random() / 1000)
+        seen.setdefault(chat_id, []).append(update.number)
+        running[chat_id] -= 1
+
+    async def run():
+        async with ChatUpdateProcessor(4, max_pending=50) as processor:
+            for number in range(2000):
+                update = fake_update(rng.randrange(30), number)
+                await processor.process_update(update, handle(update, processor))
+            await processor.join()
+            return processor.stats()
+
+    stats = asyncio.run(run())
+    assert sum(len(numbers) for numbers in seen.values()) == 2000
+    assert all(numbers == sorted(numbers) for numbers in seen.values())
+    assert peak["chat"] == 1
+    assert 1 < peak["all"] <= 4
+    assert peak["pending"] <= 50
+    assert stats["processed"] == 2000 and stats["pending"] == 0 and stats["active_chats"] == 0
+    assert stats["waits"] > 0  # The producer was held back
+
+def test_failing_update_does_not_stop_its_chat():
+    seen = []
+
+    async def handle(number):
+        if number == 1:
+            raise RuntimeError("boom")
+        seen.append(number)
+
+    async def run():
+        async with ChatUpdateProcessor(2) as processor:
+            for number in range(3):
+                await processor.process_update(fake_update(-1, number), handle(number))
+            await processor.join()
+
+    asyncio.run(run())
+    assert seen == [0, 2]
+
+def workload(chats=100, rounds=12, seed=3):
+    """Messages each followed by a reaction from another member, and an occasional /stats.
+
+    Returns the updates, round-robin over the chats, and the expected counters.
+    """
+    rng = random.Random(seed)
+    updates = []
+    expected = {}
+
+    def count(chat_id, user_id, field):
+        counters = expected.setdefault((str(chat_id), str(user_id)), [0, 0, 0])
+        counters[field] += 1
+
+    for message_id in range(1, rounds + 1):
+        for chat in range(chats):
+            chat_id = -1000 - chat
+            author, reactor = rng.sample(range(10, 30), 2)
+            updates.append(message_update(0, chat_id, author, message_id, f"message {message_id}"))
+            updates.append(reaction_update(0, chat_id, reactor, message_id))
+            count(chat_id, author, 0)
+            count(chat_id, reactor, 1)
+            count(chat_id, author, 2)
+            if message_id % 4 == 0:
+                updates.append(message_update(0, chat_id, author, 10000 + message_id, "/stats"))
+    for update_id, update in enumerate(updates, 1):
+        update["update_id"] = update_id
+    return updates, expected
+
+def process(updates, processor=None, latency=0.005):
+    """Feed updates through a started Application.
+
+    Each Bot API call (the /stats replies) takes `latency` seconds.
+    """
+    builder = Application.builder().token('123456:TEST').request(FakeRequest(FakeBotAPI(), latency))
+    if processor is not None:
+        builder.concurrent_updates(processor)
+    app = builder.build()
+    bot.add_handlers(app)
+    bot.add_update_tracking(app)
+
+    async def run():
+        await app.initialize()
+        await app.start()
+        bot.logger.setLevel(logging.WARNING)
+        for update in updates:
+            await app.update_queue.put(Update.de_json(update, app.bot))
+        await app.stop()
+        await bot.post_stop(app)
+        bot.logger.setLevel(logging.NOTSET)
+        await app.shutdown()
+
+    asyncio.run(run())
+
+def counted():
+    return {
+        (chat_id, user_id): bot.engagement_data.counters(chat_id, user_id)[:3]
+        for chat_id in bot.engagement_data.chats() for user_id in bot.engagement_data.users(chat_id)
+    }
+
+def test_stress_many_chats_counts_every_point_once():
+    updates, expected = workload()
+    with fresh_bot():
+        process(updates)
+        assert counted() == expected
+    with fresh_bot():
+        processor = ChatUpdateProcessor(16, max_pending=100)
+        process(updates, processor)
+        assert counted() == expected
+        assert len(bot.recent_update_ids) == len(updates)
+        assert processor.stats()["processed"] == len(updates)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -1,107 +1,169 @@
 #!/usr/bin/env python3
 """
-Test script to verify the bot's watchdog functionality.
-This script simulates a bot crash by sending a SIGSTOP signal to the bot process.
+Tests for the liveness watchdog.
+
+The event loop runs in a background thread and is frozen on purpose by a
+callback that blocks until the test releases it, while a fake clock stands
+in for the minutes that would pass in production.
 """
 
+import asyncio
 import os
-import time
-import signal
-import subprocess
-import sys
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager, suppress
 
-def find_bot_pid():
-    """Find the PID of the running bot process."""
-    try:
-        # Check if PID file exists
-        if os.path.exists("bot.pid"):
-            with open("bot.pid", "r") as f:
-                pid = int(f.read().strip())
-                # Verify process exists
-                try:
-                    os.kill(pid, 0)  # Signal 0 doesn't kill the process, just checks if it exists
-                    return pid
-                except OSError:
-                    print("PID file exists but process is not running")
-                    return None
-        else:
-            print("No PID file found")
-            
-            # Try to find the process using ps
-            try:
-                result = subprocess.check_output(["ps", "aux"]).decode()
-                for line in result.split("\n"):
-                    if "python bot.py" in line and "grep" not in line:
-                        pid = int(line.split()[1])
-                        print(f"Found bot process with PID {pid}")
-                        return pid
-            except Exception as e:
-                print(f"Error finding process: {e}")
-                
-        return None
-    except Exception as e:
-        print(f"Error finding bot PID: {e}")
-        return None
-
-def test_watchdog():
-    """Test the watchdog functionality by simulating a bot crash."""
-    pid = find_bot_pid()
-    
-    if not pid:
-        print("❌ Bot process not found. Make sure the bot is running.")
-        return
-    
-    print(f"✅ Found bot process with PID {pid}")
-    print("🔍 Testing watchdog functionality...")
-    
+from liveness import LivenessMonitor, sd_notify
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@contextmanager
+def running_loop(monitor):
+    """Run the monitor's heartbeat on an event loop in another thread."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start():
+        return asyncio.create_task(monitor.heartbeat())
+
+    async def stop():
+        heartbeat.cancel()
+        with suppress(asyncio.CancelledError):
+            await heartbeat
+
+    heartbeat = asyncio.run_coroutine_threadsafe(start(), loop).result(5)
     try:
-        # Send SIGSTOP to freeze the process (simulating a hang)
-        print(f"⏸️ Sending SIGSTOP to process {pid} to simulate a hang...")
-        os.kill(pid, signal.SIGSTOP)
-        
-        print("⏳ Waiting for watchdog to detect inactivity (this may take up to 5 minutes)...")
-        print("   You can check the logs in another terminal with: tail -f bot.log")
-        
-        # Wait for up to 6 minutes (watchdog should trigger at 5 minutes)
-        for i in range(36):  # 36 * 10 seconds = 360 seconds = 6 minutes
-            time.sleep(10)
-            
-            # Check if original process is still stopped
+        yield loop
+    finally:
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+def wait_for_beat(monitor):
+    """Wait until the heartbeat has stamped the current fake time."""
+    for _ in range(500):
+        if monitor.last_beat == monitor.clock():
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("heartbeat did not run")
+
+def freeze(loop):
+    """Block the event loop until the returned event is set."""
+    frozen, release = threading.Event(), threading.Event()
+
+    def block():
+        frozen.set()
+        release.wait(10)
+
+    loop.call_soon_threadsafe(block)
+    assert frozen.wait(5)
+    return release
+
+def make_monitor(clock, notes=None):
+    return LivenessMonitor(
+        loop_timeout=60, poll_timeout=600, interval=0.01, clock=clock,
+        notify=(notes.append if notes is not None else lambda message: None)
+    )
+
+def test_idle_bot_is_not_restarted():
+    clock = FakeClock()
+    notes = []
+    monitor = make_monitor(clock, notes)
+    with running_loop(monitor):
+        # An hour without a single update, checked every 10 seconds
+        for _ in range(360):
+            clock.advance(10)
+            wait_for_beat(monitor)
+            assert monitor.check() == []
+    assert notes[0] == "READY=1"
+    assert notes.count("WATCHDOG=1") == 360
+
+def test_frozen_loop_is_detected_and_recovers():
+    clock = FakeClock()
+    notes = []
+    monitor = make_monitor(clock, notes)
+    with running_loop(monitor) as loop:
+        wait_for_beat(monitor)
+        release = freeze(loop)
+
+        clock.advance(30)
+        assert monitor.check() == []
+        clock.advance(31)
+        problems = monitor.check()
+        assert problems == ["event loop blocked for 61s"]
+        assert notes[-1] == "WATCHDOG=1"  # No ping for the stalled check
+
+        release.set()
+        wait_for_beat(monitor)
+        assert monitor.check() == []
+
+def test_stall_calls_handler_once_from_checker_thread():
+    clock = FakeClock()
+    monitor = make_monitor(clock)
+    stalls = []
+    stalled = threading.Event()
+
+    def on_stall(problems):
+        stalls.append(problems)
+        stalled.set()
+
+    with running_loop(monitor) as loop:
+        monitor.start(on_stall, check_interval=0.01)
+        wait_for_beat(monitor)
+        release = freeze(loop)
+        clock.advance(120)
+        assert stalled.wait(5)
+        release.set()
+        monitor._thread.join(5)
+        monitor.stop()
+    assert len(stalls) == 1
+
+def test_stuck_polling_is_detected():
+    clock = FakeClock()
+    monitor = make_monitor(clock)
+    monitor.watch_polling()
+    with running_loop(monitor):
+        for _ in range(5):
+            clock.advance(100)
+            monitor.record_poll(ok=False)
+            wait_for_beat(monitor)
+        assert monitor.check() == []
+        clock.advance(101)
+        wait_for_beat(monitor)
+        assert monitor.check() == ["no successful getUpdates for 601s"]
+        monitor.record_poll()
+        assert monitor.check() == []
+    assert monitor.poll_failures == 5
+
+def test_sd_notify_sends_datagram_to_notify_socket():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'notify')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as server:
+            server.bind(path)
+            old = os.environ.get('NOTIFY_SOCKET')
+            os.environ['NOTIFY_SOCKET'] = path
             try:
-                os.kill(pid, 0)
-                print(f"   Original process {pid} still exists after {i*10} seconds")
-            except OSError:
-                print(f"   Original process {pid} no longer exists after {i*10} seconds")
-                break
-                
-            # Check if a new process has started
-            new_pid = find_bot_pid()
-            if new_pid and new_pid != pid:
-                print(f"✅ Watchdog worked! New bot process started with PID {new_pid}")
-                # Resume the original process so it can exit properly
-                try:
-                    os.kill(pid, signal.SIGCONT)
-                except OSError:
-                    pass  # Process might be gone already
-                return
-        
-        # If we get here, the watchdog didn't work
-        print("❌ Watchdog did not restart the bot within the expected time")
-        
-        # Resume the original process
-        try:
-            print(f"▶️ Resuming original process {pid}...")
-            os.kill(pid, signal.SIGCONT)
-        except OSError:
-            print(f"   Process {pid} no longer exists")
-            
-    except Exception as e:
-        print(f"❌ Error during test: {e}")
-        # Try to resume the process if it's still around
-        try:
-            os.kill(pid, signal.SIGCONT)
-        except:
-            pass
+                assert sd_notify("WATCHDOG=1")
+            finally:
+                if old is None:
+                    del os.environ['NOTIFY_SOCKET']
+                else:
+                    os.environ['NOTIFY_SOCKET'] = old
+            assert server.recv(64) == b"WATCHDOG=1"
 
 if __name__ == "__main__":
-    test_watchdog() 
\ No newline at end of file
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tests for the rolling day, week, 7-day and 30-day leaderboards.
+"""
+
+import asyncio
+import os
+import tempfile
+from datetime import date
+from types import SimpleNamespace
+
+import bot
+from conftest import fresh_bot
+from snapshot import SnapshotError, read_windows, write_windows
+from windows import BUCKET_MAX, DAYS, WindowCounters
+
+# A Wednesday, so the calendar week started two days earlier
+WEDNESDAY = date(2026, 1, 7).toordinal()
+
+class FakeClock:
+    def __init__(self, day=WEDNESDAY):
+        self.day = day
+
+    def __call__(self):
+        return self.day
+
+def points(counters, chat_id, window):
+    return dict(counters.top(chat_id, window, 100))
+
+def test_windows_expire_old_days():
+    clock = FakeClock()
+    counters = WindowCounters(clock)
+    counters.add("-1", "10", points=3)
+    counters.add("-1", "11", day=WEDNESDAY - 10, points=4)
+    counters.add("-1", "12", day=WEDNESDAY - DAYS, points=5)  # Already out of every window
+    assert points(counters, "-1", "day") == {"10": 3}
+    assert points(counters, "-1", "7d") == {"10": 3}
+    assert points(counters, "-1", "30d") == {"10": 3, "11": 4}
+
+    clock.day += 6
+    assert points(counters, "-1", "7d") == {"10": 3}
+    assert points(counters, "-1", "day") == {}
+    clock.day += 1
+    assert points(counters, "-1", "7d") == {}
+    assert points(counters, "-1", "30d") == {"10": 3, "11": 4}
+    clock.day = WEDNESDAY + 20
+    assert points(counters, "-1", "30d") == {"10": 3}
+    clock.day = WEDNESDAY + 30
+    assert points(counters, "-1", "30d") == {}
+
+def test_week_starts_on_monday():
+    clock = FakeClock()
+    counters = WindowCounters(clock)
+    counters.add("-1", "10", day=WEDNESDAY - 2)  # Monday
+    counters.add("-1", "10", day=WEDNESDAY - 3)  # Sunday of the week before
+    counters.add("-1", "10")
+    assert points(counters, "-1", "week") == {"10": 2}
+    assert points(counters, "-1", "7d") == {"10": 3}
+    clock.day += 5  # Next Monday
+    counters.add("-1", "11")
+    assert points(counters, "-1", "week") == {"11": 1}
+    assert points(counters, "-1", "7d") == {"10": 1, "11": 1}
+
+def test_long_gap_and_saturated_buckets_keep_sums_exact():
+    clock = FakeClock()
+    counters = WindowCounters(clock)
+    counters.add("-1", "10", points=BUCKET_MAX - 1)
+    counters.add("-1", "10", points=10)
+    assert points(counters, "-1", "day") == {"10": BUCKET_MAX}
+    assert points(counters, "-1", "30d") == {"10": BUCKET_MAX}
+    clock.day += 1
+    counters.add("-1", "10", points=2)
+    assert points(counters, "-1", "30d") == {"10": BUCKET_MAX + 2}
+    clock.day += DAYS
+    assert points(counters, "-1", "30d") == {}
+    counters.add("-1", "10")
+    assert points(counters, "-1", "30d") == {"10": 1}
+
+def test_taking_points_back_stops_at_zero():
+    clock = FakeClock()
+    counters = WindowCounters(clock)
+    counters.add("-1", "10", points=3)
+    clock.day += 1
+    counters.add("-1", "10", points=2)
+    counters.add("-1", "10", points=-5)  # Only today's 2 can be taken back
+    assert points(counters, "-1", "day") == {}
+    assert points(counters, "-1", "30d") == {"10": 3}
+    assert not counters.add("-1", "11", points=-1)  # No row for a user without points
+    assert counters.user_count() == 1
+    clock.day += DAYS
+    assert points(counters, "-1", "30d") == {}
+
+def test_rank_and_prune():
+    clock = FakeClock()
+    counters = WindowCounters(clock)
+    for user, count in (("10", 5), ("11", 7), ("12", 5)):
+        counters.add("-1", user, points=count)
+    counters.add("-1", "13", day=WEDNESDAY - 8)
+    assert counters.rank("-1", "11", "7d") == (1, 3, 7)
+    assert counters.rank("-1", "10", "7d") == (2, 3, 5)
+    assert counters.rank("-1", "12", "7d") == (2, 3, 5)
+    assert counters.rank("-1", "13", "7d") is None
+    assert counters.rank("-1", "13", "30d") == (4, 4, 1)
+    assert counters.rank("-2", "10", "7d") is None
+
+    clock.day = WEDNESDAY + 22
+    assert counters.advance("-1") == 1
+    assert counters.user_count() == 3
+    counters.add("-1", "14")
+    assert counters.rank("-1", "11", "30d") == (1, 4, 7)
+    clock.day = WEDNESDAY + 40
+    assert counters.advance("-1") == 3
+    clock.day = WEDNESDAY + 60
+    assert counters.advance("-1") == 1
+    assert counters.advance("-1") == 0  # The chat was dropped with its last user
+    assert len(counters) == 0
+
+def test_windows_file_round_trip():
+    clock = FakeClock()
+    counters = WindowCounters(clock)
+    for user in range(500):
+        counters.add(str(-100 - user % 3), str(10 ** 9 + user), day=WEDNESDAY - user % 40, points=user)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'windows.snap')
+        assert write_windows(path, counters) == os.path.getsize(path)
+        loaded = read_windows(path)
+        loaded.clock = clock
+        for chat_id in counters.chats():
+            for window in ("day", "week", "7d", "30d"):
+                assert loaded.top(chat_id, window, 1000) == counters.top(chat_id, window, 1000)
+        loaded.add("-100", "42")
+        assert loaded.rank("-100", "42", "day") is not None
+
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\xff')
+        try:
+            read_windows(path)
+        except SnapshotError:
+            pass
+        else:
+            raise AssertionError("corruption not detected")
+
+def test_stats_and_rank_commands_take_a_period():
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    def command(user_id, *args):
+        message = SimpleNamespace(
+            chat=SimpleNamespace(id=-1), from_user=SimpleNamespace(id=user_id), reply_text=reply_text
+        )
+        return SimpleNamespace(message=message), SimpleNamespace(args=list(args))
+
+    with fresh_bot(window_counters=WindowCounters(FakeClock())):
+        bot.engagement_data.increment("-1", "10", "messages", "alice")
+        bot.engagement_data.increment("-1", "11", "messages", "bob")
+        bot.window_counters.add("-1", "10", points=2)
+        bot.window_counters.add("-1", "11", day=WEDNESDAY - 1, points=3)
+
+        asyncio.run(bot.show_stats(*command(10, "today")))
+        asyncio.run(bot.show_stats(*command(10, "WEEK")))
+        asyncio.run(bot.show_rank(*command(10, "7d")))
+        asyncio.run(bot.show_stats(*command(10, "year")))
+    assert "1. @alice - Points: 2" in replies[0] and "bob" not in replies[0]
+    assert replies[1].index("@bob - Points: 3") < replies[1].index("@alice - Points: 2")
+    assert "#2 of 2" in replies[2]
+    assert replies[3].startswith("Usage: /stats [")
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update):
+    """The chat an update belongs to; updates without one share a lane."""
+    chat = getattr(update, 'effective_chat', None)
+    return chat.id if chat is not None else None
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different chats in parallel, and each chat's in order.
+
+    Every chat with work has a lane: a FIFO of its pending updates drained by
+    one task, so a chat never has two updates in flight and its reactions
+    always see the messages before them. Up to `workers` lanes run an update
+    at the same time; a lane gives its slot back after every update, so a
+    busy chat can't keep the others waiting.
+
+    At most `max_pending` updates are queued or running. The Application is
+    told to hand over one update at a time, so when the lanes are full its
+    fetcher waits here, updates pile up in a bounded update_queue, and the
+    updater stops fetching from Telegram until there is room again.
+
+    Updates finish out of order across chats; oldest_unfinished() tells
+    which update_id everything before has been processed up to.
+
+    Call join() after Application.stop() to finish the queued updates while
+    the bot can still reply; shutdown() does the same as a last resort.
+    """
+
+    def __init__(self, workers, max_pending=1000, key=chat_key):
+        # One update at a time from the fetcher; concurrency happens in the lanes
+        super().__init__(1)
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be positive")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.key = key
+        self.pending = 0
+        self.processed = 0
+        self.waits = 0  # Hand-offs that had to wait for room
+        self._lanes = {}
+        # update_id of every update handed over and not processed yet; read from the persistence thread
+        self._unfinished = {}
+        self._unfinished_lock = threading.Lock()
+        self._tasks = set()
+        self._slots = None
+        self._room = None
+        self._idle = None
+
+    @property
+    def active_chats(self):
+        """Chats with queued or running updates."""
+        return len(self._lanes)
+
+    async def initialize(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._room = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def do_process_update(self, update, coroutine):
+        if self.pending >= self.max_pending:
+            self.waits += 1
+            async with self._room:
+                await self._room.wait_for(lambda: self.pending < self.max_pending)
+        self.pending += 1
+        self._idle.clear()
+        update_id = getattr(update, 'update_id', None)
+        if update_id is not None:
+            with self._unfinished_lock:
+                self._unfinished[update_id] = None
+        key = self.key(update)
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append((update_id, coroutine))
+            return
+        self._lanes[key] = deque([(update_id, coroutine)])
+        task = asyncio.create_task(self._drain(key), name=f"ChatUpdateProcessor:{key}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key):
+        lane = self._lanes[key]
+        while lane:
+            update_id, coroutine = lane[0]
+            try:
+                async with self._slots:
+                    await coroutine
+            except Exception as e:
+                # Application.process_update handles handler errors itself
+                logger.error(f"Error processing update of chat {key}: {e}", exc_info=True)
+            if update_id is not None:
+                with self._unfinished_lock:
+                    self._unfinished.pop(update_id, None)  # Gone already if delivered twice
+            lane.popleft()
+            self.pending -= 1
+            self.processed += 1
+            async with self._room:
+                self._room.notify()
+        del self._lanes[key]
+        if not self.pending:
+            self._idle.set()
+
+    def oldest_unfinished(self):
+        """Lowest update_id handed over but not processed yet, or None. Safe from any thread."""
+        with self._unfinished_lock:
+            return min(self._unfinished, default=None)
+
+    async def join(self):
+        """Wait until every handed over update has been processed."""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def shutdown(self):
+        await self.join()
+
+    def stats(self):
+        return {
+            "pending": self.pending, "active_chats": self.active_chats,
+            "processed": self.processed, "waits": self.waits,
+        }
@@ -0,0 +1,227 @@
+import heapq
+import operator
+from array import array
+from datetime import date
+
+from engagement_store import RowIndex
+
+# Days kept per user; the longest window is this long
+DAYS = 30
+# Today, the calendar week since Monday, and the last 7 and 30 days including today
+WINDOWS = ("day", "week", "7d", "30d")
+# Points per user and day are 16-bit and stop counting at this value
+BUCKET_MAX = 0xFFFF
+
+
+def today():
+    """Local day number, the same calendar the monthly reset uses."""
+    return date.today().toordinal()
+
+
+def _week_start(day):
+    return day - date.fromordinal(day).weekday()
+
+
+class WindowChat:
+    """One chat's recent points: a ring of daily buckets per user, plus running sums.
+
+    days[d % DAYS][row] holds the points a user earned on day d, for the
+    last DAYS days up to `day`. The sums of the week, 7-day and 30-day
+    windows are kept per row as points arrive and are reduced when a day
+    drops out, so no query has to add up buckets.
+    """
+
+    __slots__ = ("day", "user_ids", "index", "days", "sums")
+
+    def __init__(self, day):
+        self.day = day
+        self.user_ids = array('q')
+        self.index = RowIndex(self.user_ids)
+        self.days = [array('H') for _ in range(DAYS)]
+        self.sums = {window: array('I') for window in ("week", "7d", "30d")}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def row(self, user_id):
+        row = self.index.find(user_id)
+        if row < 0:
+            row = len(self.user_ids)
+            self.user_ids.append(user_id)
+            for column in self.days:
+                column.append(0)
+            for column in self.sums.values():
+                column.append(0)
+            self.index.add(user_id, row)
+        return row
+
+    def column(self, window):
+        """Points of every row in a window, as of self.day."""
+        if window == "day":
+            return self.days[self.day % DAYS]
+        return self.sums[window]
+
+    def advance(self, day):
+        """Move the window forward to `day`, dropping the days that fall out of it."""
+        if day <= self.day:
+            return
+        size = len(self.user_ids)
+        if day - self.day >= DAYS:
+            zeros = bytes(4 * size)
+            self.days = [array('H', zeros[:2 * size]) for _ in range(DAYS)]
+            self.sums = {window: array('I', zeros) for window in self.sums}
+            self.day = day
+            return
+        sums = self.sums
+        while self.day < day:
+            self.day += 1
+            current = self.day
+            # Buckets leaving the 30 and 7 day windows on the new day
+            expired = self.days[current % DAYS]
+            sums["30d"] = array('I', map(operator.sub, sums["30d"], expired))
+            sums["7d"] = array('I', map(operator.sub, sums["7d"], self.days[(current - 7) % DAYS]))
+            if current == _week_start(current):
+                sums["week"] = array('I', bytes(4 * size))
+            self.days[current % DAYS] = array('H', bytes(2 * size))
+
+    def add(self, user_id, day, points=1):
+        """Credit points earned on `day` (not older than the window) to a user.
+
+        Negative points take points back from that day, never below zero.
+        """
+        if day > self.day:
+            self.advance(day)
+        elif day <= self.day - DAYS:
+            return False
+        if points < 0:
+            row = self.index.find(user_id)
+            if row < 0:
+                return False
+        else:
+            row = self.row(user_id)
+        bucket = self.days[day % DAYS]
+        # Sums only get what the bucket can hold, so expiring it takes all of it back out;
+        # the bucket is part of every sum it counts in, so taking it back keeps them >= 0
+        points = max(-bucket[row], min(points, BUCKET_MAX - bucket[row]))
+        bucket[row] += points
+        sums = self.sums
+        sums["30d"][row] += points
+        if day > self.day - 7:
+            sums["7d"][row] += points
+        if day >= _week_start(self.day):
+            sums["week"][row] += points
+        return True
+
+    def prune(self):
+        """Drop users without points in the last DAYS days. Returns how many were dropped."""
+        keep = [row for row, points in enumerate(self.sums["30d"]) if points]
+        dropped = len(self.user_ids) - len(keep)
+        if dropped:
+            def pick(column):
+                return array(column.typecode, map(column.__getitem__, keep))
+            self.user_ids = pick(self.user_ids)
+            self.index = RowIndex(self.user_ids)
+            self.days = [pick(column) for column in self.days]
+            self.sums = {window: pick(column) for window, column in self.sums.items()}
+        return dropped
+
+    def copy(self):
+        copy = WindowChat(self.day)
+        copy.user_ids = self.user_ids[:]
+        copy.index = self.index.copy(copy.user_ids)
+        copy.days = [column[:] for column in self.days]
+        copy.sums = {window: column[:] for window, column in self.sums.items()}
+        return copy
+
+    def nbytes(self):
+        columns = [self.user_ids, *self.days, *self.sums.values()]
+        return sum(c.itemsize * len(c) for c in columns) + self.index.nbytes()
+
+
+class WindowCounters:
+    """Rolling leaderboards of every chat: today, this week, last 7 and 30 days.
+
+    Counting a point is O(1). Reading the top K or a rank goes over one
+    column of a chat's per-user sums, never over past events. Only users
+    with points in the last DAYS days have a row, each 2 bytes per day plus
+    three 4-byte sums, so memory is bounded by recent activity; prune()
+    runs from the daily job. Not thread-safe: callers hold data_lock.
+    """
+
+    def __init__(self, clock=today):
+        self.clock = clock
+        self._chats = {}
+
+    def __len__(self):
+        return len(self._chats)
+
+    def user_count(self):
+        return sum(len(chat) for chat in self._chats.values())
+
+    def nbytes(self):
+        return sum(chat.nbytes() for chat in self._chats.values())
+
+    def chats(self):
+        return list(self._chats)
+
+    def add(self, chat_id, user_id, day=None, points=1):
+        """Credit points to a user; `day` is when they were earned, today by default."""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = WindowChat(self.clock())
+        return chat.add(int(user_id), self.clock() if day is None else day, points)
+
+    def _current(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            chat.advance(self.clock())
+        return chat
+
+    def top(self, chat_id, window, limit):
+        """(user_id, points) of the `limit` best users in a window, best first."""
+        chat = self._current(chat_id)
+        if chat is None:
+            return []
+        best = heapq.nlargest(limit, zip(chat.column(window), chat.user_ids))
+        return [(str(user_id), points) for points, user_id in best if points]
+
+    def rank(self, chat_id, user_id, window):
+        """(position, users with points, points) of a user in a window, or None.
+
+        Users with the same points share a position.
+        """
+        chat = self._current(chat_id)
+        row = chat.index.find(int(user_id)) if chat is not None else -1
+        if row < 0:
+            return None
+        column = chat.column(window)
+        points = column[row]
+        if not points:
+            return None
+        ahead = sum(1 for other in column if other > points)
+        return ahead + 1, len(column) - column.count(0), points
+
+    def advance(self, chat_id):
+        """Bring a chat up to today and drop its users without recent points."""
+        chat = self._current(chat_id)
+        if chat is None:
+            return 0
+        dropped = chat.prune()
+        if not chat.user_ids:
+            del self._chats[chat_id]
+        return dropped
+
+    def copy(self):
+        copy = WindowCounters(self.clock)
+        copy._chats = {chat_id: chat.copy() for chat_id, chat in self._chats.items()}
+        return copy
+
+    def parts(self):
+        """WindowChat by chat id, for serializers."""
+        return self._chats
+
+    @classmethod
+    def from_parts(cls, chats, clock=today):
+        counters = cls(clock)
+        counters._chats = chats
+        return counters